@@ -0,0 +1,100 @@
+#!/bin/bash
+
+#Benchmarks the PICCL pipelines on synthetic corpora of several sizes (see scripts/syntheticcorpus.py) and compares the
+#wall-clock time, CPU time and peak memory (in total and per process) against a baseline (see scripts/benchmark.py)
+#
+#Usage: benchmark.sh [small|medium|large|all]
+#   BASELINE=file    baseline to compare against (default: benchmark_baseline.json)
+#   SAVEBASELINE=1   store the results as the new baseline rather than comparing
+#   BENCHLANG=lang   language of the data to use (default: eng)
+
+####################################################### INITIALISATION ##################################################
+
+if ! touch .test; then #test write permission
+   echo "No writing permission in current working directory"
+   exit 2
+fi
+rm .test
+
+PICCL="nextflow run LanguageMachines/PICCL"
+PICCLDIR=$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd) #absolute, the benchmarks run in their own directories
+if [ -f $PICCLDIR/ticcl.nf ]; then
+    PICCL=$PICCLDIR #run piccl scripts directly
+    echo "PICCL directory is $PICCLDIR"
+fi
+
+if [ ! -d data ]; then
+    echo -e "\n\n======= Downloading data =======">&2
+    $PICCL/download-data.nf || exit 2
+fi
+
+if [ ! -z "$1" ]; then
+    SCALE=$1
+else
+    SCALE="small"
+fi
+BASELINE=${BASELINE:-benchmark_baseline.json}
+BENCHLANG=${BENCHLANG:-eng}
+RESULTS=benchmark_results.json
+rm -f $RESULTS
+
+LEXICON=$(ls data/int/$BENCHLANG/*.dict | head -n 1)
+ALPHABET=$(ls data/int/$BENCHLANG/*.chars | head -n 1)
+CONFUSION=$(ls data/int/$BENCHLANG/*.confusion | head -n 1)
+if [ -z "$LEXICON" ] || [ -z "$ALPHABET" ] || [ -z "$CONFUSION" ]; then
+    echo "Data for language $BENCHLANG is incomplete">&2
+    exit 2
+fi
+
+#################################################### BENCHMARKS #######################################################
+
+# runbenchmark NAME PIPELINE OPTIONS...: runs a pipeline in a clean directory and records its performance
+runbenchmark () {
+    NAME=$1
+    shift
+    echo -e "\n\n======== Benchmark $NAME ======">&2
+    rm -Rf benchmark_work/$NAME
+    mkdir -p benchmark_work/$NAME
+    (cd benchmark_work/$NAME && "$@" -with-trace trace.txt) || exit 2
+    python3 $PICCLDIR/scripts/benchmark.py record -o $RESULTS -n $NAME benchmark_work/$NAME/trace.txt || exit 2
+    rm -Rf benchmark_work/$NAME/work
+}
+
+for scale in small medium large; do
+    if [[ "$SCALE" != "$scale" ]] && [[ "$SCALE" != "all" ]]; then
+        continue
+    fi
+    #documents, words per document and documents rendered as page images per scale
+    case $scale in
+        small) DOCUMENTS=10; WORDS=2000; PAGEDOCUMENTS=2;;
+        medium) DOCUMENTS=50; WORDS=10000; PAGEDOCUMENTS=5;;
+        large) DOCUMENTS=200; WORDS=20000; PAGEDOCUMENTS=10;;
+    esac
+    CORPUS=$(pwd)/benchmark_corpora/$BENCHLANG-$scale
+    if [ ! -d $CORPUS ]; then
+        echo -e "\n\n======== Generating $scale corpus ======">&2
+        python3 $PICCLDIR/scripts/syntheticcorpus.py -l $LEXICON -c $CONFUSION -n $DOCUMENTS -w $WORDS -f txt,folia -O $CORPUS || exit 2
+        if ! python3 $PICCLDIR/scripts/syntheticcorpus.py -l $LEXICON -c $CONFUSION -n $PAGEDOCUMENTS -w 1000 -f tif -O $CORPUS; then
+            echo "Unable to render page images, skipping the OCR benchmark">&2
+            rm -Rf $CORPUS/tif
+        fi
+    fi
+
+    TICCLOPTS="--lexicon $(pwd)/$LEXICON --alphabet $(pwd)/$ALPHABET --charconfus $(pwd)/$CONFUSION"
+    runbenchmark ticcl-text-$scale $PICCL/ticcl.nf --inputdir $CORPUS/txt --inputtype text $TICCLOPTS
+    runbenchmark ticcl-folia-$scale $PICCL/ticcl.nf --inputdir $CORPUS/folia --inputclass OCR $TICCLOPTS
+    if [ -d $CORPUS/tif ]; then
+        runbenchmark ocr-tif-$scale $PICCL/ocr.nf --inputdir $CORPUS/tif --inputtype tif --language $BENCHLANG
+    fi
+done
+
+###################################################### RESULTS ###########################################################
+
+if [ ! -z "$SAVEBASELINE" ]; then
+    cp $RESULTS $BASELINE
+    echo "Results stored as baseline in $BASELINE">&2
+elif [ -f $BASELINE ]; then
+    python3 $PICCLDIR/scripts/benchmark.py compare $RESULTS $BASELINE || exit 1
+else
+    echo "No baseline to compare against ($BASELINE), run with SAVEBASELINE=1 to store one">&2
+fi
@@ -9,21 +9,89 @@ log.info "--------------------------"
 log.info "Download data for PICCL"
 log.info "--------------------------"
 
-process download {
-    publishDir "data", mode: 'copy', overwrite: true
-
-    output:
-    file "**" into output
-
-    script:
-    """
-    wget http://ticclops.uvt.nl/TICCL.languagefiles.ALLavailable.20160421.tar.gz -O data.tar.gz
-    tar -xvzf data.tar.gz
-    mv data/* .
-    rm -Rf data
-    rm data.tar.gz
-
-    #Data for DBNL pipeline
-    wget http://lst.science.ru.nl/~proycon/dbnl_ozt_ids.txt
-    """
+params.datadir = "data"
+params.languages = ""
+params.threads = 4
+
+if (params.containsKey('help')) {
+    log.info "Usage:"
+    log.info "  download-data.nf [OPTIONS]"
+    log.info ""
+    log.info "Without a manifest, the full data archive (all languages) is downloaded and extracted."
+    log.info ""
+    log.info "Optional parameters:"
+    log.info "  --manifest FILE          Install the data from a manifest with checksums (see webservice/picclservice/piccldata.py),"
+    log.info "                           per language and in parallel, skipping files that are installed and verified already"
+    log.info "  --mirror DIRECTORY       Local mirror directory to install the files in the manifest from"
+    log.info "  --url URL                Base URL to install the files in the manifest from"
+    log.info "  --languages LANGUAGES    Languages to install from the manifest (comma separated, default: all)"
+    log.info "  --datadir DIRECTORY      Data directory to install into with --manifest (default: data)"
+    log.info "  --threads N              Files to fetch in parallel per language with --manifest (default: 4)"
+    exit 2
+}
+
+if (params.containsKey('manifest')) {
+    if (!params.containsKey('mirror') && !params.containsKey('url')) {
+        log.error "The --manifest parameter also requires --mirror or --url, see --help for usage details"
+        exit 2
+    }
+    source = params.containsKey('mirror') ? "--mirror " + new File(params.mirror).getAbsolutePath() : "--url " + params.url
+    datadir = new File(params.datadir).getAbsolutePath() //installed in place rather than published, so verified files are kept
+    manifest = new File(params.manifest).getAbsolutePath()
+
+    //one task per language, the common data is installed along with the first of them (the others wait for it)
+    if (params.languages) {
+        languages = Channel.from(params.languages.tokenize(','))
+    } else {
+        languages = Channel.from(new groovy.json.JsonSlurper().parse(new File(manifest)).files.collect { it.language ?: "common" }.unique())
+    }
+
+    process install {
+        input:
+        val language from languages
+        val datadir from datadir
+        val manifest from manifest
+        val source from source
+
+        output:
+        stdout into installed
+
+        script:
+        """
+        #!/bin/bash
+        python3 ${baseDir}/webservice/picclservice/piccldata.py install -l ${language} -j ${params.threads} ${source} "${manifest}" "${datadir}" >&2 || exit 1
+
+        #Compile the anagram hash indices of the lexicons that are new or changed, so they need not be hashed again for every corpus
+        for lexicon in "${datadir}"/int/${language}/*.dict; do
+            if [ -f "\$lexicon" ] && [ -f "\$lexicon.lc.chars" ] && [ ! "\$lexicon.anaidx" -nt "\$lexicon" ]; then
+                python3 ${baseDir}/scripts/lexiconindex.py compile --lexicon "\$lexicon" >&2 || exit 1
+            fi
+        done
+        echo ${language}
+        """
+    }
+
+    installed.subscribe { println "Installed and verified data for " + it.trim() }
+} else {
+    process download {
+        publishDir "data", mode: 'copy', overwrite: true
+
+        output:
+        file "**" into output
+
+        script:
+        """
+        wget http://ticclops.uvt.nl/TICCL.languagefiles.ALLavailable.20160421.tar.gz -O data.tar.gz || exit 1
+        tar -xvzf data.tar.gz || exit 1 #a failed (partial) extraction must fail the task, so nothing is published
+        mv data/* .
+        rm -Rf data
+        rm data.tar.gz
+
+        #Data for DBNL pipeline
+        wget http://lst.science.ru.nl/~proycon/dbnl_ozt_ids.txt || exit 1
+
+        #Compile the anagram hash indices of the lexicons, so the lexicons need not be hashed again for every corpus
+        python3 ${baseDir}/scripts/lexiconindex.py compile . || exit 1
+        """
+    }
 }
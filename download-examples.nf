@@ -17,8 +17,8 @@ process download {
 
     script:
     """
-    wget http://ticclops.uvt.nl/TICCL.SampleCorpora.20160504.ALL.tar.gz -O corpora.tar.gz
-    tar -xvzf corpora.tar.gz
+    wget http://ticclops.uvt.nl/TICCL.SampleCorpora.20160504.ALL.tar.gz -O corpora.tar.gz || exit 1
+    tar -xvzf corpora.tar.gz || exit 1 #a failed (partial) extraction must fail the task, so nothing is published
     mv corpora/* .
     rm -Rf corpora
     rm corpora.tar.gz
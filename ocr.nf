@@ -17,6 +17,11 @@ params.outputdir = "ocr_output"
 params.inputtype = "pdf"
 params.pdfhandling = "single"
 params.seqdelimiter = "_"
+params.ocrbatch = 1
+params.rasterpages = 10
+params.rasterformat = "tif"
+params.textlayerminwords = 10
+params.publishmode = "copy"
 
 //Output usage information if --help is specified
 if (params.containsKey('help')) {
@@ -44,6 +49,16 @@ if (params.containsKey('help')) {
     log.info "                           (The underscore delimiter may optionally be changed using --seqdelimiter)"
     log.info "  --seqdelimiter           Sequence delimiter in input files (defaults to: _)"
     log.info "  --seqstart               What input field is the sequence number (may be a negative number to count from the end), default: -2"
+    log.info "  --ocrbatch N             OCR N pages of a document per task, with a single Tesseract engine (default: 1, one page per task)"
+    log.info "  --rasterpages N          Rasterise PDF/DjVu documents in tasks of N pages each, so multiple cores can be used and OCR starts"
+    log.info "                           as soon as the first pages are done (default: " + params.rasterpages + ", 0 for whole documents)"
+    log.info "  --rasterformat FORMAT    Intermediate image format for PDF pages: tif (uncompressed) [default], tiflzw (LZW-compressed TIFF),"
+    log.info "                           png (compressed). The latter two are lossless and take far less disk space. DjVu pages are always TIFF."
+    log.info "  --pdftriage              Only OCR the pages of PDF documents that have no embedded text layer, the text of the other pages"
+    log.info "                           is extracted directly (for documents with a mix of scanned and born-digital pages)"
+    log.info "  --textlayerminwords N    Minimum number of words for a page's text layer to be used with --pdftriage (default: " + params.textlayerminwords + ")"
+    log.info "  --publishmode MODE       How output is published to the output directories: copy [default], link (hard links, the output"
+    log.info "                           directories must be on the same filesystem as the work directory), symlink or move"
     exit 2
 }
 
@@ -63,6 +78,36 @@ if (!params.containsKey('language')) {
 }
 
 
+//Split a document of the given number of pages into [firstpage, lastpage] ranges of (at most) --rasterpages pages
+def pageranges(pagecount) {
+    if (pagecount < 1) {
+        return [[1, 0]] //page count unknown, rasterise the whole document in one task (a last page of 0 means the last page to pdftoppm)
+    }
+    def rangesize = (params.rasterpages as int) > 0 ? (params.rasterpages as int) : pagecount
+    return (1..pagecount).step(rangesize).collect { firstpage -> [firstpage, Math.min(firstpage + rangesize - 1, pagecount)] }
+}
+
+//Pages of PDF documents that have an embedded text layer need no OCR (--pdftriage)
+pdftriage = params.containsKey('pdftriage') && ((params.inputtype == "pdf") || (params.inputtype == "pdfimages"))
+if (!pdftriage) {
+    textpages = Channel.empty()
+}
+
+//Options for pdftoppm for the intermediate image format
+if (params.rasterformat == "tif") {
+    rasteroptions = "-tiff"
+    rasterextension = "tif"
+} else if (params.rasterformat == "tiflzw") {
+    rasteroptions = "-tiff -tiffcompression lzw"
+    rasterextension = "tif"
+} else if (params.rasterformat == "png") {
+    rasteroptions = "-png"
+    rasterextension = "png"
+} else {
+    log.error "No such raster format: " + params.rasterformat
+    exit 2
+}
+
 if ((params.inputtype == "pdf") && (params.pdfhandling == "reassemble")) {
     // The reassemble option was selected, this means
     // that PDF input filenames should adhere to the
@@ -110,30 +155,58 @@ if (params.inputtype == "djvu") {
     //Set up an input channel for DJVU documents (globs recursively in the input directory)
     djvudocuments = Channel.fromPath(params.inputdir+"/**.djvu").view { "Input document (djvu): " + it }
 
-    process djvu {
+    process djvupages {
        /*
-           Extract TIF images from DJVU
+           Count the pages in a DJVU document
        */
 
        input:
        file djvudocument from djvudocuments
 
+       output:
+       set file(djvudocument), stdout into djvupagecounts
+
+       script:
+       """
+       #!/bin/bash
+       pagecount=\$(djvused -e n "${djvudocument}") || exit 1
+       #the page ranges depend on the page count, so a document of which it can not be determined is an error
+       if ! [[ "\$pagecount" =~ ^[0-9]+\$ ]] || [ "\$pagecount" -eq 0 ]; then
+           echo "ERROR: Unable to determine the number of pages of ${djvudocument}" >&2
+           exit 1
+       fi
+       echo -n \$pagecount
+       """
+    }
+
+    //Split each document into page ranges of (at most) --rasterpages pages, each of which is rasterised in a separate task
+    djvupagecounts
+        .flatMap { djvudocument, pagecount -> pageranges(pagecount.trim() as int).collect { [djvudocument, pagecount.trim() as int] + it } }
+        .set { djvuranges }
+
+    process djvu {
+       /*
+           Extract TIF images from DJVU (for a range of pages)
+       */
+
+       input:
+       set file(djvudocument), val(pagecount), val(firstpage), val(lastpage) from djvuranges
+
        output:
        set val("${djvudocument.baseName}"), file("${djvudocument.baseName}*.tif") into djvuimages
 
        script:
+       //page numbers are padded to the number of digits of the page count, like pdftoppm does for PDF pages
        """
        #!/bin/bash
-       ddjvu -format=tiff -eachpage "${djvudocument}" "${djvudocument.baseName}_%d.tif"
+       for page in \$(seq ${firstpage} ${lastpage}); do
+           ddjvu -format=tiff -page=\$page "${djvudocument}" "\$(printf "%s_%0${pagecount.toString().length()}d" "${djvudocument.baseName}" \$page).tif" || exit 1
+       done
        """
     }
 
-    //Convert (documentname, [imagefiles]) channel to a channel emitting (documentname, imagefile) tuples
-    djvuimages
-        .collect { documentname, imagefiles -> [[documentname],imagefiles].combinations() }
-        .flatten()
-        .collate(2)
-        .set { pageimages }
+    //Each rasterised range emits (documentname, [imagefiles]), its pages are passed on to OCR as soon as the range is done
+    djvuimages.set { pageimageranges }
 
 } else if ((params.inputtype == "pdf") || (params.inputtype == "pdfimages")) { //2nd condition is needed for backwards compatibility
 
@@ -143,40 +216,116 @@ if (params.inputtype == "djvu") {
         pdfdocuments = Channel.fromPath(params.inputdir+"/**.pdf").view { "Input document (pdf): " + it }
     }
 
-    process pdfimages {
+    process pdfpages {
         /*
-            Extract images from PDF using pdftoppm
+            Count the pages in a PDF document
         */
         input:
         file pdfdocument from pdfdocuments
 
         output:
-        set val("${pdfdocument.baseName}"), file("${pdfdocument.baseName}*.tif") into pdfimages
+        set file(pdfdocument), stdout into pdfpagecounts
 
         script:
         """
         #!/bin/bash
-        pdftoppm -tiff "${pdfdocument}" "${pdfdocument.baseName}"
+        pdfinfo "${pdfdocument}" | grep "^Pages:" | awk '{ print \$2 }'
+        """
+    }
+
+    //Split each document into page ranges of (at most) --rasterpages pages, each of which is rasterised in a separate task
+    pdfpagecounts
+        .flatMap { pdfdocument, pagecount ->
+            def pages = pagecount.trim().isInteger() ? pagecount.trim() as int : 0
+            pageranges(pages).collect { [pdfdocument, pages] + it }
+        }
+        .set { pdfranges }
+
+    if (pdftriage) {
+        process pdftextlayer {
+            /*
+                Determine which pages (in a range) have an embedded text layer: the text of those is extracted, only the
+                remaining pages are passed on for OCR (as a list of page numbers)
+            */
+            input:
+            set file(pdfdocument), val(pagecount), val(firstpage), val(lastpage) from pdfranges
+            val minwords from params.textlayerminwords
+
+            output:
+            set val("${pdfdocument.baseName}"), file("${pdfdocument.baseName}-*.txt") optional true into pdftextpages
+            set file(pdfdocument), stdout into pdfimagepages
+
+            script:
+            if (lastpage == 0)
+                //the page count is unknown (see pageranges), so the pages can not be triaged: the whole document is rasterised for
+                //OCR, as without --pdftriage ("1-0" is the whole document to pdftoppm)
+                """
+                #!/bin/bash
+                echo "WARNING: Unable to determine the number of pages of ${pdfdocument}, OCRing all of its pages" >&2
+                echo -n "1-0"
+                """
+            else
+                //page numbers are padded to the number of digits of the page count, like pdftoppm does, so text and image pages sort alike
+                """
+                #!/bin/bash
+                for page in \$(seq ${firstpage} ${lastpage}); do
+                    pagename=\$(printf "%s-%0${pagecount.toString().length()}d" "${pdfdocument.baseName}" \$page)
+                    pdftotext -f \$page -l \$page -enc UTF-8 -eol unix -nopgbrk "${pdfdocument}" "\$pagename.txt" || exit 1
+                    #only count words with letters, text layers without a proper character mapping yield mostly garbage
+                    if [ \$(grep -o "[[:alpha:]][[:alpha:]]*" "\$pagename.txt" | wc -l) -lt ${minwords} ]; then
+                        rm "\$pagename.txt"
+                        echo -n "\$page "
+                    fi
+                done
+                """
+        }
+
+        //the text of these pages goes straight to the FoLiA assembly (foliaassemble), along with the OCRed pages
+        pdftextpages
+            .flatMap { documentname, textfiles -> (textfiles instanceof List ? textfiles : [textfiles]).collect { [documentname, it] } }
+            .set { textpages }
+
+        //pages without a text layer are rasterised for OCR
+        pdfimagepages
+            .filter { pdfdocument, pages -> pages.trim() }
+            .map { pdfdocument, pages -> [pdfdocument, pages.trim()] }
+            .set { pdfrasterpages }
+    } else {
+        pdfranges
+            .map { pdfdocument, pagecount, firstpage, lastpage -> [pdfdocument, "${firstpage}-${lastpage}"] }
+            .set { pdfrasterpages }
+    }
+
+    process pdfimages {
+        /*
+            Extract images from PDF using pdftoppm (for page ranges, e.g. 1-10, or single pages)
+        */
+        input:
+        set file(pdfdocument), val(pages) from pdfrasterpages
+        val rasteroptions from rasteroptions
+        val rasterextension from rasterextension
+
+        output:
+        set val("${pdfdocument.baseName}"), file("${pdfdocument.baseName}*.${rasterextension}") into pdfimages
 
+        script:
+        """
+        #!/bin/bash
+        for pagerange in ${pages}; do
+            pdftoppm -f \${pagerange%-*} -l \${pagerange#*-} ${rasteroptions} "${pdfdocument}" "${pdfdocument.baseName}" || exit 1
+        done
         """
-	// Probably better to have sth. like the following?
-        //if r != 0:
-            //print("pdfimages failed...", file=sys.stderr)
-            //sys.exit(r)
     }
 
 
-    //Convert (documentname, [imagefiles]) channel to a channel emitting (documentname, imagefile) tuples
-    pdfimages
-        .collect { documentname, imagefiles -> [[documentname],imagefiles].combinations() }
-        .flatten()
-        .collate(2)
-        .set { pageimages }
+    //Each rasterised range emits (documentname, [imagefiles]), its pages are passed on to OCR as soon as the range is done
+    pdfimages.set { pageimageranges }
 
 } else if ((params.inputtype == "jpg") || (params.inputtype == "jpeg") || (params.inputtype == "tif") || (params.inputtype == "tiff") || (params.inputtype == "png") || (params.inputtype == "gif")) {
 
     //The input is a set of images: $documentname_$sequencenr.$extension  (where $sequencenr can be alphabetically sorted ), Tesseract supports a variety of formats
-    //we group and transform the data into a pageimages channel which will emit (documentname, pagefile) tuples
+    //we group and transform the data into a pageimageranges channel which will emit (documentname, [pagefiles]) tuples (all
+    //files are known as soon as the input directory has been globbed, so each document forms a single range)
 
    Channel
         .fromPath(params.inputdir+"/**." + params.inputtype)
@@ -184,7 +333,8 @@ if (params.inputtype == "djvu") {
             def documentname = pagefile.baseName.find(params.seqdelimiter) != null ? pagefile.baseName.tokenize(params.seqdelimiter)[0..-2].join(params.seqdelimiter) : pagefile.baseName
             [ documentname, pagefile ]
         }
-        .set { pageimages }
+        .groupTuple()
+        .set { pageimageranges }
 
 
 } else {
@@ -195,93 +345,84 @@ if (params.inputtype == "djvu") {
 }
 
 
-process tesseract {
-    /*
-        Do the actual OCR using Tesseract: outputs a hOCR document for each input page image
-    */
+if (params.ocrbatch > 1) {
+    //OCR several pages of the same document in a single task, through a single Tesseract engine (avoids loading the model for every page)
+    //Batches are formed within each rasterised range, so they do not wait for the rest of the document (nor for other
+    //documents); a batch thus holds at most --rasterpages pages
+    pageimageranges
+        .flatMap { documentname, pagefiles -> (pagefiles instanceof List ? pagefiles : [pagefiles]).sort { it.name }.collate(params.ocrbatch as int).collect { [documentname, it] } }
+        .set { pageimagebatches }
 
-    input:
-    set val(documentname), file(pageimage) from pageimages
-    val language from params.language
+    process tesseractbatch {
+        /*
+            Do the actual OCR using Tesseract on a batch of page images: outputs a hOCR document for each input page image
+        */
 
-    output:
-    set val(documentname), file("${pageimage.baseName}" + ".hocr") into ocrpages
+        input:
+        set val(documentname), file(pageimage) from pageimagebatches
+        val language from params.language
 
-    script:
-    """
-    tesseract "${pageimage}" "${pageimage.baseName}" -c "tessedit_create_hocr=T" -l "${language}"
-    """
-}
+        output:
+        set val(documentname), file("*.hocr") into ocrpagebatches
 
-process ocrpages_to_foliapages {
-    /*
-        Convert Tesseract hOCR output to FoLiA
-    */
+        script:
+        """
+        python3 ${baseDir}/scripts/tesseractbatch.py -l "${language}" ${pageimage}
+        """
+    }
 
-    errorStrategy 'ignore' //not the most elegant solution and a bit dangerous! But sometimes 'empty' hocr files get fed that won't produce a folia file
+    //split the batches into individual pages again
+    ocrpagebatches
+        .flatMap { documentname, pagehocrs -> (pagehocrs instanceof List ? pagehocrs : [pagehocrs]).collect { [documentname, it] } }
+        .set { ocrpages }
+} else {
+    //Convert (documentname, [imagefiles]) channel to a channel emitting (documentname, imagefile) tuples
+    pageimageranges
+        .flatMap { documentname, imagefiles -> (imagefiles instanceof List ? imagefiles : [imagefiles]).collect { [documentname, it] } }
+        .set { pageimages }
 
-    input:
-    set val(documentname), file(pagehocr) from ocrpages
-    val virtualenv from params.virtualenv
+    process tesseract {
+        /*
+            Do the actual OCR using Tesseract: outputs a hOCR document for each input page image
+        */
 
-    //when:
-    //pagehocr.text =~ /ocrx_word/
+        input:
+        set val(documentname), file(pageimage) from pageimages
+        val language from params.language
 
-    output:
-    set val(documentname), file("FH-${pagehocr.baseName}" + "*.folia.xml") into foliapages //TODO: verify this also works if input is not TIF or PDF?
+        output:
+        set val(documentname), file("${pageimage.baseName}" + ".hocr") into ocrpages
 
-    script:
-    """
-    #set up the virtualenv (bit unelegant currently, but we have to do this for each process to ensure the LaMachine environment works)
-    set +u
-    if [ ! -z "${virtualenv}" ]; then
-        source ${virtualenv}/bin/activate
-    fi
-    set -u
-
-    FoLiA-hocr --prefix "FH-" -O ./ -t 1 "${pagehocr}"
-    """
+        script:
+        """
+        tesseract "${pageimage}" "${pageimage.baseName}" -c "tessedit_create_hocr=T" -l "${language}"
+        """
+    }
 }
 
 //Collect all pages for a given document
 //transforms [(documentname, hocrpage)] output to [(documentname, [hocrpages])], grouping pages per base name
-foliapages
-    .groupTuple(sort: {
-        //sort by file name (not full path)
-        file(it).getName()
-    })
-    .set { groupfoliapages }
-
-process foliacat {
+ocrpages
+    .mix(textpages) //pages with an embedded text layer (--pdftriage)
+    .groupTuple()
+    .set { groupocrpages }
+
+process foliaassemble {
     /*
-        Concatenate separate FoLiA pages pertaining to the same document into a single document again
+        Convert the Tesseract hOCR output (and text) of all pages of a document into a single FoLiA document, page by page
     */
 
-    publishDir params.outputdir, mode: 'copy', overwrite: true  //publish the output for the end-user to see (this is the final output)
+    publishDir params.outputdir, mode: params.publishmode, overwrite: true  //publish the output for the end-user to see (this is the final output)
 
     input:
-    set val(documentname), file("*.tif.folia.xml") from groupfoliapages
-    val virtualenv from params.virtualenv
+    set val(documentname), file(pages) from groupocrpages
 
     output:
-    file "${documentname}.ocr.folia.xml" into foliaoutput
+    file "${documentname}.ocr.folia.xml" optional true into foliaoutput //no output for documents without any text
 
     script:
     """
-    #!/bin/bash
-    set +u
-    if [ ! -z "${virtualenv}" ]; then
-        source ${virtualenv}/bin/activate
-    fi
-    set -u
-
-    if [ -f .tif.folia.xml ]; then
-        #only one file, nothing to cat
-        cp .tif.folia.xml "${documentname}.ocr.folia.xml"
-    else
-        foliainput=\$(ls -1v *.tif.folia.xml | tr '\\n' ' ')
-        foliacat -i "${documentname}" -o "${documentname}.ocr.folia.xml" \$foliainput
-    fi
+    python3 ${baseDir}/scripts/foliaassemble.py -i "${documentname}" -o "${documentname}.ocr.folia.xml" ${pages}
     """
 }
 
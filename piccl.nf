@@ -0,0 +1,1593 @@
+#!/usr/bin/env nextflow
+
+/*
+vim: syntax=groovy
+-*- mode: groovy;-*-
+*/
+
+log.info "--------------------------"
+log.info "PICCL Pipeline"
+log.info "--------------------------"
+
+//This workflow combines the OCR pipeline (ocr.nf), the TICCL pipeline (ticcl.nf) and linguistic enrichment with ucto
+//or Frog in a single run, with the stages connected by channels rather than directories. Every document is counted
+//for the corpus frequency list as soon as it is available, rather than waiting for the entire corpus to pass each
+//stage. Only the correction stage (FoLiA-correct) waits for both the full documents and the ranked list. The processes mirror those in ocr.nf and ticcl.nf (and the
+//tokenisation and Frog workflows of aNtiLoPe), keep them in sync!
+
+def env = System.getenv()
+
+//Set default parameter values
+params.virtualenv =  env.containsKey('VIRTUAL_ENV') ? env['VIRTUAL_ENV'] : "" //automatically detects whether we are running in a Virtual Environment (one of the LaMachine flavours)
+params.ocroutputdir = "ocr_output"
+params.outputdir = "ticcl_output"
+params.uctooutputdir = "ucto_output"
+params.frogoutputdir = "frog_output"
+params.inputtype = "pdf"
+params.extension = "folia.xml"
+params.pdfhandling = "single"
+params.seqdelimiter = "_"
+params.ocrbatch = 1
+params.rasterpages = 10
+params.rasterformat = "tif"
+params.textlayerminwords = 10
+params.inputclass = "current"
+params.outputclass = "current"
+params.lexicon = ""
+params.artifrq = 10000000
+params.alphabet = ""
+params.distance = 2
+params.clip = 1
+params.low = 5
+params.high = 35
+params.chainclean = 0
+params.correctbatch = 0
+params.chunksize = 0
+params.ngram = 1
+params.shards = 1
+params.publishmode = "copy"
+params.ucto = false
+params.frog = false
+params.frogskip = ""
+
+//Output usage information if --help is specified
+if (params.containsKey('help')) {
+    log.info "Usage:"
+    log.info "  piccl.nf [OPTIONS]"
+    log.info ""
+    log.info "Mandatory parameters:"
+    log.info "  --inputdir DIRECTORY     Input directory"
+    log.info "  --language LANGUAGE      Language (iso-639-3)"
+    log.info "  --lexicon FILE           Path to lexicon file (*.dict), unless --noticcl is set"
+    log.info "  --alphabet FILE          Path to alphabet file (*.chars), unless --noticcl is set"
+    log.info "  --charconfus FILE        Path to character confusion list (*.confusion), unless --noticcl is set"
+    log.info ""
+    log.info "Optional parameters:"
+    log.info "  --inputtype STR          Specify input type, the following are supported:"
+    log.info "          pdf (extension *.pdf)  - Scanned PDF documents (image content, perform OCR) [default]"
+    log.info "          tif (\$document_\$sequencenumber.tif)  - Images per page (adhere to the naming convention!)"
+    log.info "          jpg (\$document_\$sequencenumber.jpg)  - Images per page"
+    log.info "          png (\$document_\$sequencenumber.png)  - Images per page"
+    log.info "          gif (\$document_\$sequencenumber.gif)  - Images per page"
+    log.info "          djvu (extension *.djvu)"
+    log.info "          (The underscore delimiter may optionally be changed using --seqdelimiter)"
+    log.info "          pdftext (extension *.pdf)  - PDF documents with a text layer (no OCR)"
+    log.info "          text (extension *.txt)  - Plain text documents (no OCR)"
+    log.info "          folia (extension --extension)  - FoLiA documents (no OCR)"
+    log.info "  --chunksize MB           Split text (and PDF text) documents larger than this many megabytes into chunks at paragraph or page"
+    log.info "                           boundaries, which are processed in parallel and reassembled at the end (default: 0, no splitting)"
+    log.info "  --ocroutputdir DIRECTORY Output directory for OCR output (FoLiA documents) [default: " + params.ocroutputdir + "]"
+    log.info "  --outputdir DIRECTORY    Output directory for TICCL output (FoLiA documents) [default: " + params.outputdir + "]"
+    log.info "  --uctooutputdir DIRECTORY Output directory for tokeniser output (FoLiA documents) [default: " + params.uctooutputdir + "]"
+    log.info "  --frogoutputdir DIRECTORY Output directory for Frog output (FoLiA documents) [default: " + params.frogoutputdir + "]"
+    log.info "  --virtualenv PATH        Path to Python Virtual Environment to load (usually path to LaMachine)"
+    log.info "  --extension STR          Extension of FoLiA documents in input directory (default: folia.xml, must always end in xml)!"
+    log.info "  --pdfhandling reassemble Reassemble/merge all PDFs with the same base name and a number suffix; this can"
+    log.info "                           for instance reassemble a book that has its chapters in different PDFs."
+    log.info "                           Input PDFs must adhere to a \$document_\$sequencenumber.pdf convention."
+    log.info "                           (The underscore delimiter may optionally be changed using --seqdelimiter)"
+    log.info "  --seqdelimiter           Sequence delimiter in input files (defaults to: _)"
+    log.info "  --ocrbatch N             OCR N pages of a document per task, with a single Tesseract engine (default: 1, one page per task)"
+    log.info "  --rasterpages N          Rasterise PDF/DjVu documents in tasks of N pages each, so multiple cores can be used and OCR starts"
+    log.info "                           as soon as the first pages are done (default: " + params.rasterpages + ", 0 for whole documents)"
+    log.info "  --rasterformat FORMAT    Intermediate image format for PDF pages: tif (uncompressed) [default], tiflzw (LZW-compressed TIFF),"
+    log.info "                           png (compressed). The latter two are lossless and take far less disk space. DjVu pages are always TIFF."
+    log.info "  --pdftriage              Only OCR the pages of PDF documents that have no embedded text layer, the text of the other pages"
+    log.info "                           is extracted directly (for documents with a mix of scanned and born-digital pages)"
+    log.info "  --textlayerminwords N    Minimum number of words for a page's text layer to be used with --pdftriage (default: " + params.textlayerminwords + ")"
+    log.info "  --inputclass CLASS       FoLiA text class to use for FoLiA input, defaults to 'current'"
+    log.info "  --outputclass CLASS      FoLiA text class to use for TICCL output, defaults to 'current'"
+    log.info "  --noticcl                skip TICCL altogether"
+    log.info "  --lexiconindex FILE      Pre-computed anagram hash index of the lexicon (default: lexicon + .anaidx, if it exists; see scripts/lexiconindex.py)"
+    log.info "  --artifrq INT            Default value for missing frequencies in the validated lexicon (default: 10000000)"
+    log.info "  --distance INT           Levenshtein/edit distance (default: 2)"
+    log.info "  --clip INT               Limit the number of variants per word (default: 10)"
+    log.info "  --incremental            Compute the corpus frequency list incrementally: frequency lists are stored per document and only computed for new or changed documents"
+    log.info "  --freqlistcache DIR      Directory where per-document frequency lists are stored in incremental mode (default: .wordfreqlists in the input directory)"
+    log.info "  --rankedlist FILE        Ranked variant list from an earlier run on the same corpus (skips all TICCL steps up to FoLiA-correct, requires --unk and --punct)"
+    log.info "  --unk FILE               Unknown word list (*.unk) belonging to --rankedlist"
+    log.info "  --punct FILE             Punctuation map (*.punct) belonging to --rankedlist"
+    log.info "  --low INT                skip entries from the anagram file shorter than 'low' characters. (default=5)"
+    log.info "  --high INT               skip entries from the anagram file longer than 'high' characters. (default=35)"
+    log.info "  --shards INT             split indexing and resolving into this many tasks, which may run on different nodes (default=1)"
+    log.info "  --chainclean BOOLINT     enable chain clean or not (1 = on, 0 = off, default)"
+    log.info "  --correctbatch INT       correct the documents in batches of this many documents per FoLiA-correct task, which may run on"
+    log.info "                           different nodes and pass on their output as soon as they are done (default=0, all documents in one task)"
+    log.info "  --publishmode MODE       How output is published to the output directories: copy [default], link (hard links, the output"
+    log.info "                           directories must be on the same filesystem as the work directory), symlink or move"
+    log.info "  --nointermediate         Do not publish intermediate TICCL output (anagram hashes, indices, confusion lists, uncorrected"
+    log.info "                           documents), only the final documents and the lists needed to reuse a run (see --rankedlist)"
+    log.info "  --nofoliacorrect         skip the FoLiA correct step"
+    log.info "  --nostringlinking        skip the final string linking step"
+    log.info "  --ucto                   tokenise the documents using ucto"
+    log.info "  --frog                   linguistically enrich the documents using Frog (Dutch only, implies tokenisation)"
+    log.info "  --frogskip STR           Frog modules to skip (passed to frog --skip)"
+    exit 2
+}
+
+//Check mandatory parameters and produce sensible error messages
+if (!params.containsKey('inputdir')) {
+    log.info "Error: Missing --inputdir parameter, see --help for usage details"
+} else {
+    def dircheck = new File(params.inputdir)
+    if (!dircheck.exists()) {
+        log.info "Error: Specified input directory does not exist"
+        exit 2
+    }
+}
+if (!params.containsKey('language')) {
+    log.info "Error: Missing --language parameter, see --help for usage details"
+    exit 2
+}
+if (!params.containsKey('noticcl')) {
+    if (!params.containsKey('lexicon')) {
+        log.info "Error: Missing --lexicon parameter, see --help for usage details"
+        exit 2
+    }
+    if (!params.containsKey('alphabet')) {
+        log.info "Error: Missing --alphabet parameter, see --help for usage details"
+        exit 2
+    }
+    if (!params.containsKey('charconfus')) {
+        log.info "Error: Missing --charconfus parameter, see --help for usage details"
+        exit 2
+    }
+    if (params.containsKey('rankedlist') && (!params.containsKey('unk') || !params.containsKey('punct'))) {
+        log.info "Error: The --rankedlist parameter also requires --unk and --punct, see --help for usage details"
+        exit 2
+    }
+}
+
+//Use the pre-computed anagram hash index of the lexicon (see scripts/lexiconindex.py) if there is one
+if (params.containsKey('lexiconindex')) {
+    lexiconindex = new File(params.lexiconindex).getAbsolutePath()
+} else if (params.lexicon && new File(params.lexicon + ".anaidx").exists()) {
+    lexiconindex = new File(params.lexicon + ".anaidx").getAbsolutePath()
+} else {
+    lexiconindex = ""
+}
+
+//Split a document of the given number of pages into [firstpage, lastpage] ranges of (at most) --rasterpages pages
+def pageranges(pagecount) {
+    if (pagecount < 1) {
+        return [[1, 0]] //page count unknown, rasterise the whole document in one task (a last page of 0 means the last page to pdftoppm)
+    }
+    def rangesize = (params.rasterpages as int) > 0 ? (params.rasterpages as int) : pagecount
+    return (1..pagecount).step(rangesize).collect { firstpage -> [firstpage, Math.min(firstpage + rangesize - 1, pagecount)] }
+}
+
+def filehash(path, salt) {
+    //Computes a SHA-256 hash of the contents of a file (plus some salt), reading it in blocks rather than all at once
+    def digest = java.security.MessageDigest.getInstance("SHA-256")
+    path.withInputStream { stream ->
+        byte[] buffer = new byte[1048576]
+        int n
+        while ((n = stream.read(buffer)) > 0) {
+            digest.update(buffer, 0, n)
+        }
+    }
+    digest.update(salt.getBytes("UTF-8"))
+    return digest.digest().encodeHex().toString()
+}
+
+def ischunk(filename) {
+    //Is this file (derived from) a chunk of a large text document, as split by scripts/chunktext.py?
+    return (new File(filename.toString()).getName() =~ /_chunk[0-9]{5}\./).find()
+}
+
+def chunkdocument(filename) {
+    //Returns the name of the document a chunk belongs to
+    return new File(filename.toString()).getName().replaceAll(/_chunk[0-9]{5}\..*/, "")
+}
+
+//Pages of PDF documents that have an embedded text layer need no OCR (--pdftriage)
+pdftriage = params.containsKey('pdftriage') && ((params.inputtype == "pdf") || (params.inputtype == "pdfimages"))
+if (!pdftriage) {
+    textpages = Channel.empty()
+}
+
+//Options for pdftoppm for the intermediate image format
+if (params.rasterformat == "tif") {
+    rasteroptions = "-tiff"
+    rasterextension = "tif"
+} else if (params.rasterformat == "tiflzw") {
+    rasteroptions = "-tiff -tiffcompression lzw"
+    rasterextension = "tif"
+} else if (params.rasterformat == "png") {
+    rasteroptions = "-png"
+    rasterextension = "png"
+} else {
+    log.error "No such raster format: " + params.rasterformat
+    exit 2
+}
+
+ocrinputtypes = ["pdf", "djvu", "jpg", "jpeg", "tif", "tiff", "png", "gif"]
+
+/////////////////////////////////////////////// INPUT & OCR ///////////////////////////////////////////////
+
+//Each input branch below yields a channel of full FoLiA documents (folia_documents), and a channel of units to count for
+//the corpus frequency list: FoLiA documents (folia_units), or in case of OCR groups of OCRed pages (ocrpageunits) which
+//are counted as soon as they are OCRed, independently of the assembly of the documents
+
+if (params.inputtype in ocrinputtypes) {
+
+    if ((params.inputtype == "pdf") && (params.pdfhandling == "reassemble")) {
+        // The reassemble option was selected, this means
+        // that PDF input filenames should adhere to the
+        // $documentname-$sequencenumber.pdf convention
+        // which we turn into one $documentname.pdf
+
+        //Group $documentname-$sequencenumber.pdf in a channel emitting a tuple consisting of a documentname and a list of (unordered) sequence pdf files
+        // e.g. the channel emits items such as (documentname, ["documentname-1.pdf", "documentname-2.pdf"] )
+        Channel.fromPath(params.inputdir+"/**.pdf")
+                    .map { partfile -> partfile.baseName.find(params.seqdelimiter) != null ? tuple(partfile.baseName.tokenize(params.seqdelimiter)[0..-2].join(params.seqdelimiter), partfile) : tuple(partfile.baseName, partfile) }
+                    .groupTuple()
+                    .set { pdfparts }
+
+        process reassemble_pdf {
+            /*
+                Reassemble a PDF 'book' (or whatever) from its parts (e.g, chapters, pages), using pdfunite
+            */
+
+            input:
+            set val(documentname), file(pdffiles) from pdfparts //consume a documentname and list of pdffiles pertaining to that document
+
+            output:
+            file "${documentname}.pdf" into pdfdocuments
+
+            script:
+            """
+            #!/bin/bash
+            count=\$(ls *.pdf | wc -l)
+            if [ \$count -eq 1 ]; then
+                cp \$(ls *.pdf) "${documentname}.pdf"
+            elif [ \$count -eq 0 ]; then
+                echo "No input PDFs to merge!">&2
+                exit 5
+            else
+                pdfinput=\$(ls -1v *.pdf | tr '\\n' ' ') #performs a *natural* sort and quotes
+                pdfunite \$pdfinput "${documentname}.pdf"
+            fi
+            """
+
+        }
+    }
+
+
+    if (params.inputtype == "djvu") {
+        //Set up an input channel for DJVU documents (globs recursively in the input directory)
+        djvudocuments = Channel.fromPath(params.inputdir+"/**.djvu").view { "Input document (djvu): " + it }
+
+        process djvupages {
+           /*
+               Count the pages in a DJVU document
+           */
+
+           input:
+           file djvudocument from djvudocuments
+
+           output:
+           set file(djvudocument), stdout into djvupagecounts
+
+           script:
+           """
+           #!/bin/bash
+           pagecount=\$(djvused -e n "${djvudocument}") || exit 1
+           #the page ranges depend on the page count, so a document of which it can not be determined is an error
+           if ! [[ "\$pagecount" =~ ^[0-9]+\$ ]] || [ "\$pagecount" -eq 0 ]; then
+               echo "ERROR: Unable to determine the number of pages of ${djvudocument}" >&2
+               exit 1
+           fi
+           echo -n \$pagecount
+           """
+        }
+
+        //Split each document into page ranges of (at most) --rasterpages pages, each of which is rasterised in a separate task
+        djvupagecounts
+            .flatMap { djvudocument, pagecount -> pageranges(pagecount.trim() as int).collect { [djvudocument, pagecount.trim() as int] + it } }
+            .set { djvuranges }
+
+        process djvu {
+           /*
+               Extract TIF images from DJVU (for a range of pages)
+           */
+
+           input:
+           set file(djvudocument), val(pagecount), val(firstpage), val(lastpage) from djvuranges
+
+           output:
+           set val("${djvudocument.baseName}"), file("${djvudocument.baseName}*.tif") into djvuimages
+
+           script:
+           //page numbers are padded to the number of digits of the page count, like pdftoppm does for PDF pages
+           """
+           #!/bin/bash
+           for page in \$(seq ${firstpage} ${lastpage}); do
+               ddjvu -format=tiff -page=\$page "${djvudocument}" "\$(printf "%s_%0${pagecount.toString().length()}d" "${djvudocument.baseName}" \$page).tif" || exit 1
+           done
+           """
+        }
+
+        //Each rasterised range emits (documentname, [imagefiles]), its pages are passed on to OCR as soon as the range is done
+        djvuimages.set { pageimageranges }
+
+    } else if ((params.inputtype == "pdf") || (params.inputtype == "pdfimages")) { //2nd condition is needed for backwards compatibility
+
+        if (params.pdfhandling == "single") {
+            //pdfhandling simple means we don't need to reassemble (as done by the prior process), so
+            //we can just set up the input channel with the PDFs
+            pdfdocuments = Channel.fromPath(params.inputdir+"/**.pdf").view { "Input document (pdf): " + it }
+        }
+
+        process pdfpages {
+            /*
+                Count the pages in a PDF document
+            */
+            input:
+            file pdfdocument from pdfdocuments
+
+            output:
+            set file(pdfdocument), stdout into pdfpagecounts
+
+            script:
+            """
+            #!/bin/bash
+            pdfinfo "${pdfdocument}" | grep "^Pages:" | awk '{ print \$2 }'
+            """
+        }
+
+        //Split each document into page ranges of (at most) --rasterpages pages, each of which is rasterised in a separate task
+        pdfpagecounts
+            .flatMap { pdfdocument, pagecount ->
+                def pages = pagecount.trim().isInteger() ? pagecount.trim() as int : 0
+                pageranges(pages).collect { [pdfdocument, pages] + it }
+            }
+            .set { pdfranges }
+
+        if (pdftriage) {
+            process pdftextlayer {
+                /*
+                    Determine which pages (in a range) have an embedded text layer: the text of those is extracted, only the
+                    remaining pages are passed on for OCR (as a list of page numbers)
+                */
+                input:
+                set file(pdfdocument), val(pagecount), val(firstpage), val(lastpage) from pdfranges
+                val minwords from params.textlayerminwords
+
+                output:
+                set val("${pdfdocument.baseName}"), file("${pdfdocument.baseName}-*.txt") optional true into pdftextpages
+                set file(pdfdocument), stdout into pdfimagepages
+
+                script:
+                if (lastpage == 0)
+                    //the page count is unknown (see pageranges), so the pages can not be triaged: the whole document is rasterised for
+                    //OCR, as without --pdftriage ("1-0" is the whole document to pdftoppm)
+                    """
+                    #!/bin/bash
+                    echo "WARNING: Unable to determine the number of pages of ${pdfdocument}, OCRing all of its pages" >&2
+                    echo -n "1-0"
+                    """
+                else
+                    //page numbers are padded to the number of digits of the page count, like pdftoppm does, so text and image pages sort alike
+                    """
+                    #!/bin/bash
+                    for page in \$(seq ${firstpage} ${lastpage}); do
+                        pagename=\$(printf "%s-%0${pagecount.toString().length()}d" "${pdfdocument.baseName}" \$page)
+                        pdftotext -f \$page -l \$page -enc UTF-8 -eol unix -nopgbrk "${pdfdocument}" "\$pagename.txt" || exit 1
+                        #only count words with letters, text layers without a proper character mapping yield mostly garbage
+                        if [ \$(grep -o "[[:alpha:]][[:alpha:]]*" "\$pagename.txt" | wc -l) -lt ${minwords} ]; then
+                            rm "\$pagename.txt"
+                            echo -n "\$page "
+                        fi
+                    done
+                    """
+            }
+
+            //the text of these pages goes straight to the FoLiA assembly (foliaassemble), along with the OCRed pages
+            pdftextpages
+                .flatMap { documentname, textfiles -> (textfiles instanceof List ? textfiles : [textfiles]).collect { [documentname, it] } }
+                .set { textpages }
+
+            //pages without a text layer are rasterised for OCR
+            pdfimagepages
+                .filter { pdfdocument, pages -> pages.trim() }
+                .map { pdfdocument, pages -> [pdfdocument, pages.trim()] }
+                .set { pdfrasterpages }
+        } else {
+            pdfranges
+                .map { pdfdocument, pagecount, firstpage, lastpage -> [pdfdocument, "${firstpage}-${lastpage}"] }
+                .set { pdfrasterpages }
+        }
+
+        process pdfimages {
+            /*
+                Extract images from PDF using pdftoppm (for page ranges, e.g. 1-10, or single pages)
+            */
+            input:
+            set file(pdfdocument), val(pages) from pdfrasterpages
+            val rasteroptions from rasteroptions
+            val rasterextension from rasterextension
+
+            output:
+            set val("${pdfdocument.baseName}"), file("${pdfdocument.baseName}*.${rasterextension}") into pdfimages
+
+            script:
+            """
+            #!/bin/bash
+            for pagerange in ${pages}; do
+                pdftoppm -f \${pagerange%-*} -l \${pagerange#*-} ${rasteroptions} "${pdfdocument}" "${pdfdocument.baseName}" || exit 1
+            done
+            """
+        }
+
+
+        //Each rasterised range emits (documentname, [imagefiles]), its pages are passed on to OCR as soon as the range is done
+        pdfimages.set { pageimageranges }
+
+    } else if ((params.inputtype == "jpg") || (params.inputtype == "jpeg") || (params.inputtype == "tif") || (params.inputtype == "tiff") || (params.inputtype == "png") || (params.inputtype == "gif")) {
+
+        //The input is a set of images: $documentname_$sequencenr.$extension  (where $sequencenr can be alphabetically sorted ), Tesseract supports a variety of formats
+        //we group and transform the data into a pageimageranges channel which will emit (documentname, [pagefiles]) tuples (all
+        //files are known as soon as the input directory has been globbed, so each document forms a single range)
+
+       Channel
+            .fromPath(params.inputdir+"/**." + params.inputtype)
+            .map { pagefile ->
+                def documentname = pagefile.baseName.find(params.seqdelimiter) != null ? pagefile.baseName.tokenize(params.seqdelimiter)[0..-2].join(params.seqdelimiter) : pagefile.baseName
+                [ documentname, pagefile ]
+            }
+            .groupTuple()
+            .set { pageimageranges }
+
+    }
+
+
+    if (params.ocrbatch > 1) {
+        //OCR several pages of the same document in a single task, through a single Tesseract engine (avoids loading the model for every page)
+        //Batches are formed within each rasterised range, so they do not wait for the rest of the document (nor for other
+        //documents); a batch thus holds at most --rasterpages pages
+        pageimageranges
+            .flatMap { documentname, pagefiles -> (pagefiles instanceof List ? pagefiles : [pagefiles]).sort { it.name }.collate(params.ocrbatch as int).collect { [documentname, it] } }
+            .set { pageimagebatches }
+
+        process tesseractbatch {
+            /*
+                Do the actual OCR using Tesseract on a batch of page images: outputs a hOCR document for each input page image
+            */
+
+            input:
+            set val(documentname), file(pageimage) from pageimagebatches
+            val language from params.language
+
+            output:
+            set val(documentname), file("*.hocr") into ocrpagebatches
+
+            script:
+            """
+            python3 ${baseDir}/scripts/tesseractbatch.py -l "${language}" ${pageimage}
+            """
+        }
+
+        //split the batches into individual pages again
+        ocrpagebatches
+            .flatMap { documentname, pagehocrs -> (pagehocrs instanceof List ? pagehocrs : [pagehocrs]).collect { [documentname, it] } }
+            .set { ocrpages }
+    } else {
+        //Convert (documentname, [imagefiles]) channel to a channel emitting (documentname, imagefile) tuples
+        pageimageranges
+            .flatMap { documentname, imagefiles -> (imagefiles instanceof List ? imagefiles : [imagefiles]).collect { [documentname, it] } }
+            .set { pageimages }
+
+        process tesseract {
+            /*
+                Do the actual OCR using Tesseract: outputs a hOCR document for each input page image
+            */
+
+            input:
+            set val(documentname), file(pageimage) from pageimages
+            val language from params.language
+
+            output:
+            set val(documentname), file("${pageimage.baseName}" + ".hocr") into ocrpages
+
+            script:
+            """
+            tesseract "${pageimage}" "${pageimage.baseName}" -c "tessedit_create_hocr=T" -l "${language}"
+            """
+        }
+    }
+
+    //fork the pages (including those with an embedded text layer, --pdftriage) so they can be both counted for the
+    //corpus frequency list as soon as they are OCRed and assembled into documents
+    ocrpages
+        .mix(textpages)
+        .into { ocrpages_forassembly; ocrpages_forfrequency }
+
+    //the pages are counted in groups of (at most) --rasterpages pages of the same document (see pagefrequency), a group
+    //is passed on as soon as it is complete rather than when the document is
+    ocrpages_forfrequency
+        .groupTuple(size: (params.rasterpages as int) > 0 ? (params.rasterpages as int) : 10, remainder: true)
+        .set { ocrpageunits }
+
+    //Collect all pages for a given document
+    //transforms [(documentname, hocrpage)] output to [(documentname, [hocrpages])], grouping pages per base name
+    ocrpages_forassembly
+        .groupTuple()
+        .set { groupocrpages }
+
+    process foliaassemble {
+        /*
+            Convert the Tesseract hOCR output (and text) of all pages of a document into a single FoLiA document, page by page
+        */
+
+        publishDir params.ocroutputdir, mode: params.publishmode, overwrite: true  //publish the output for the end-user to see
+
+        input:
+        set val(documentname), file(pages) from groupocrpages
+
+        output:
+        file "${documentname}.ocr.folia.xml" optional true into foliaoutput //no output for documents without any text
+
+        script:
+        """
+        python3 ${baseDir}/scripts/foliaassemble.py -i "${documentname}" -o "${documentname}.ocr.folia.xml" ${pages}
+        """
+    }
+
+
+    //fork the OCR output so we can report it and use it for the later stages
+    foliaoutput.into { folia_documents; foliaoutput_overview }
+
+    //explicitly report the OCR documents created to stdout
+    foliaoutput_overview.subscribe { println "OCR output document written to " +  params.ocroutputdir + "/" + it.name }
+
+    inputclass = "OCR" //the text class produced by the OCR stage
+    extension = "folia.xml"
+} else if (params.inputtype == "folia") {
+    //Create three identical channels globbing all FoLiA documents in the input directory (recursively!)
+    //the input_overview channel will be consumed immediately, simply printing all input filenames
+    Channel.fromPath(params.inputdir+"/**." + params.extension).into { folia_documents; folia_units; input_overview }
+    input_overview.subscribe { println "FoLiA input: ${it.baseName}" }
+    inputclass = params.inputclass //use user-supplied input class (default to 'current')
+    extension = params.extension
+} else if ((params.inputtype == "text") || (params.inputtype == "pdftext")) {
+    inputclass = "OCR"
+    extension = "folia.xml"
+
+    if (params.inputtype == "pdftext") {
+        //Create two identical channel globbing all PDF documents in the input directory (recursively!)
+        Channel.fromPath(params.inputdir+"/**.pdf").into { pdfdocuments; input_overview }
+        input_overview.subscribe { println "PDF input: ${it.baseName}" }
+
+        process pdf2text {
+            /*
+                convert PDF to Text with pdftotext
+            */
+
+            input:
+            file pdfdocument from pdfdocuments
+
+            output:
+            file "${pdfdocument.baseName}.txt" into textdocuments
+
+            script:
+            """
+            #!/bin/bash
+            pdftotext -nopgbrk -eol unix "$pdfdocument" "${pdfdocument.baseName}.txt"
+            """
+        }
+    } else {
+        //Create two identical channel globbing all text documents in the input directory (recursively!)
+        Channel.fromPath(params.inputdir+"/**.txt").filter { it.baseName != "trace" }.into { textdocuments; input_overview }
+        input_overview.subscribe { println "Text input: ${it.baseName}" }
+    }
+
+    if (params.chunksize > 0) {
+        //split documents that exceed the chunk size into chunks that are processed in parallel (and reassembled at the end), smaller documents are passed on as they are
+        chunkbytes = (params.chunksize as long) * 1024 * 1024
+        textdocuments.into { textdocuments_whole; textdocuments_tosplit }
+
+        process chunktext {
+            /*
+                Split a large text document into chunks at paragraph or page boundaries
+            */
+
+            input:
+            file textdocument from textdocuments_tosplit.filter { it.size() > chunkbytes }
+            val chunkbytes from chunkbytes
+
+            output:
+            file "${textdocument.baseName}_chunk*.txt" into textchunks
+
+            script:
+            """
+            #!/bin/bash
+            python3 ${baseDir}/scripts/chunktext.py -s ${chunkbytes} "${textdocument}" || exit 1
+            """
+        }
+
+        textdocuments_whole.filter { it.size() <= chunkbytes }.mix(textchunks.flatten()).set { textunits }
+    } else {
+        textunits = textdocuments
+    }
+
+    process txt2folia {
+        /*
+             Convert txt to FoLiA with FoLiA-txt
+        */
+
+        input:
+        file textdocument from textunits
+        val virtualenv from params.virtualenv
+
+        output:
+        file "${textdocument.baseName}.folia.xml" into folia_text_documents
+
+        script:
+        """
+        #!/bin/bash
+        #set up the virtualenv (bit unelegant currently, but we have to do this for each process to ensure the LaMachine environment works)
+        set +u
+        if [ ! -z "${virtualenv}" ]; then
+            source ${virtualenv}/bin/activate
+        fi
+        set -u
+
+        FoLiA-txt --class OCR -t 1 -O . "${textdocument}" || exit 1
+
+        if [ ! -s "${textdocument.baseName}.folia.xml" ]; then
+            echo "ERROR: Expected output ${textdocument.baseName}.folia.xml does not exist or is empty">&2
+            exit 6
+        fi
+        """
+    }
+
+    folia_text_documents.into { folia_documents; folia_units }
+} else {
+    log.error "No such input type: " + params.inputtype
+    exit 2
+}
+
+//fork the documents so they can be used as input for the correction and the enrichment stage (and for the frequency list in incremental mode)
+folia_documents.into { folia_documents_forfoliacorrect; folia_documents_forenrichment; folia_documents_forfrequency }
+
+/////////////////////////////////////////////// TICCL ///////////////////////////////////////////////
+
+if (!params.containsKey('noticcl')) {
+
+    if (params.containsKey('rankedlist')) {
+        //a ranked variant list is explicitly provided (e.g. from an earlier run on the very same corpus), along with the
+        //unknown word list and punctuation map that go with it, so we can skip all TICCL steps up to and including ranking
+        rankedlist_chained_cleaned = Channel.fromPath(params.rankedlist).ifEmpty("Ranked list not found")
+        unknownfreqlist = Channel.fromPath(params.unk).ifEmpty("Unknown word list not found")
+        punctuationmap = Channel.fromPath(params.punct).ifEmpty("Punctuation map not found")
+    } else {
+
+        if (params.containsKey('incremental')) {
+            //the corpus frequency list is computed incrementally: frequency lists are computed per (assembled) document and
+            //stored in a permanent cache, keyed by a hash of the document's contents (and the parameters that affect the counts),
+            //so only new or changed documents are counted again. The lists are then merged into a single corpus frequency list.
+
+            freqlistcache = params.containsKey('freqlistcache') ? params.freqlistcache : params.inputdir + "/.wordfreqlists"
+
+            folia_documents_forfrequency
+                .map { document -> tuple(filehash(document, inputclass + "\t" + params.ngram), document) }
+                .set { folia_documents_hashed }
+
+            process documentfrequency {
+                /*
+                    Process a single document into a frequency list (with FoLiA-stats), sorted on the word so it can be merged later
+                */
+
+                storeDir freqlistcache //permanent cache, the process is skipped if the output already exists there
+
+                input:
+                set val(hash), file("doc." + extension) from folia_documents_hashed
+                val virtualenv from params.virtualenv
+                val inputclass from inputclass
+                val extension from extension
+                val ngram from params.ngram
+
+                output:
+                file "${hash}.wordfreqlist.tsv" into partialfreqlists
+
+                script:
+                """
+                #!/bin/bash
+                #set up the virtualenv if necessary
+                set +u
+                if [ ! -z "${virtualenv}" ]; then
+                    source ${virtualenv}/bin/activate
+                fi
+                set -u
+
+                FoLiA-stats --class "$inputclass" -s -t 1 -e "$extension" --lang=none --collect --max-ngram ${ngram} --separator "_" -o doc . || exit 1
+                LC_ALL=C sort -t "\t" -k1,1 doc.wordfreqlist.?to?.tsv > "${hash}.wordfreqlist.tsv" || exit 1
+                """
+            }
+        } else if (params.inputtype in ocrinputtypes) {
+            process pagefrequency {
+                /*
+                    Process a group of OCRed pages into a frequency list: the pages are converted to FoLiA and counted
+                    (with FoLiA-stats) in a single task, sorted on the word so it can be merged later
+                */
+
+                input:
+                set val(documentname), file(pages) from ocrpageunits
+                val virtualenv from params.virtualenv
+                val ngram from params.ngram
+
+                output:
+                file "partial.wordfreqlist.tsv" into partialfreqlists
+
+                script:
+                """
+                #!/bin/bash
+                #set up the virtualenv if necessary
+                set +u
+                if [ ! -z "${virtualenv}" ]; then
+                    source ${virtualenv}/bin/activate
+                fi
+                set -u
+
+                mkdir unit
+                python3 ${baseDir}/scripts/foliaassemble.py -i "${documentname}" -o unit/pages.folia.xml ${pages} || exit 1
+                if [ ! -f unit/pages.folia.xml ]; then
+                    #no text on any of these pages, nothing to count
+                    touch partial.wordfreqlist.tsv
+                    exit 0
+                fi
+                FoLiA-stats --class OCR -s -t 1 -e folia.xml --lang=none --collect --max-ngram ${ngram} --separator "_" -o partial unit || exit 1
+                LC_ALL=C sort -t "\t" -k1,1 partial.wordfreqlist.?to?.tsv > partial.wordfreqlist.tsv || exit 1
+                """
+            }
+        } else {
+            process partialfrequency {
+                /*
+                    Process a single FoLiA document into a frequency list (with FoLiA-stats), sorted on the word so it can be merged later
+                */
+
+                input:
+                file foliaunit from folia_units
+                val virtualenv from params.virtualenv
+                val inputclass from inputclass
+                val extension from extension
+                val ngram from params.ngram
+
+                output:
+                file "partial.wordfreqlist.tsv" into partialfreqlists
+
+                script:
+                """
+                #!/bin/bash
+                #set up the virtualenv if necessary
+                set +u
+                if [ ! -z "${virtualenv}" ]; then
+                    source ${virtualenv}/bin/activate
+                fi
+                set -u
+
+                FoLiA-stats --class "$inputclass" -s -t 1 -e ${extension} --lang=none --collect --max-ngram ${ngram} --separator "_" -o partial . || exit 1
+                LC_ALL=C sort -t "\t" -k1,1 partial.wordfreqlist.?to?.tsv > partial.wordfreqlist.tsv || exit 1
+                """
+            }
+        }
+
+        process mergefrequency {
+            /*
+                Merge the partial (per group of pages or per document) frequency lists into a single corpus frequency list
+            */
+
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+
+            input:
+            file "partial*.wordfreqlist.tsv" from partialfreqlists.collect()
+
+            output:
+            file "corpus.wordfreqlist.tsv" into corpusfreqlist
+
+            script:
+            """
+            #!/bin/bash
+            python3 ${baseDir}/scripts/wordfreqmerge.py -o corpus.wordfreqlist.tsv partial*.wordfreqlist.tsv || exit 1
+
+            if [ ! -s "corpus.wordfreqlist.tsv" ]; then
+                echo "ERROR: Expected output corpus.wordfreqlist.tsv does not exist or is empty">&2
+                exit 6
+            fi
+            """
+        }
+
+        alphabet_forunk = Channel.fromPath(params.alphabet).ifEmpty("Alphabet file not found")
+
+        process ticclunk {
+            /*
+                Filter a wordfrequency list (TICCL-unk)
+            */
+
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+
+            input:
+            file corpusfreqlist from corpusfreqlist //corpus frequency list in FoLiA-stats format
+            file lexicon from lexicon
+            file alphabet from alphabet_forunk
+            val virtualenv from params.virtualenv
+            val artifrq from params.artifrq
+
+            output:
+            file "${corpusfreqlist}.clean" into corpusfreqlist_clean //cleaned wordfrequency file
+            file "${corpusfreqlist}.unk" into unknownfreqlist //unknown words list
+            file "${corpusfreqlist}.punct" into punctuationmap //list of words mapping strings with leading/trailing punctuation to clean variants
+
+            script:
+            """
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            TICCL-unk --background "${lexicon}" --artifrq ${artifrq} --alph "${alphabet}" "${corpusfreqlist}" || exit 1
+
+            if [ ! -s "${corpusfreqlist}.clean" ]; then
+                echo "ERROR: Expected output ${corpusfreqlist}.clean does not exist or is empty">&2
+                exit 6
+            fi
+            """
+        }
+
+        //fork the above output channel so it can be used as input for THREE processes
+        corpusfreqlist_clean.into { corpusfreqlist_clean_foranahash; corpusfreqlist_clean_forresolver; corpusfreqlist_clean_forindexer }
+
+        process anahash {
+            /*
+                Read a clean wordfrequency list , and hash all items with TICCL-anahash
+            */
+
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { params.containsKey('nointermediate') ? null : it } //publish the output for the end-user to see (rather than deleting this intermediate output), unless --nointermediate is set
+
+            input:
+            file corpusfreqlist from corpusfreqlist_clean_foranahash
+            file alphabet from alphabet
+            val virtualenv from params.virtualenv
+            val artifrq from params.artifrq
+            val lexiconindex from lexiconindex
+
+            output:
+            file "${corpusfreqlist}.anahash" into anahashlist
+            file "${corpusfreqlist}.corpusfoci" into corpusfocilist
+
+            script:
+
+        	"""
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            if [ ! -z "${lexiconindex}" ] && python3 ${baseDir}/scripts/lexiconindex.py split --index "${lexiconindex}" --alphabet "${alphabet}" --hashed lexicon.anahash --unhashed corpusonly.tsv "${corpusfreqlist}"; then
+                #the lexicon has been hashed in advance, only hash the words that are not in the lexicon index
+                TICCL-anahash --alph "${alphabet}" --artifrq ${artifrq} corpusonly.tsv --ngrams || exit 1
+                python3 ${baseDir}/scripts/lexiconindex.py merge -o "${corpusfreqlist}.anahash" lexicon.anahash corpusonly.tsv.anahash || exit 1
+                mv corpusonly.tsv.corpusfoci "${corpusfreqlist}.corpusfoci" || exit 1
+            else
+                TICCL-anahash --alph "${alphabet}" --artifrq ${artifrq} "${corpusfreqlist}" --ngrams || exit 1
+            fi
+
+            if [ ! -s "${corpusfreqlist}.anahash" ]; then
+                echo "ERROR: Expected output ${corpusfreqlist}.anahash does not exist or is empty">&2
+                exit 6
+            fi
+
+            if [ ! -s "${corpusfreqlist}.corpusfoci" ]; then
+                echo "ERROR: Expected output ${corpusfreqlist}.corpusfoci does not exist or is empty">&2
+                exit 6
+            fi
+            """
+        }
+
+
+        //fork channels so we can consume them from multiple processes
+        anahashlist.into { anahashlist_forindexer; anahashlist_forresolver }
+        charconfuslist.into { charconfuslist_forindexer; charconfuslist_forrank }
+
+        if (params.shards > 1) {
+            //Sharded mode: the anagram hash space (the corpus foci) is partitioned and each partition is indexed in a separate
+            //task, so these tasks can be scheduled on different nodes. The same holds for resolving the resulting index.
+            //Partial outputs are merged into a canonical order that does not depend on the number of shards.
+
+            //value channels, as these are consumed by every shard
+            corpusfreqlist_clean_forshards = corpusfreqlist_clean_forindexer.first()
+            anahashlist_forindexershards = anahashlist_forindexer.first()
+            anahashlist_forresolvershards = anahashlist_forresolver.first()
+            charconfuslist_forindexershards = charconfuslist_forindexer.first()
+            alphabet_forresolvershards = Channel.fromPath(params.alphabet).ifEmpty("Alphabet file not found").first()
+
+            process splitfoci {
+                /*
+                    Partition the corpus foci (anagram values to process) into shards
+                */
+
+                input:
+                file corpusfocilist from corpusfocilist
+                val shards from params.shards
+
+                output:
+                file "${corpusfocilist}.shard*" into corpusfoci_shards
+
+                script:
+                """
+                #!/bin/bash
+                split -n l/${shards} -d -a 4 "${corpusfocilist}" "${corpusfocilist}.shard" || exit 1
+                """
+            }
+
+            process indexershard {
+                /*
+                    Computes a partial index from anagram hashes for one shard of the corpus foci (TICCL-indexerNT)
+                */
+                label "multicore"
+
+                input:
+                file corpusfocishard from corpusfoci_shards.flatten()
+                file anahashlist from anahashlist_forindexershards
+                file charconfuslist from charconfuslist_forindexershards
+                val virtualenv from params.virtualenv
+                val low from params.low
+                val high from params.high
+
+                output:
+                file "${corpusfocishard}.indexNT" into index_shards
+
+                script:
+                """
+                #!/bin/bash
+                set +u
+                if [ ! -z "${virtualenv}" ]; then
+                    source ${virtualenv}/bin/activate
+                fi
+                set -u
+
+                if [ ! -s "${corpusfocishard}" ]; then
+                    #nothing to do for an empty shard
+                    touch "${corpusfocishard}.indexNT"
+                    exit 0
+                fi
+
+                TICCL-indexerNT --hash "${anahashlist}" --charconf "${charconfuslist}" --foci "${corpusfocishard}" -o "${corpusfocishard}" -t ${task.cpus} --low ${low} --high ${high} || exit 1
+
+                if [ ! -e "${corpusfocishard}.indexNT" ]; then
+                    echo "ERROR: Expected output ${corpusfocishard}.indexNT does not exist.">&2
+                    exit 6
+                fi
+                """
+            }
+
+            process mergeindex {
+                /*
+                    Merge the partial indices into a single index
+                */
+                publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { params.containsKey('nointermediate') ? null : it } //intermediate output, not published with --nointermediate
+
+                input:
+                file corpusfreqlist from corpusfreqlist_clean_forshards //only used for naming purposes, not real input
+                file indexshards from index_shards.collect()
+
+                output:
+                file "${corpusfreqlist}.indexNT" into index
+
+                script:
+                """
+                #!/bin/bash
+                python3 ${baseDir}/scripts/shardmerge.py --index -o "${corpusfreqlist}.indexNT" ${indexshards} || exit 1
+
+                if [ ! -s "${corpusfreqlist}.indexNT" ]; then
+                    echo "ERROR: Expected output ${corpusfreqlist}.indexNT is empty. This means that no correction candidates could be found for any of the words in the input and that the pipeline finishes prematurely because no further processing can be done.">&2
+                    exit 22
+                fi
+                """
+            }
+
+            process splitindex {
+                /*
+                    Partition the index into shards
+                */
+
+                input:
+                file index from index
+                val shards from params.shards
+
+                output:
+                file "${index}.shard*" into index_shards_forresolver
+
+                script:
+                """
+                #!/bin/bash
+                split -n l/${shards} -d -a 4 "${index}" "${index}.shard" || exit 1
+                """
+            }
+
+            process resolvershard {
+                //Resolves numerical confusions back to word form confusions using TICCL-LDcalc, for one shard of the index
+                label "multicore"
+
+                input:
+                file indexshard from index_shards_forresolver.flatten()
+                file anahashlist from anahashlist_forresolvershards
+                file corpusfreqlist from corpusfreqlist_clean_forshards
+                file alphabet from alphabet_forresolvershards
+                val distance from params.distance
+                val artifrq from params.artifrq
+                val virtualenv from params.virtualenv
+                val low from params.low
+                val high from params.high
+
+                output:
+                file "${indexshard}.ldcalc" into ldcalc_shards
+
+                script:
+                """
+                #!/bin/bash
+                set +u
+                if [ ! -z "${virtualenv}" ]; then
+                    source ${virtualenv}/bin/activate
+                fi
+                set -u
+
+                if [ ! -s "${indexshard}" ]; then
+                    #nothing to do for an empty shard
+                    touch "${indexshard}.ldcalc"
+                    exit 0
+                fi
+
+                TICCL-LDcalc --index "${indexshard}" --hash "${anahashlist}" --clean "${corpusfreqlist}" --LD ${distance} --artifrq ${artifrq} -o "${indexshard}.ldcalc" -t ${task.cpus} --alph ${alphabet} --low ${low} --high ${high} || exit 1
+
+                if [ ! -e "${indexshard}.ldcalc" ]; then
+                    echo "ERROR: Expected output ${indexshard}.ldcalc does not exist">&2
+                    exit 6
+                fi
+                """
+            }
+
+            process mergeldcalc {
+                /*
+                    Merge the partial word confusion lists into a single list
+                */
+                publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { params.containsKey('nointermediate') ? null : it } //publish the output for the end-user to see (rather than deleting this intermediate output), unless --nointermediate is set
+
+                input:
+                file corpusfreqlist from corpusfreqlist_clean_forshards //only used for naming purposes, not real input
+                file ldcalcshards from ldcalc_shards.collect()
+
+                output:
+                file "${corpusfreqlist}.ldcalc" into wordconfusionlist
+
+                script:
+                """
+                #!/bin/bash
+                python3 ${baseDir}/scripts/shardmerge.py -o "${corpusfreqlist}.ldcalc" ${ldcalcshards} || exit 1
+
+                if [ ! -s "${corpusfreqlist}.ldcalc" ]; then
+                    echo "ERROR: Expected output ${corpusfreqlist}.ldcalc does not exist or is empty">&2
+                    exit 6
+                fi
+                """
+            }
+
+        } else {
+            process indexer {
+                /*
+                    Computes an index from anagram hashes (TICCL-indexerNT)
+                */
+                publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { params.containsKey('nointermediate') ? null : it } //intermediate output, not published with --nointermediate
+                label "multicore"
+
+                input:
+                file corpusfreqlist from corpusfreqlist_clean_forindexer //only used for naming purposes, not real input
+                file anahashlist from anahashlist_forindexer
+                file charconfuslist from charconfuslist_forindexer
+                file corpusfocilist from corpusfocilist
+                val virtualenv from params.virtualenv
+                val low from params.low
+                val high from params.high
+
+                output:
+                file "${corpusfreqlist}.indexNT" into index
+
+                script:
+                """
+                #!/bin/bash
+                set +u
+                if [ ! -z "${virtualenv}" ]; then
+                    source ${virtualenv}/bin/activate
+                fi
+                set -u
+
+                TICCL-indexerNT --hash "${anahashlist}" --charconf "${charconfuslist}" --foci "${corpusfocilist}" -o "${corpusfreqlist}" -t ${task.cpus} --low ${low} --high ${high} || exit 1
+
+                if [ ! -e "${corpusfreqlist}.indexNT" ]; then
+                    echo "ERROR: Expected output ${corpusfreqlist}.indexNT does not exist.">&2
+                    exit 6
+                elif [ ! -s "${corpusfreqlist}.indexNT" ]; then
+                    echo "ERROR: Expected output ${corpusfreqlist}.indexNT is empty. This means that no correction candidates could be found for any of the words in the input and that the pipeline finishes prematurely because no further processing can be done.">&2
+                    exit 22
+                fi
+                """
+                //NOTE: -o option is a prefix only, extension indexNT will be appended !!
+            }
+
+            //set up a new channel for the alphabet file for the resolved (the other one is consumed already)
+            alphabet_forresolver = Channel.fromPath(params.alphabet).ifEmpty("Alphabet file not found")
+
+            process resolver {
+                //Resolves numerical confusions back to word form confusions using TICCL-LDcalc
+                publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { params.containsKey('nointermediate') ? null : it } //publish the output for the end-user to see (rather than deleting this intermediate output), unless --nointermediate is set
+                label "multicore"
+
+
+                input:
+                file index from index
+                file anahashlist from anahashlist_forresolver
+                file corpusfreqlist from corpusfreqlist_clean_forresolver
+                file alphabet from alphabet_forresolver
+                val distance from params.distance
+                val artifrq from params.artifrq
+                val virtualenv from params.virtualenv
+                val low from params.low
+                val high from params.high
+
+                output:
+                file "${corpusfreqlist}.ldcalc" into wordconfusionlist
+
+                script:
+                """
+                #!/bin/bash
+                set +u
+                if [ ! -z "${virtualenv}" ]; then
+                    source ${virtualenv}/bin/activate
+                fi
+                set -u
+
+            	TICCL-LDcalc --index "${index}" --hash "${anahashlist}" --clean "${corpusfreqlist}" --LD ${distance} --artifrq ${artifrq} -o "${corpusfreqlist}.ldcalc" -t ${task.cpus} --alph ${alphabet} --low ${low} --high ${high} || exit 1
+
+                if [ ! -s "${corpusfreqlist}.ldcalc" ]; then
+                    echo "ERROR: Expected output ${corpusfreqlist}.ldcalc does not exist or is empty">&2
+                    exit 6
+                fi
+                """
+            }
+        }
+
+        alphabet_forrank = Channel.fromPath(params.alphabet)
+
+        process rank {
+            /*
+                Rank output using TICCL-rank
+            */
+
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+            label "multicore"
+
+
+            input:
+            file wordconfusionlist from wordconfusionlist
+            file alphabet from alphabet_forrank
+            file charconfuslist from charconfuslist_forrank
+            val distance from params.distance
+            val artifrq from params.artifrq
+            val clip from params.clip
+            val virtualenv from params.virtualenv
+
+            output:
+            file "${wordconfusionlist}.ranked" into rankedlist
+
+            script:
+            """
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            TICCL-rank --alph "${alphabet}" --charconf "${charconfuslist}" -o "${wordconfusionlist}.ranked" --subtractartifrqfeature2 0 --clip ${clip} --skipcols=1,10,11,13 -t ${task.cpus} "${wordconfusionlist}" || exit 1
+
+            if [ ! -s "${wordconfusionlist}.ranked" ]; then
+                echo "ERROR: Expected output ${wordconfusionlist}.ranked does not exist or is empty">&2
+                exit 6
+            fi
+            """
+        }
+
+        alphabet_forchain = Channel.fromPath(params.alphabet)
+
+        process chainer {
+            /*
+                Find more distant variants (variants-of-variants are variants too)
+            */
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+
+            input:
+            file rankedlist from rankedlist
+            file alphabet from alphabet_forchain
+            val virtualenv from params.virtualenv
+            val clip from params.clip
+
+            output:
+            file "${rankedlist}.chained.ranked" into rankedlist_chained
+
+            script:
+            """
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            TICCL-chain --caseless ${rankedlist} --alph ${alphabet} || exit 1
+            mv ${rankedlist}.chained ${rankedlist}.chained.ranked || exit 2 #FoLiA-correct requires extension to be *.ranked so we add it
+
+            if [ ! -s "${rankedlist}.chained.ranked" ]; then
+                echo "ERROR: Expected output ${rankedlist}.chained.ranked does not exist or is empty">&2
+                exit 6
+            fi
+            """
+        }
+
+        if (params.chainclean) {
+
+            lexicon_forchainclean = Channel.fromPath(params.lexicon).ifEmpty("Lexicon file not found")
+
+            process chainclean {
+                /*
+                    Clean chain file, taking into account splits and merges
+                */
+                publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+
+                input:
+                file rankedlist from rankedlist_chained
+                file lexicon from lexicon_forchainclean
+                val virtualenv from params.virtualenv
+                val artifrq from params.artifrq
+                val low from params.low
+
+                output:
+                file "${rankedlist}.chained.ranked.cleaned" into rankedlist_chained_cleaned
+
+
+                script:
+                """
+                #!/bin/bash
+                set +u
+                if [ ! -z "${virtualenv}" ]; then
+                    source ${virtualenv}/bin/activate
+                fi
+                set -u
+
+                TICCL-chainclean --lexicon ${lexicon} --low ${low} --artifrq ${artifrq} ${rankedlist}
+
+                if [ ! -s "${rankedlist}.chained.ranked.cleaned" ]; then
+                    echo "ERROR: Expected output ${rankedlist}.chained.ranked does not exist or is empty">&2
+                    exit 6
+                fi
+                """
+
+            }
+
+        } else {
+            rankedlist_chained_cleaned = rankedlist_chained
+        }
+    }
+
+    if (!params.containsKey('nofoliacorrect')) {
+
+        if (params.correctbatch > 0) {
+            //fan the documents out over multiple FoLiA-correct tasks, each starts as soon as its documents and the ranked list are available
+            folia_documents_forfoliacorrect.buffer(size: params.correctbatch as int, remainder: true).set { foliacorrect_batches }
+        } else {
+            folia_documents_forfoliacorrect.collect().set { foliacorrect_batches } //collects all files first
+        }
+
+        process foliacorrect {
+            /*
+                Correct the input documents using the ranked list, produces final output documents with <str>, using FoLiA-correct
+            */
+
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { params.containsKey('nointermediate') ? null : it } //intermediate output, not published with --nointermediate
+            label "multicore"
+
+            input:
+            file folia_documents from foliacorrect_batches
+            file rankedlist from rankedlist_chained_cleaned.first() //the same ranked list, unknown words and punctuation map for all batches
+            file punctuationmap from punctuationmap.first()
+            file unknownfreqlist from unknownfreqlist.first()
+            val extension from extension
+            val inputclass from inputclass
+            val outputclass from params.outputclass
+            val virtualenv from params.virtualenv
+
+            output:
+            file "*.foliacorrect.folia.xml" into foliacorrect_documents
+
+            script:
+            """
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            #some bookkeeping
+            mkdir outputdir
+
+
+            FoLiA-correct --inputclass "${inputclass}" --outputclass "${outputclass}" --nums 10 -e ${extension} -O outputdir/ --unk "${unknownfreqlist}" --punct "${punctuationmap}" --rank "${rankedlist}"  -t ${task.cpus} . || exit 1
+
+            cd outputdir
+            echo "output files:"
+            ls
+
+            #rename files so they have *.ticcl.folia.xml as extension (rather than .ticcl.xml which FoLiA-correct produces)
+            for f in *.xml; do
+                if [[ \$f != "*.xml" ]]; then
+                    if [[ \${f%.ticcl.xml} != \$f ]]; then
+                        newf="\${f%.ticcl.xml}.foliacorrect.folia.xml" #old folia-correc
+                    elif [[ \${f%.ticcl.folia.xml} != \$f ]]; then
+                        newf="\${f%.ticcl.folia.xml}.foliacorrect.folia.xml" #new folia-correct
+                    else
+                        newf="\$f"
+                    fi
+                    mv \$f ../\$newf
+                fi
+            done
+            cd ..
+            """
+        }
+
+        if (!params.containsKey('nostringlinking')) {
+            process linkstrings {
+                /*
+                 This invokes a tool that adds text markup information (t-str and t-correction) linking to the substrings. It adds a level of redundancy that is needed for proper visualisation in FLAT.
+                */
+
+                publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { ischunk(it) ? null : it } //publish the output for the end-user to see (this is the final output, chunks are reassembled first)
+
+                input:
+                file foliadoc from foliacorrect_documents.flatten() //one document at a time, as soon as its batch is corrected
+                val virtualenv from params.virtualenv
+
+                output:
+                file "*.ticcl.folia.xml" into folia_ticcl_pieces
+
+                script:
+                """
+                #!/bin/bash
+                set +u
+                if [ ! -z "${virtualenv}" ]; then
+                    source ${virtualenv}/bin/activate
+                fi
+                set -u
+
+                foliatextcontent -M ${foliadoc} > ${foliadoc.simpleName}.ticcl.folia.xml || exit 1
+                """
+            }
+
+        } else {
+            process nolinkstrings {
+                """Simple file rename step"""
+
+                publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { ischunk(it) ? null : it } //publish the output for the end-user to see (this is the final output, chunks are reassembled first)
+
+                input:
+                file foliadoc from foliacorrect_documents.flatten() //one document at a time, as soon as its batch is corrected
+
+                output:
+                file "*.ticcl.folia.xml" into folia_ticcl_pieces
+
+                script:
+                """
+                cp ${foliadoc} ${foliadoc.simpleName}.ticcl.folia.xml || exit 1
+                """
+            }
+        }
+
+        if (params.chunksize > 0) {
+            //documents that were split into chunks are reassembled in order, all others are final as they are
+            //(the enrichment stage works on the chunks, they are reassembled again after enrichment)
+            folia_ticcl_pieces.into { folia_ticcl_documents_forenrichment; folia_ticcl_whole; folia_ticcl_chunks }
+            folia_ticcl_chunks
+                .filter { ischunk(it) }
+                .map { [ chunkdocument(it), it ] }
+                .groupTuple()
+                .set { folia_ticcl_chunkgroups }
+
+            process reassemble {
+                /*
+                    Concatenate the corrected chunks of a document into a single document again
+                */
+
+                publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (this is the final output)
+
+                input:
+                set val(documentname), file(chunks) from folia_ticcl_chunkgroups
+                val virtualenv from params.virtualenv
+
+                output:
+                file "${documentname}.ticcl.folia.xml" into folia_ticcl_reassembled
+
+                script:
+                """
+                #!/bin/bash
+                set +u
+                if [ ! -z "${virtualenv}" ]; then
+                    source ${virtualenv}/bin/activate
+                fi
+                set -u
+
+                foliainput=\$(ls -1v *_chunk*.ticcl.folia.xml | tr '\\n' ' ')
+                foliacat -i "${documentname}" -o "${documentname}.ticcl.folia.xml" \$foliainput || exit 1
+                """
+            }
+
+            folia_ticcl_whole.filter { !ischunk(it) }.mix(folia_ticcl_reassembled).set { folia_ticcl_overview }
+        } else {
+            //fork the TICCL output so we can report it and pass it on to the enrichment stage
+            folia_ticcl_pieces.into { folia_ticcl_documents_forenrichment; folia_ticcl_overview }
+        }
+
+        //explicitly report the final documents created to stdout
+        folia_ticcl_overview.subscribe { println "TICCL output document written to " +  params.outputdir + "/" + it.name }
+    }
+}
+
+/////////////////////////////////////////////// LINGUISTIC ENRICHMENT ///////////////////////////////////////////////
+
+if (params.frog || params.ucto) {
+    //Enrichment works on the TICCL output if available, and on the (OCRed) input documents otherwise
+    if (!params.containsKey('noticcl') && !params.containsKey('nofoliacorrect')) {
+        enrichment_documents = folia_ticcl_documents_forenrichment
+        enrichment_inputclass = params.outputclass
+    } else {
+        enrichment_documents = folia_documents_forenrichment
+        enrichment_inputclass = inputclass
+    }
+
+    if (params.frog) {
+        process frog {
+            /*
+                Linguistic enrichment (tokenisation, PoS tagging, lemmatisation, etc) using Frog
+            */
+
+            publishDir params.frogoutputdir, mode: params.publishmode, overwrite: true, saveAs: { ischunk(it) ? null : it } //publish the output for the end-user to see (this is the final output, chunks are reassembled first)
+
+            input:
+            file inputdocument from enrichment_documents
+            val inputclass from enrichment_inputclass
+            val skip from params.frogskip
+            val virtualenv from params.virtualenv
+
+            output:
+            file "${inputdocument.simpleName}.frogged.folia.xml" into enriched_pieces
+
+            script:
+            """
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            opts=""
+            if [ ! -z "${skip}" ]; then
+                opts="--skip=${skip}"
+            fi
+
+            frog \$opts --inputclass "${inputclass}" --outputclass "current" -x "${inputdocument}" -X "${inputdocument.simpleName}.frogged.folia.xml" || exit 1
+            """
+        }
+    } else {
+        process ucto {
+            /*
+                Tokenisation using ucto
+            */
+
+            publishDir params.uctooutputdir, mode: params.publishmode, overwrite: true, saveAs: { ischunk(it) ? null : it } //publish the output for the end-user to see (this is the final output, chunks are reassembled first)
+
+            input:
+            file inputdocument from enrichment_documents
+            val inputclass from enrichment_inputclass
+            val language from params.language.tokenize('_')[0] //strips variants like deu_frak, ucto is not concerned with script
+            val virtualenv from params.virtualenv
+
+            output:
+            file "${inputdocument.simpleName}.tok.folia.xml" into enriched_pieces
+
+            script:
+            """
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            ucto -L "${language}" -F -X --inputclass "${inputclass}" --outputclass "current" "${inputdocument}" "${inputdocument.simpleName}.tok.folia.xml" || exit 1
+            """
+        }
+    }
+
+    enrichment_outputdir = params.frog ? params.frogoutputdir : params.uctooutputdir
+    enrichment_extension = params.frog ? "frogged.folia.xml" : "tok.folia.xml"
+    enrichment_name = params.frog ? "Frog" : "Tokeniser"
+
+    if (params.chunksize > 0) {
+        //documents that were split into chunks are reassembled in order, all others are final as they are
+        enriched_pieces.into { enriched_whole; enriched_chunks }
+        enriched_chunks
+            .filter { ischunk(it) }
+            .map { [ chunkdocument(it), it ] }
+            .groupTuple()
+            .set { enriched_chunkgroups }
+
+        process reassemble_enrichment {
+            /*
+                Concatenate the enriched chunks of a document into a single document again
+            */
+
+            publishDir enrichment_outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (this is the final output)
+
+            input:
+            set val(documentname), file(chunks) from enriched_chunkgroups
+            val extension from enrichment_extension
+            val virtualenv from params.virtualenv
+
+            output:
+            file "${documentname}.${extension}" into enriched_reassembled
+
+            script:
+            """
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            foliainput=\$(ls -1v *_chunk*.${extension} | tr '\\n' ' ')
+            foliacat -i "${documentname}" -o "${documentname}.${extension}" \$foliainput || exit 1
+            """
+        }
+
+        enriched_whole.filter { !ischunk(it) }.mix(enriched_reassembled).set { enriched_documents }
+    } else {
+        enriched_documents = enriched_pieces
+    }
+
+    //explicitly report the final documents created to stdout
+    enriched_documents.subscribe { println enrichment_name + " output document written to " + enrichment_outputdir + "/" + it.name }
+}
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+#-*- coding:utf-8 -*-
+
+#Records and compares the performance of pipeline runs (see benchmark.sh)
+#
+#   benchmark.py record -o results.json -n NAME trace.txt   summarises the Nextflow trace of a run: the wall-clock time of
+#                                                         the run and, per process, the number of tasks, the total run
+#                                                         time and CPU time of its tasks and their peak memory usage
+#   benchmark.py compare results.json baseline.json      compares results against a baseline, exits with status 1 if any
+#                                                         measurement exceeds the baseline by more than the threshold
+#
+#Small absolute differences are never regressions (see --mintime and --minmemory), as they are mostly noise.
+
+import sys
+import os
+import json
+import time
+import socket
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'webservice', 'picclservice'))
+import nftrace #pylint: disable=wrong-import-position
+
+
+def summarise(records):
+    """Summarises the trace records of a run, returns a dictionary"""
+    records = nftrace.finished(records)
+    processes = {}
+    for record in records:
+        summary = processes.setdefault(record['process'], {'tasks': 0, 'realtime': 0.0, 'cputime': 0.0, 'peak_rss': 0})
+        summary['tasks'] += 1
+        realtime = record.get('realtime') or record.get('duration') or 0.0
+        summary['realtime'] += realtime
+        summary['cputime'] += realtime * (record.get('%cpu') or 0.0) / 100
+        summary['peak_rss'] = max(summary['peak_rss'], record.get('peak_rss') or 0)
+    return {
+        'wallclock': nftrace.span(records, set(processes)),
+        'cputime': sum( summary['cputime'] for summary in processes.values() ),
+        'peak_rss': max( [ summary['peak_rss'] for summary in processes.values() ] + [0] ),
+        'processes': processes,
+    }
+
+def load(filename):
+    if os.path.exists(filename):
+        with open(filename,'r',encoding='utf-8') as f:
+            return json.load(f)
+    return {'host': socket.gethostname(), 'cpus': os.cpu_count(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'benchmarks': {}}
+
+def exceeds(value, baseline, threshold, minimum):
+    """Does a measurement exceed its baseline by more than the (relative) threshold and the absolute minimum?"""
+    if value is None or baseline is None:
+        return False
+    return value > baseline * (1 + threshold) and value - baseline > minimum
+
+def compare(results, baseline, args):
+    """Compares results against a baseline, prints a report, returns the number of regressions"""
+    regressions = 0
+    print("%-28s %-24s %-10s %12s %12s %8s" % ("BENCHMARK","PROCESS","MEASURE","BASELINE","CURRENT","CHANGE"))
+    for name, expected in sorted(baseline['benchmarks'].items()):
+        if name not in results['benchmarks']:
+            print("%-28s (not run)" % name)
+            continue
+        measured = results['benchmarks'][name]
+        rows = [ ("(total)", measure, measured.get(measure), expected.get(measure)) for measure in ('wallclock','cputime','peak_rss') ]
+        for process, summary in sorted(expected['processes'].items()):
+            current = measured['processes'].get(process, {})
+            rows += [ (process, measure, current.get(measure), summary.get(measure)) for measure in ('realtime','peak_rss') ]
+        for process, measure, value, reference in rows:
+            if measure == 'peak_rss':
+                regression = exceeds(value, reference, args.memthreshold, args.minmemory * 1024 * 1024)
+                fmt = lambda x: "%.1fMB" % (x / 1024 / 1024) if x is not None else "-"
+            else:
+                regression = exceeds(value, reference, args.threshold, args.mintime)
+                fmt = lambda x: "%.1fs" % x if x is not None else "-"
+            change = "%+.0f%%" % ((value - reference) / reference * 100) if value is not None and reference else ""
+            print("%-28s %-24s %-10s %12s %12s %8s%s" % (name, process, measure, fmt(reference), fmt(value), change, "  REGRESSION" if regression else ""))
+            if regression:
+                regressions += 1
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Records and compares the performance of pipeline runs", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    recordparser = subparsers.add_parser('record', help="Record the performance of a run from its Nextflow trace")
+    recordparser.add_argument('-o','--output', type=str,help="Results file (JSON), results of other benchmarks in it are kept", action='store',required=True)
+    recordparser.add_argument('-n','--name', type=str,help="Name of the benchmark", action='store',required=True)
+    recordparser.add_argument('trace', help="Nextflow trace file (-with-trace)")
+    compareparser = subparsers.add_parser('compare', help="Compare results against a baseline")
+    compareparser.add_argument('results', help="Results file")
+    compareparser.add_argument('baseline', help="Baseline results file")
+    compareparser.add_argument('-t','--threshold', type=float,help="Maximum relative increase of time (0.2 = 20%%)", action='store',default=0.2)
+    compareparser.add_argument('-m','--memthreshold', type=float,help="Maximum relative increase of peak memory", action='store',default=0.2)
+    compareparser.add_argument('--mintime', type=float,help="Minimum absolute increase of time to count as a regression (seconds)", action='store',default=5)
+    compareparser.add_argument('--minmemory', type=float,help="Minimum absolute increase of peak memory to count as a regression (MB)", action='store',default=50)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        records = nftrace.readtrace(args.trace)
+        if not records:
+            print("No trace records in " + args.trace, file=sys.stderr)
+            sys.exit(1)
+        results = load(args.output)
+        results['benchmarks'][args.name] = summarise(records)
+        with open(args.output,'w',encoding='utf-8') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+        print("Recorded " + args.name + ": " + "%.1fs" % (results['benchmarks'][args.name]['wallclock'] or 0) + " wall-clock", file=sys.stderr)
+    elif args.command == 'compare':
+        results = load(args.results)
+        baseline = load(args.baseline)
+        if baseline.get('cpus') != results.get('cpus'):
+            print("Warning: the baseline was recorded with " + str(baseline.get('cpus')) + " cores, these results with " + str(results.get('cpus')), file=sys.stderr)
+        regressions = compare(results, baseline, args)
+        if regressions:
+            print(str(regressions) + " regression(s)", file=sys.stderr)
+            sys.exit(1)
+        print("No regressions", file=sys.stderr)
+    else:
+        parser.print_help()
+        sys.exit(2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+#-*- coding:utf-8 -*-
+
+#Splits a large plain text document into chunks of bounded size (ticcl.nf and piccl.nf with --chunksize), so the chunks
+#can be converted, counted and corrected in parallel and no single task has to hold the entire document in memory. The
+#corrected chunks are reassembled in order at the end of the pipeline (with foliacat).
+#
+#Chunks are cut at paragraph boundaries (empty lines) or page boundaries (form feeds, as pdftotext outputs them) once
+#they reach the requested size. A chunk that grows to twice that size without reaching any such boundary is cut at the
+#next white space instead (usually a line break), and one that grows to three times that size without any white space
+#at all is cut there. The input is read as a byte stream, one chunk size at a time, so the encoding does not matter and
+#memory usage depends only on the chunk size, not on the size of the document or the length of its lines. Chunks of a
+#document named document.txt are named document_chunk00001.txt, document_chunk00002.txt, etc.
+
+import sys
+import os
+import re
+import argparse
+
+FORMFEED = b'\x0c'
+
+PARAGRAPHBOUNDARY = re.compile(br'\n[ \t\r\v]*\n|\x0c') #an empty line or a page boundary
+WORDBOUNDARY = re.compile(br'\s')
+
+#a boundary may straddle two reads, the end of the buffer is searched again after the next one
+BOUNDARYMARGIN = 64
+
+
+def findcut(buffer, size, start=0):
+    """Returns the position at which the chunk in the buffer should be cut (the start of the next chunk), or None if it
+    is not known yet. The buffer has already been searched up to position start."""
+    if len(buffer) >= size:
+        match = PARAGRAPHBOUNDARY.search(buffer, max(start, size - 1))
+        if match:
+            return match.end()
+    if len(buffer) >= 2 * size:
+        match = WORDBOUNDARY.search(buffer, max(start, 2 * size))
+        if match:
+            return match.end()
+    if len(buffer) >= 3 * size:
+        cut = 3 * size
+        while cut < len(buffer) and cut > 3 * size - 3 and buffer[cut] & 0xC0 == 0x80:
+            cut -= 1 #do not split a UTF-8 encoded character
+        return cut
+    return None
+
+def chunks(stream, size):
+    """Yields the chunks of a text (binary stream) as byte strings"""
+    buffer = bytearray() #read, but not yet part of a chunk
+    searched = 0
+    eof = False
+    while not eof:
+        block = stream.read(size)
+        eof = not block
+        buffer.extend(block)
+        while buffer:
+            cut = findcut(buffer, size, searched)
+            if cut is None:
+                if not eof:
+                    searched = max(0, len(buffer) - BOUNDARYMARGIN)
+                    break
+                cut = len(buffer)
+            chunk = bytes(buffer[:cut])
+            del buffer[:cut]
+            searched = 0
+            if chunk.strip():
+                #page boundaries become paragraph boundaries
+                yield chunk.replace(FORMFEED, b'\n')
+
+def main():
+    parser = argparse.ArgumentParser(description="Splits a large plain text document into chunks at paragraph or page boundaries", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-s','--size', type=int,help="Size of a chunk (in bytes)", action='store',default=100*1024*1024)
+    parser.add_argument('-O','--outputdir', type=str,help="Output directory", action='store',default=".")
+    parser.add_argument('document', help='Text document')
+    args = parser.parse_args()
+
+    if args.size <= 0:
+        print("Chunk size must be positive", file=sys.stderr)
+        sys.exit(2)
+
+    basename = os.path.basename(args.document)
+    if basename.endswith('.txt'):
+        basename = basename[:-4]
+    count = 0
+    with open(args.document,'rb') as f:
+        for count, chunk in enumerate(chunks(f, args.size), 1):
+            with open(os.path.join(args.outputdir, basename + "_chunk%05d.txt" % count),'wb') as out:
+                out.write(chunk)
+    print("Split " + args.document + " into " + str(count) + " chunks", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
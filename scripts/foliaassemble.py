@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+#-*- coding:utf-8 -*-
+
+#Assembles the pages of a document into a single FoLiA document (ocr.nf): hOCR pages as produced by Tesseract and, for
+#PDF pages with an embedded text layer (--pdftriage), plain text pages as produced by pdftotext. This replaces a
+#conversion task per page (FoLiA-hocr) followed by concatenation (foliacat).
+#
+#Pages are processed in natural order of their file names (page_2 before page_10). Each page is parsed on its own and
+#written out as soon as it is converted, so memory usage depends on the size of a page rather than of the document.
+#Every page becomes a division (class "page") holding paragraphs, each with its text (class OCR, as FoLiA-hocr does)
+#and a string element per word. Pages without any text (empty hOCR files or pages where Tesseract found nothing) are
+#reported and skipped; pages that can not be parsed at all are an error.
+
+import sys
+import os
+import re
+import argparse
+import xml.etree.ElementTree as ElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+FOLIAVERSION = "2.0.0"
+TEXTSET = "https://raw.githubusercontent.com/proycon/folia/master/setdefinitions/text.foliaset.ttl"
+
+
+def naturalkey(filename):
+    """Sort key for natural ordering of file names"""
+    return [ int(part) if part.isdigit() else part for part in re.split(r'([0-9]+)', os.path.basename(filename)) ]
+
+def makeid(s):
+    """Turns a string into a valid XML ID (NCName)"""
+    s = re.sub(r'[^\w.\-]', '_', s)
+    if not s or not (s[0].isalpha() or s[0] == '_'):
+        s = 'D' + s
+    return s
+
+def hocrclass(element):
+    return (element.get('class') or '').split()
+
+def hocrparagraphs(filename):
+    """Reads a hOCR page, returns a list of paragraphs, each a list of words"""
+    if os.path.getsize(filename) == 0:
+        return []
+    try:
+        root = ElementTree.parse(filename).getroot()
+    except ElementTree.ParseError as e:
+        raise ValueError("Unable to parse " + filename + ": " + str(e))
+    paragraphs = []
+    for par in root.iter():
+        if 'ocr_par' in hocrclass(par):
+            words = []
+            for word in par.iter():
+                if 'ocrx_word' in hocrclass(word):
+                    text = "".join(word.itertext()).strip()
+                    if text:
+                        words += text.split()
+            if words:
+                paragraphs.append(words)
+    if not paragraphs:
+        #no paragraphs marked (other OCR engines), fall back to lines or otherwise all words on the page
+        for unit in ('ocr_line', 'ocrx_word'):
+            for element in root.iter():
+                if unit in hocrclass(element):
+                    words = "".join(element.itertext()).split()
+                    if words:
+                        paragraphs.append(words)
+            if paragraphs:
+                if unit == 'ocrx_word':
+                    paragraphs = [ [ word for words in paragraphs for word in words ] ]
+                break
+    return paragraphs
+
+def textparagraphs(filename):
+    """Reads a plain text page, paragraphs are separated by empty lines. Returns a list of paragraphs, each a list of words"""
+    with open(filename,'r',encoding='utf-8',errors='replace') as f:
+        return [ words for words in ( block.split() for block in re.split(r'\n\s*\n', f.read()) ) if words ]
+
+def writeparagraph(out, parid, words, textclass):
+    text = " ".join(words)
+    out.write("      <p xml:id=" + quoteattr(parid) + ">\n")
+    out.write("        <t class=" + quoteattr(textclass) + ">" + escape(text) + "</t>\n")
+    offset = 0
+    for i, word in enumerate(words):
+        out.write("        <str xml:id=" + quoteattr(parid + ".str." + str(i+1)) + "><t class=" + quoteattr(textclass) + " offset=\"" + str(offset) + "\">" + escape(word) + "</t></str>\n")
+        offset += len(word) + 1
+    out.write("      </p>\n")
+
+def assemble(out, docid, pages, textclass="OCR"):
+    """Writes a FoLiA document for the given pages (file names, in order) to a stream, returns the number of pages with text"""
+    out.write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n")
+    out.write("<FoLiA xmlns=\"http://ilk.uvt.nl/folia\" xml:id=" + quoteattr(docid) + " version=\"" + FOLIAVERSION + "\" generator=\"PICCL foliaassemble.py\">\n")
+    out.write("  <metadata type=\"native\">\n")
+    out.write("    <annotations>\n")
+    out.write("      <text-annotation set=\"" + TEXTSET + "\"/>\n")
+    out.write("      <division-annotation/>\n")
+    out.write("      <paragraph-annotation/>\n")
+    out.write("      <string-annotation/>\n")
+    out.write("    </annotations>\n")
+    out.write("  </metadata>\n")
+    out.write("  <text xml:id=" + quoteattr(docid + ".text") + ">\n")
+    pagecount = 0
+    for pagenr, page in enumerate(pages, 1):
+        if page.endswith('.txt'):
+            paragraphs = textparagraphs(page)
+        else:
+            paragraphs = hocrparagraphs(page)
+        if not paragraphs:
+            print("Page " + str(pagenr) + " (" + os.path.basename(page) + ") has no text, skipping", file=sys.stderr)
+            continue
+        pagecount += 1
+        pageid = docid + ".page." + str(pagenr)
+        out.write("    <div class=\"page\" xml:id=" + quoteattr(pageid) + ">\n")
+        for parnr, words in enumerate(paragraphs, 1):
+            writeparagraph(out, pageid + ".p." + str(parnr), words, textclass)
+        out.write("    </div>\n")
+    out.write("  </text>\n")
+    out.write("</FoLiA>\n")
+    return pagecount
+
+def main():
+    parser = argparse.ArgumentParser(description="Assembles hOCR (and plain text) pages into a single FoLiA document", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-o','--output', type=str,help="Output file", action='store',required=True)
+    parser.add_argument('-i','--id', type=str,help="Document ID (defaults to the output file name)", action='store')
+    parser.add_argument('-c','--class', dest='textclass', type=str,help="Text class", action='store',default="OCR")
+    parser.add_argument('pages', nargs='+', help='Pages (*.hocr, or *.txt for pages with an embedded text layer), in any order')
+    args = parser.parse_args()
+
+    docid = makeid(args.id if args.id else os.path.basename(args.output).split('.')[0])
+    pages = sorted(args.pages, key=naturalkey)
+    try:
+        with open(args.output,'w',encoding='utf-8') as out:
+            pagecount = assemble(out, docid, pages, args.textclass)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        os.unlink(args.output)
+        sys.exit(1)
+    if pagecount == 0:
+        #nothing to pass on, but not an error (e.g. a document with only blank pages)
+        print("Document " + docid + " has no text at all, no output written", file=sys.stderr)
+        os.unlink(args.output)
+        return
+    print("Assembled " + str(pagecount) + " of " + str(len(pages)) + " pages into " + args.output, file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
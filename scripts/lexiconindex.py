@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+#-*- coding:utf-8 -*-
+
+#Pre-computed anagram hash index of a validated lexicon (*.dict), so the lexicon does not have to be hashed again for
+#every corpus. The index is a binary file stored beside the lexicon (*.dict.anaidx) that is memory-mapped on use, so
+#concurrent jobs in the same language share it through the page cache rather than each parsing the lexicon themselves.
+#
+#Subcommands:
+# * compile - build indices for all lexicons in a data directory (as downloaded by download-data.nf), or a single one
+# * split   - split a clean corpus word list (from TICCL-unk) into the anagram hashes of words that are in the index
+#             and a word list of words that still need to be hashed (with TICCL-anahash)
+# * merge   - merge anagram hash lists (such as the output of split and of TICCL-anahash) into one
+# * lookup  - look up the anagram hash of one or more words
+#
+#The anagram hashes themselves are always computed by TICCL-anahash, so they are identical to those of a regular run.
+#
+#Index format (all integers little-endian):
+#   magic (8 bytes) | version (uint32) | number of entries N (uint32) | SHA-256 digest of the alphabet file (32 bytes)
+#   N+1 offsets (uint64, relative to the start of the data section)
+#   data section: N entries "word\0hash", sorted on the word (byte order)
+
+import sys
+import os
+import argparse
+import hashlib
+import mmap
+import struct
+import subprocess
+import tempfile
+import glob
+
+MAGIC = b"PICCLANA"
+VERSION = 1
+HEADER = struct.Struct("<8sII32s")
+OFFSET = struct.Struct("<Q")
+ANAHASHSEPARATOR = "~" #separates the anagram value from the words in TICCL-anahash output (value~word#word#...)
+WORDSEPARATOR = "#"
+
+
+def filedigest(filename):
+    """Computes the SHA-256 digest of a file"""
+    h = hashlib.sha256()
+    with open(filename,'rb') as f:
+        for block in iter(lambda: f.read(1024*1024), b""):
+            h.update(block)
+    return h.digest()
+
+def readanahash(filename):
+    """Reads a TICCL-anahash file, yields (hash, [words]) tuples"""
+    with open(filename,'r',encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if ANAHASHSEPARATOR not in line:
+                continue
+            anahash, words = line.split(ANAHASHSEPARATOR, 1)
+            yield anahash, [ word for word in words.split(WORDSEPARATOR) if word ]
+
+def sortedanahashes(records):
+    """Given (hash, order, word) records, yields (hash, [words]) tuples in numerical order of the hash, by invoking sort(1)
+    so memory usage does not depend on the number of records. The words of a hash are ordered on order (a fixed-width
+    string) and then on the word (byte order); of duplicate words only the first is kept."""
+    env = dict(os.environ, LC_ALL='C')
+    sortprocess = subprocess.Popen(['sort','-t','\t','-k1,1n','-k2,2','-k3,3','-k4,4'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+    for anahash, order, word in records:
+        sortprocess.stdin.write((str(len(anahash)) + "\t" + anahash + "\t" + order + "\t" + word + "\n").encode('utf-8'))
+    sortprocess.stdin.close()
+    currenthash = None
+    words = []
+    for line in sortprocess.stdout:
+        _, anahash, _, word = line.decode('utf-8').rstrip('\n').split('\t')
+        if anahash != currenthash:
+            if currenthash is not None:
+                yield currenthash, words
+            currenthash = anahash
+            words = []
+        if word not in words:
+            words.append(word)
+    if currenthash is not None:
+        yield currenthash, words
+    if sortprocess.wait() != 0:
+        raise Exception("sort failed")
+
+
+class LexiconIndex(object):
+    """Read-only, memory-mapped anagram hash index of a lexicon"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename,'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, self.alphabetdigest = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a (compatible) lexicon index: " + filename)
+        self.offsetstart = HEADER.size
+        self.datastart = self.offsetstart + (self.size + 1) * OFFSET.size
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def entry(self, i):
+        """Returns the i'th entry as a (word, hash) tuple of bytes"""
+        begin = self.datastart + OFFSET.unpack_from(self.data, self.offsetstart + i * OFFSET.size)[0]
+        end = self.datastart + OFFSET.unpack_from(self.data, self.offsetstart + (i+1) * OFFSET.size)[0]
+        word, _, anahash = self.data[begin:end].partition(b'\0')
+        return word, anahash
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self.entry(i)
+
+    def lookup(self, word):
+        """Returns the anagram hash (str) of a word, or None if the word is not in the index (binary search)"""
+        if isinstance(word, str):
+            word = word.encode('utf-8')
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) // 2
+            entryword, anahash = self.entry(mid)
+            if entryword < word:
+                low = mid + 1
+            elif entryword > word:
+                high = mid
+            else:
+                return anahash.decode('utf-8')
+        return None
+
+    def checkalphabet(self, alphabetfile):
+        """Checks whether the index was compiled with the specified alphabet file"""
+        return filedigest(alphabetfile) == self.alphabetdigest
+
+
+def build(anahashfile, alphabetfile, outputfile):
+    """Builds an index from the output of TICCL-anahash"""
+    entries = sorted( (word.encode('utf-8'), anahash.encode('utf-8')) for anahash, words in readanahash(anahashfile) for word in words )
+    tmpfile = outputfile + ".tmp" + str(os.getpid())
+    with open(tmpfile,'wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, len(entries), filedigest(alphabetfile)))
+        offset = 0
+        for word, anahash in entries:
+            out.write(OFFSET.pack(offset))
+            offset += len(word) + 1 + len(anahash)
+        out.write(OFFSET.pack(offset))
+        for word, anahash in entries:
+            out.write(word + b'\0' + anahash)
+    os.rename(tmpfile, outputfile) #atomic, running jobs keep the old index mapped
+    return len(entries)
+
+def compilelexicon(lexiconfile, alphabetfile, outputfile, artifrq):
+    """Hashes a lexicon with TICCL-anahash and builds an index from the result"""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        wordlist = os.path.join(tmpdir, "lexicon.tsv")
+        with open(lexiconfile,'r',encoding='utf-8') as f, open(wordlist,'w',encoding='utf-8') as out:
+            for line in f:
+                word = line.rstrip('\n').split('\t')[0]
+                if word:
+                    out.write(word + "\t" + str(artifrq) + "\n")
+        if subprocess.call(['TICCL-anahash','--alph',os.path.abspath(alphabetfile),'--artifrq',str(artifrq),wordlist,'--ngrams'], cwd=tmpdir) != 0:
+            raise Exception("TICCL-anahash failed on " + lexiconfile)
+        count = build(wordlist + ".anahash", alphabetfile, outputfile)
+        print("Compiled " + lexiconfile + " (" + str(count) + " words) into " + outputfile, file=sys.stderr)
+    finally:
+        for filename in glob.glob(os.path.join(tmpdir,'*')):
+            os.unlink(filename)
+        os.rmdir(tmpdir)
+
+def compiledata(datadir, artifrq):
+    """Compiles indices for all lexicons in a data directory ($datadir/int/$lang/*.dict, alphabet *.dict.lc.chars)"""
+    for lexiconfile in sorted(glob.glob(os.path.join(datadir, 'int', '*', '*.dict'))):
+        alphabetfile = lexiconfile + ".lc.chars"
+        if not os.path.exists(alphabetfile):
+            print("Skipping " + lexiconfile + ", no alphabet file " + alphabetfile, file=sys.stderr)
+            continue
+        compilelexicon(lexiconfile, alphabetfile, lexiconfile + ".anaidx", artifrq)
+
+def split(index, cleanfile, hashedfile, unhashedfile):
+    """Splits a clean word frequency list into an anagram hash list for all words in the index, and a word frequency list
+    of the remaining words. The list is streamed: every word is looked up in the (memory-mapped) index on its own."""
+    unhashed = 0
+    def records():
+        nonlocal unhashed
+        #the lines of the words that are not in the index retain the frequency list format (and order) for TICCL-anahash
+        with open(cleanfile,'r',encoding='utf-8') as f, open(unhashedfile,'w',encoding='utf-8') as out:
+            for line in f:
+                word = line.split('\t',1)[0].rstrip('\n')
+                if not word:
+                    continue
+                anahash = index.lookup(word)
+                if anahash is None:
+                    out.write(line)
+                    unhashed += 1
+                else:
+                    yield anahash, "", word
+    writeanahash(hashedfile, sortedanahashes(records()))
+    return unhashed
+
+def writeanahash(filename, anahashes):
+    """Writes (hash, [words]) tuples, in numerical order of the hash, in TICCL-anahash format"""
+    with open(filename,'w',encoding='utf-8') as out:
+        for anahash, words in anahashes:
+            out.write(anahash + ANAHASHSEPARATOR + WORDSEPARATOR.join(words) + "\n")
+
+def merge(filenames, outputfile):
+    """Merges anagram hash lists, joining the words of identical hashes in order of appearance (a word that occurs in
+    multiple lists is written once)"""
+    def records():
+        for fileno, filename in enumerate(filenames):
+            for lineno, (anahash, words) in enumerate(readanahash(filename)):
+                for wordno, word in enumerate(words):
+                    yield anahash, "%04d%012d%06d" % (fileno, lineno, wordno), word
+    writeanahash(outputfile, sortedanahashes(records()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-computed anagram hash index of a lexicon", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    compileparser = subparsers.add_parser('compile', help="Build indices for all lexicons in a data directory, or for a single lexicon")
+    compileparser.add_argument('--lexicon', type=str, help="Compile a single lexicon (*.dict) rather than an entire data directory", action='store')
+    compileparser.add_argument('--alphabet', type=str, help="Alphabet file for --lexicon (defaults to *.dict.lc.chars)", action='store')
+    compileparser.add_argument('--artifrq', type=int, help="Artificial frequency of lexicon words (as in TICCL)", action='store', default=10000000)
+    compileparser.add_argument('datadir', nargs='?', help="Data directory (containing int/LANG/)", default="data")
+    splitparser = subparsers.add_parser('split', help="Split a clean word list into hashed and unhashed words")
+    splitparser.add_argument('--index', type=str, help="Lexicon index", action='store', required=True)
+    splitparser.add_argument('--alphabet', type=str, help="Alphabet file, must be the one the index was compiled with", action='store', required=True)
+    splitparser.add_argument('--hashed', type=str, help="Output anagram hash list for the words in the index", action='store', required=True)
+    splitparser.add_argument('--unhashed', type=str, help="Output word frequency list of the words not in the index", action='store', required=True)
+    splitparser.add_argument('clean', help="Clean word frequency list (from TICCL-unk)")
+    mergeparser = subparsers.add_parser('merge', help="Merge anagram hash lists")
+    mergeparser.add_argument('-o','--output', type=str, help="Output file", action='store', required=True)
+    mergeparser.add_argument('files', nargs='+', help="Anagram hash lists")
+    lookupparser = subparsers.add_parser('lookup', help="Look up the anagram hash of words")
+    lookupparser.add_argument('--index', type=str, help="Lexicon index", action='store', required=True)
+    lookupparser.add_argument('words', nargs='+', help="Words to look up")
+    args = parser.parse_args()
+
+    if args.command == 'compile':
+        if args.lexicon:
+            compilelexicon(args.lexicon, args.alphabet if args.alphabet else args.lexicon + ".lc.chars", args.lexicon + ".anaidx", args.artifrq)
+        else:
+            compiledata(args.datadir, args.artifrq)
+    elif args.command == 'split':
+        with LexiconIndex(args.index) as index:
+            if not index.checkalphabet(args.alphabet):
+                print("ERROR: Lexicon index " + args.index + " was compiled with a different alphabet, recompile it",file=sys.stderr)
+                sys.exit(3)
+            count = split(index, args.clean, args.hashed, args.unhashed)
+        print("Words not in lexicon index: " + str(count), file=sys.stderr)
+    elif args.command == 'merge':
+        merge(args.files, args.output)
+    elif args.command == 'lookup':
+        with LexiconIndex(args.index) as index:
+            for word in args.words:
+                anahash = index.lookup(word)
+                print(word + "\t" + (anahash if anahash is not None else "-"))
+    else:
+        parser.print_help()
+        sys.exit(2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+#-*- coding:utf-8 -*-
+
+#Merges the partial outputs of sharded TICCL tasks (ticcl.nf --shards) into a single file, in a canonical order
+#so the result does not depend on the number of shards nor on the order in which tasks finished:
+#
+# * By default, all lines are sorted (byte order) and duplicates are removed (for *.ldcalc lists)
+# * With --index, lines are of the form key#value,value,... (as in *.indexNT) and the values of lines sharing the same
+#   key (which end up in different shards when the foci are partitioned) are joined into one line, values ordered numerically
+#
+#Sorting is delegated to sort(1), which resorts to external merging for large files, the rest is streamed.
+
+import os
+import argparse
+import subprocess
+
+
+def sortedlines(filenames, unique=False, key=None):
+    """Yields the lines of all files, sorted in byte order, by invoking sort(1)"""
+    cmd = ['sort']
+    if unique:
+        cmd.append('-u')
+    if key:
+        cmd += ['-t', key, '-k1,1']
+    env = dict(os.environ, LC_ALL='C')
+    sortprocess = subprocess.Popen(cmd + list(filenames), stdout=subprocess.PIPE, env=env)
+    for line in sortprocess.stdout:
+        yield line.rstrip(b'\n')
+    if sortprocess.wait() != 0:
+        raise Exception("sort failed")
+
+def valuekey(value):
+    """Sort key for values in an index line, numerical values are sorted numerically"""
+    try:
+        return (0, int(value), value)
+    except ValueError:
+        return (1, 0, value)
+
+def mergeindex(lines):
+    """Joins consecutive lines with the same key (lines must be sorted on the key)"""
+    previouskey = None
+    values = set()
+    for line in lines:
+        if not line:
+            continue
+        key, _, value = line.partition(b'#')
+        if key != previouskey:
+            if previouskey is not None:
+                yield previouskey + b'#' + b','.join(sorted(values, key=valuekey))
+            previouskey = key
+            values = set()
+        values.update(v for v in value.split(b',') if v)
+    if previouskey is not None:
+        yield previouskey + b'#' + b','.join(sorted(values, key=valuekey))
+
+def main():
+    parser = argparse.ArgumentParser(description="Merges the partial outputs of sharded TICCL tasks", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-o','--output', type=str,help="Output file", action='store',required=True)
+    parser.add_argument('--index', help="Input files are indices (key#value,value,...), join values of identical keys", action='store_true')
+    parser.add_argument('files', nargs='+', help='Partial outputs to merge')
+    args = parser.parse_args()
+
+    files = [ filename for filename in args.files if os.path.getsize(filename) > 0 ]
+    with open(args.output,'wb') as out:
+        if files:
+            if args.index:
+                lines = mergeindex(sortedlines(files, key='#'))
+            else:
+                lines = sortedlines(files, unique=True)
+            for line in lines:
+                out.write(line + b'\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+#-*- coding:utf-8 -*-
+
+#Generates a synthetic corpus of controlled size for benchmarking (see benchmark.sh), without any downloads beyond the
+#PICCL data: documents consist of words drawn from the lexicon of a language (weighted by their frequency), in which
+#OCR-style errors are injected by applying the character confusions of the language's *.confusion list at a given rate.
+#
+#The corpus is written as plain text documents (doc00001.txt), FoLiA documents with the same text in class OCR
+#(doc00001.folia.xml), and optionally as rendered page images (doc00001_0001.tif) for benchmarking OCR. Rendering
+#requires Pillow. A seed makes the corpus reproducible, so benchmark results of different runs can be compared.
+
+import sys
+import os
+import random
+import argparse
+
+import foliaassemble #resides alongside this script
+
+#fallback confusions if no confusion list is available
+CONFUSIONS = [('m','rn'), ('rn','m'), ('e','c'), ('c','e'), ('l','1'), ('i','l'), ('n','ii'), ('h','b'), ('o','0'), ('u','n'), ('f','s'), ('s','f'), ('d','cl'), ('a','o')]
+
+
+def readlexicon(filename, maxwords=100000):
+    """Reads the words and frequencies from a lexicon (*.dict: word, tab, frequency), returns (words, weights)"""
+    words = []
+    weights = []
+    with open(filename,'r',encoding='utf-8',errors='replace') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            word = fields[0].strip()
+            if not word or ' ' in word or '_' in word:
+                continue
+            try:
+                weight = int(fields[1]) if len(fields) > 1 else 1
+            except ValueError:
+                weight = 1
+            words.append(word)
+            weights.append(max(weight, 1))
+            if len(words) >= maxwords:
+                break
+    if not words:
+        raise ValueError("No words found in " + filename)
+    return words, weights
+
+def readconfusions(filename):
+    """Reads the character confusions from a TICCL confusion list (lines ending in a pattern like a~b or rn~m), returns
+    a list of (original, replacement) tuples in both directions"""
+    confusions = set()
+    with open(filename,'r',encoding='utf-8',errors='replace') as f:
+        for line in f:
+            pattern = line.strip().split('#')[-1]
+            if pattern.count('~') != 1:
+                continue
+            left, right = pattern.split('~')
+            if left and right and left != right and '*' not in pattern:
+                confusions.add((left, right))
+                confusions.add((right, left))
+    return sorted(confusions)
+
+def corrupt(word, confusions, rng):
+    """Applies a random applicable confusion to a word, returns the word unchanged if none applies"""
+    applicable = [ (original, replacement) for original, replacement in confusions if original in word ]
+    if not applicable:
+        return word
+    original, replacement = rng.choice(applicable)
+    positions = [ i for i in range(len(word)) if word.startswith(original, i) ]
+    i = rng.choice(positions)
+    return word[:i] + replacement + word[i+len(original):]
+
+def paragraphs(words, weights, confusions, wordcount, errorrate, rng):
+    """Yields paragraphs (lists of words) for a document of the given number of words"""
+    remaining = wordcount
+    while remaining > 0:
+        size = min(remaining, rng.randint(40, 200))
+        paragraph = rng.choices(words, weights=weights, k=size)
+        for i, word in enumerate(paragraph):
+            if rng.random() < errorrate:
+                paragraph[i] = corrupt(word, confusions, rng)
+        paragraph[0] = paragraph[0][:1].upper() + paragraph[0][1:]
+        paragraph[-1] += "."
+        yield paragraph
+        remaining -= size
+
+def wrap(paragraph, width):
+    """Wraps the words of a paragraph into lines of at most width characters"""
+    lines = []
+    line = ""
+    for word in paragraph:
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = line + " " + word if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+def render(textparagraphs, prefix, font, linesperpage=45, width=60):
+    """Renders the paragraphs of a document to page images (prefix_0001.tif etc), returns the number of pages"""
+    from PIL import Image, ImageDraw
+    lines = []
+    for paragraph in textparagraphs:
+        lines += wrap(paragraph, width) + [""]
+    pages = [ lines[i:i+linesperpage] for i in range(0, len(lines), linesperpage) ]
+    for pagenr, pagelines in enumerate(pages, 1):
+        image = Image.new('L', (1700, 2200), 255) #A4 at 200 DPI
+        draw = ImageDraw.Draw(image)
+        for i, line in enumerate(pagelines):
+            draw.text((150, 150 + i * 42), line, fill=0, font=font)
+        image.save(prefix + "_%04d.tif" % pagenr, compression="tiff_lzw", dpi=(200,200))
+    return len(pages)
+
+def loadfont(fontfile, size=28):
+    from PIL import ImageFont
+    if fontfile:
+        return ImageFont.truetype(fontfile, size)
+    try:
+        return ImageFont.load_default(size=size) #Pillow >= 10.1
+    except TypeError:
+        return ImageFont.load_default()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic corpus with OCR-style errors for benchmarking", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-l','--lexicon', type=str,help="Lexicon to draw words from (*.dict)", action='store',required=True)
+    parser.add_argument('-c','--confusion', type=str,help="Character confusion list (*.confusion), defaults to a built-in list of common OCR confusions", action='store')
+    parser.add_argument('-n','--documents', type=int,help="Number of documents", action='store',default=10)
+    parser.add_argument('-w','--words', type=int,help="Number of words per document", action='store',default=10000)
+    parser.add_argument('-e','--errorrate', type=float,help="Fraction of words with an injected OCR error", action='store',default=0.05)
+    parser.add_argument('-f','--formats', type=str,help="Formats to output (comma separated): txt, folia, tif", action='store',default="txt,folia")
+    parser.add_argument('-O','--outputdir', type=str,help="Output directory (one subdirectory per format is created)", action='store',default=".")
+    parser.add_argument('-s','--seed', type=int,help="Random seed", action='store',default=1)
+    parser.add_argument('--font', type=str,help="TrueType font for rendering page images", action='store')
+    args = parser.parse_args()
+
+    formats = args.formats.split(',')
+    words, weights = readlexicon(args.lexicon)
+    confusions = readconfusions(args.confusion) if args.confusion else CONFUSIONS
+    if not confusions:
+        print("No usable confusions in " + args.confusion + ", using the built-in list", file=sys.stderr)
+        confusions = CONFUSIONS
+    font = None
+    if 'tif' in formats:
+        try:
+            font = loadfont(args.font)
+        except ImportError:
+            print("Rendering page images requires Pillow (pip install pillow)", file=sys.stderr)
+            sys.exit(3)
+
+    for fmt in formats:
+        os.makedirs(os.path.join(args.outputdir, fmt), exist_ok=True)
+    rng = random.Random(args.seed)
+    pagecount = 0
+    for docnr in range(1, args.documents + 1):
+        docid = "doc%05d" % docnr
+        textparagraphs = list(paragraphs(words, weights, confusions, args.words, args.errorrate, rng))
+        textfile = os.path.join(args.outputdir, 'txt' if 'txt' in formats else '.', docid + ".txt")
+        with open(textfile,'w',encoding='utf-8') as f:
+            f.write("\n\n".join( " ".join(paragraph) for paragraph in textparagraphs ) + "\n")
+        if 'folia' in formats:
+            with open(os.path.join(args.outputdir, 'folia', docid + ".folia.xml"),'w',encoding='utf-8') as out:
+                foliaassemble.assemble(out, docid, [textfile])
+        if 'tif' in formats:
+            pagecount += render(textparagraphs, os.path.join(args.outputdir, 'tif', docid), font)
+        if 'txt' not in formats:
+            os.unlink(textfile)
+    print("Generated " + str(args.documents) + " documents of " + str(args.words) + " words" + ((" (" + str(pagecount) + " pages)") if pagecount else "") + " in " + args.outputdir, file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+#-*- coding:utf-8 -*-
+
+#OCRs a batch of page images with a single Tesseract engine, so the language model is loaded only once per batch
+#rather than once per page (ocr.nf --ocrbatch). Like a regular tesseract run, it writes one hOCR file per page image,
+#named after the image ($basename.hocr).
+#
+#If the tesserocr Python binding is available, the pages are processed through the Tesseract API directly. Otherwise,
+#tesseract is invoked once with a list of all images, and its combined hOCR output is split into pages.
+
+import sys
+import os
+import re
+import argparse
+import subprocess
+import tempfile
+
+HOCRHEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"
+    "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">
+ <head>
+  <title></title>
+  <meta http-equiv="Content-Type" content="text/html;charset=utf-8"/>
+  <meta name='ocr-system' content='tesseract' />
+  <meta name='ocr-capabilities' content='ocr_page ocr_carea ocr_par ocr_line ocrx_word'/>
+ </head>
+ <body>
+"""
+HOCRFOOTER = """ </body>
+</html>
+"""
+
+PAGESTART = re.compile(r"<div class=['\"]ocr_page['\"]")
+BODYEND = re.compile(r"</body>")
+
+
+def outputname(image, outputdir):
+    return os.path.join(outputdir, os.path.splitext(os.path.basename(image))[0] + ".hocr")
+
+def writepage(image, outputdir, page, header=HOCRHEADER):
+    with open(outputname(image, outputdir),'w',encoding='utf-8') as f:
+        f.write(header + page.rstrip() + "\n" + HOCRFOOTER)
+
+def ocr_api(images, language, outputdir):
+    """OCRs the images through the Tesseract API (tesserocr), one engine for all pages"""
+    import tesserocr #pylint: disable=import-error
+    with tesserocr.PyTessBaseAPI(lang=language) as api:
+        for image in images:
+            api.SetImageFile(image)
+            writepage(image, outputdir, api.GetHOCRText(0))
+
+def splitpages(hocr):
+    """Splits a multi-page hOCR document into its header and a list of pages"""
+    starts = [ match.start() for match in PAGESTART.finditer(hocr) ]
+    if not starts:
+        return hocr, []
+    end = BODYEND.search(hocr, starts[-1])
+    end = end.start() if end else len(hocr)
+    pages = [ hocr[begin:nextbegin] for begin, nextbegin in zip(starts, starts[1:] + [end]) ]
+    return hocr[:starts[0]], pages
+
+def ocr_list(images, language, outputdir):
+    """OCRs the images with a single tesseract invocation on a list of all images, returns False if the output could not be split per image"""
+    tmpdir = tempfile.mkdtemp(dir=outputdir)
+    try:
+        listfile = os.path.join(tmpdir, "images.txt")
+        with open(listfile,'w',encoding='utf-8') as f:
+            for image in images:
+                f.write(os.path.abspath(image) + "\n")
+        if subprocess.call(['tesseract', listfile, os.path.join(tmpdir,'batch'), '-c', 'tessedit_create_hocr=T', '-l', language]) != 0:
+            return False
+        with open(os.path.join(tmpdir,'batch.hocr'),'r',encoding='utf-8') as f:
+            header, pages = splitpages(f.read())
+        if len(pages) != len(images):
+            #e.g. multi-page images, we can't tell which page belongs to which image
+            print("Batch output has " + str(len(pages)) + " pages for " + str(len(images)) + " images", file=sys.stderr)
+            return False
+        for image, page in zip(images, pages):
+            writepage(image, outputdir, page, header)
+        return True
+    finally:
+        for filename in os.listdir(tmpdir):
+            os.unlink(os.path.join(tmpdir, filename))
+        os.rmdir(tmpdir)
+
+def ocr_single(images, language, outputdir):
+    """OCRs the images one by one (the regular way, as a last resort)"""
+    for image in images:
+        if subprocess.call(['tesseract', image, os.path.splitext(outputname(image, outputdir))[0], '-c', 'tessedit_create_hocr=T', '-l', language]) != 0:
+            print("Tesseract failed on " + image, file=sys.stderr)
+            return False
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="OCRs a batch of page images with a single Tesseract engine, producing one hOCR file per image", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-l','--language', type=str,help="Tesseract language (model)", action='store',required=True)
+    parser.add_argument('-O','--outputdir', type=str,help="Output directory", action='store',default=".")
+    parser.add_argument('images', nargs='+', help='Page images')
+    args = parser.parse_args()
+
+    try:
+        ocr_api(args.images, args.language, args.outputdir)
+        return
+    except ImportError:
+        pass
+    except Exception as e: #pylint: disable=broad-except
+        print("Tesseract API failed (" + str(e) + "), falling back to the tesseract tool", file=sys.stderr)
+    if not ocr_list(args.images, args.language, args.outputdir):
+        if not ocr_single(args.images, args.language, args.outputdir):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#-*- coding:utf-8 -*-
+
+#Merges word frequency lists (tab-separated, word in the first column and frequency in the second, as produced by
+#FoLiA-stats) into a single frequency list, summing the frequencies of words that occur in multiple lists.
+#The input lists must be sorted on the word (byte order, i.e. LC_ALL=C sort -k1,1), they are merged in a streaming
+#fashion (k-way merge) so memory usage does not depend on the size of the lists. The output is sorted on frequency
+#(descending) and follows the FoLiA-stats format: word, frequency, accumulated frequency, accumulated percentage.
+
+import sys
+import os
+import argparse
+import heapq
+import subprocess
+import tempfile
+
+
+def readfreqlist(filename):
+    """Reads a frequency list, yielding (word, frequency) tuples in file order. Lines without a frequency (such as headers) are skipped."""
+    with open(filename,'r',encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 2:
+                continue
+            try:
+                yield fields[0], int(fields[1])
+            except ValueError:
+                continue
+
+def merge(filenames):
+    """Merges sorted frequency lists, yields (word, frequency) tuples sorted on the word"""
+    previousword = None
+    total = 0
+    for word, freq in heapq.merge(*[ readfreqlist(filename) for filename in filenames ]):
+        if word == previousword:
+            total += freq
+        else:
+            if previousword is not None:
+                yield previousword, total
+            previousword = word
+            total = freq
+    if previousword is not None:
+        yield previousword, total
+
+def main():
+    parser = argparse.ArgumentParser(description="Merges word frequency lists that are sorted on the word, summing frequencies", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-o','--output', type=str,help="Output file", action='store',required=True)
+    parser.add_argument('files', nargs='+', help='Frequency lists to merge (sorted on the word)')
+    args = parser.parse_args()
+
+    #first pass: merge on word into a temporary file, and compute the total number of tokens
+    tokens = 0
+    tmpfile = tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(os.path.abspath(args.output)), delete=False)
+    try:
+        with tmpfile:
+            for word, freq in merge(args.files):
+                tmpfile.write(word + "\t" + str(freq) + "\n")
+                tokens += freq
+
+        #second pass: order on frequency (leaving it to sort, which resorts to external merging for large lists) and add the accumulated columns
+        env = dict(os.environ, LC_ALL='C')
+        sortprocess = subprocess.Popen(['sort','-t','\t','-k2,2nr','-k1,1',tmpfile.name], stdout=subprocess.PIPE, env=env)
+        accumulated = 0
+        with open(args.output,'w',encoding='utf-8') as out:
+            for line in sortprocess.stdout:
+                word, freq = line.decode('utf-8').rstrip('\n').split('\t')
+                accumulated += int(freq)
+                out.write(word + "\t" + freq + "\t" + str(accumulated) + "\t" + str(round(100 * accumulated / tokens, 6)) + "\n")
+        if sortprocess.wait() != 0:
+            print("ERROR: sort failed",file=sys.stderr)
+            sys.exit(1)
+    finally:
+        os.unlink(tmpfile.name)
+
+if __name__ == '__main__':
+    main()
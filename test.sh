@@ -134,6 +134,47 @@ if [[ "$TEST" == "ticcl-eng" ]] || [[ "$TEST" == "all" ]] || [[ "$TEST" == "tmp2
     checkfolia ticcl_output/OllevierGeets.ticcl.folia.xml
 fi
 
+if [[ "$TEST" == "ocrpdf-triage-eng" ]] || [[ "$TEST" == "all" ]]; then
+    echo -e "\n\n======== Testing OCR (eng) with inputtype pdf and text layer triage ======">&2
+    #the pages of this PDF have no (usable) text layer, so all of them should be triaged for OCR
+    if [ -d ocr_output ]; then rm -Rf ocr_output; fi  #cleanup previous results if they're still lingering around
+    $PICCL/ocr.nf --inputdir corpora/PDF/ENG/ --language eng --inputtype pdf --pdftriage $WITHDOCKER || exit 2
+    checkfolia ocr_output/OllevierGeets.ocr.folia.xml
+fi
+
+if [[ "$TEST" == "ocrpdf-batch-eng" ]] || [[ "$TEST" == "all" ]]; then
+    echo -e "\n\n======== Testing OCR (eng) with inputtype pdf and batches of pages per Tesseract task ======">&2
+    if [ -d ocr_output ]; then rm -Rf ocr_output; fi  #cleanup previous results if they're still lingering around
+    $PICCL/ocr.nf --inputdir corpora/PDF/ENG/ --language eng --inputtype pdf --ocrbatch 2 $WITHDOCKER || exit 2
+    checkfolia ocr_output/OllevierGeets.folia.xml
+fi
+
+if [[ "$TEST" == "ocrpdf-rasterpages-eng" ]] || [[ "$TEST" == "all" ]]; then
+    echo -e "\n\n======== Testing OCR (eng) with inputtype pdf, rasterised one page per task ======">&2
+    if [ -d ocr_output ]; then rm -Rf ocr_output; fi  #cleanup previous results if they're still lingering around
+    $PICCL/ocr.nf --inputdir corpora/PDF/ENG/ --language eng --inputtype pdf --rasterpages 1 $WITHDOCKER || exit 2
+    checkfolia ocr_output/OllevierGeets.folia.xml
+fi
+
+if [[ "$TEST" == "piccl-eng" ]] || [[ "$TEST" == "all" ]]; then
+    echo -e "\n\n======== Testing combined OCR and TICCL (eng) =========">&2
+    if [ -d ocr_output ]; then rm -Rf ocr_output; fi
+    if [ -d ticcl_output ]; then rm -Rf ticcl_output; fi
+    $PICCL/piccl.nf --inputdir corpora/PDF/ENG/ --language eng --inputtype pdf --lexicon data/int/eng/eng.aspell.dict --alphabet data/int/eng/eng.aspell.dict.lc.chars --charconfus data/int/eng/eng.aspell.dict.c0.d2.confusion $WITHDOCKER || exit 2
+    checkfolia ocr_output/OllevierGeets.folia.xml
+    checkfolia ticcl_output/OllevierGeets.ticcl.folia.xml
+fi
+
+if [[ "$TEST" == "piccl-nld" ]] || [[ "$TEST" == "all" ]]; then
+    echo -e "\n\n======== Testing combined OCR, TICCL and Frog (nld) =========">&2
+    if [ -d ocr_output ]; then rm -Rf ocr_output; fi
+    if [ -d ticcl_output ]; then rm -Rf ticcl_output; fi
+    if [ -d frog_output ]; then rm -Rf frog_output; fi
+    $PICCL/piccl.nf --inputdir corpora/TIFF/NLD/ --language nld --inputtype tif --lexicon data/int/nld/nld.aspell.dict --alphabet data/int/nld/nld.aspell.dict.lc.chars --charconfus data/int/nld/nld.aspell.dict.c20.d2.confusion --frog $WITHDOCKER || exit 2
+    checkfolia ticcl_output/dpo.ticcl.folia.xml
+    checkfolia frog_output/dpo.frogged.folia.xml
+fi
+
 if [[ "$TEST" == "ocrtif-nld" ]] || [[ "$TEST" == "ticcl-nld" ]] || [[ "$TEST" == "all" ]]; then
     echo -e "\n\n======== Testing OCR (nld) with inputtype tif ==========">&2
     if [ -d ocr_output ]; then rm -Rf ocr_output; fi  #cleanup previous results if they're still lingering around
@@ -193,6 +234,59 @@ if [[ "$TEST" == "ticcltxt-eng" ]] || [[ "$TEST" == "all" ]]; then
     checkfolia ticcl_output/ticcltest.ticcl.folia.xml
 fi
 
+if [[ "$TEST" == "ticcl-incremental-eng" ]] || [[ "$TEST" == "all" ]]; then
+    echo -e "\n\n======== Testing TICCL with incremental frequency lists (eng) =========">&2
+    if [ -d ticcl_output ]; then rm -Rf ticcl_output; fi
+    if [ -d freqlistcache ]; then rm -Rf freqlistcache; fi
+    #run twice, the second run should take the per-document frequency lists from the cache
+    for i in 1 2; do
+        $PICCL/ticcl.nf --inputdir text_input_ticcl/ --inputtype text --incremental --freqlistcache freqlistcache --lexicon data/int/eng/eng.aspell.dict --alphabet data/int/eng/eng.aspell.dict.lc.chars --charconfus data/int/eng/eng.aspell.dict.c0.d2.confusion $WITHDOCKER || exit 2
+    done
+    checkfolia ticcl_output/ticcltest.ticcl.folia.xml
+fi
+
+if [[ "$TEST" == "ticcl-shards-eng" ]] || [[ "$TEST" == "all" ]]; then
+    echo -e "\n\n======== Testing TICCL with sharded indexing and resolving (eng) =========">&2
+    if [ -d ticcl_output ]; then rm -Rf ticcl_output; fi
+    $PICCL/ticcl.nf --inputdir text_input_ticcl/ --inputtype text --shards 3 --lexicon data/int/eng/eng.aspell.dict --alphabet data/int/eng/eng.aspell.dict.lc.chars --charconfus data/int/eng/eng.aspell.dict.c0.d2.confusion $WITHDOCKER || exit 2
+    checkfolia ticcl_output/ticcltest.ticcl.folia.xml
+fi
+
+if [[ "$TEST" == "ticcl-chunks-eng" ]] || [[ "$TEST" == "all" ]]; then
+    echo -e "\n\n======== Testing TICCL with chunked text input (eng) =========">&2
+    if [ -d ticcl_output ]; then rm -Rf ticcl_output; fi
+    if [ -d text_input_chunks ]; then rm -Rf text_input_chunks; fi
+    #a text document of a few megabytes, which is split into chunks of one megabyte and reassembled after correction
+    mkdir -p text_input_chunks || exit 3
+    for i in $(seq 1 3000); do cat text_input_ticcl/ticcltest.txt; echo; done > text_input_chunks/chunktest.txt
+    $PICCL/ticcl.nf --inputdir text_input_chunks/ --inputtype text --chunksize 1 --lexicon data/int/eng/eng.aspell.dict --alphabet data/int/eng/eng.aspell.dict.lc.chars --charconfus data/int/eng/eng.aspell.dict.c0.d2.confusion $WITHDOCKER || exit 2
+    checkfolia ticcl_output/chunktest.ticcl.folia.xml
+fi
+
+if [[ "$TEST" == "ticcl-correctbatch-eng" ]] || [[ "$TEST" == "all" ]]; then
+    echo -e "\n\n======== Testing TICCL with correction in batches of documents (eng) =========">&2
+    if [ -d ticcl_output ]; then rm -Rf ticcl_output; fi
+    if [ -d text_input_correctbatch ]; then rm -Rf text_input_correctbatch; fi
+    #two documents, corrected in separate FoLiA-correct tasks
+    mkdir -p text_input_correctbatch || exit 3
+    cp text_input_ticcl/ticcltest.txt text_input_correctbatch/ticcltest1.txt || exit 3
+    cp text_input_ticcl/ticcltest.txt text_input_correctbatch/ticcltest2.txt || exit 3
+    $PICCL/ticcl.nf --inputdir text_input_correctbatch/ --inputtype text --correctbatch 1 --lexicon data/int/eng/eng.aspell.dict --alphabet data/int/eng/eng.aspell.dict.lc.chars --charconfus data/int/eng/eng.aspell.dict.c0.d2.confusion $WITHDOCKER || exit 2
+    checkfolia ticcl_output/ticcltest1.ticcl.folia.xml
+    checkfolia ticcl_output/ticcltest2.ticcl.folia.xml
+fi
+
+if [[ "$TEST" == "piccl-shards-incremental-eng" ]] || [[ "$TEST" == "all" ]]; then
+    echo -e "\n\n======== Testing combined workflow with sharding and incremental frequency lists (eng) =========">&2
+    if [ -d ticcl_output ]; then rm -Rf ticcl_output; fi
+    if [ -d freqlistcache ]; then rm -Rf freqlistcache; fi
+    #run twice, the second run should take the per-document frequency lists from the cache
+    for i in 1 2; do
+        $PICCL/piccl.nf --inputdir text_input_ticcl/ --inputtype text --language eng --shards 3 --incremental --freqlistcache freqlistcache --lexicon data/int/eng/eng.aspell.dict --alphabet data/int/eng/eng.aspell.dict.lc.chars --charconfus data/int/eng/eng.aspell.dict.c0.d2.confusion $WITHDOCKER || exit 2
+    done
+    checkfolia ticcl_output/ticcltest.ticcl.folia.xml
+fi
+
 #TODO: this test should be enabled with a proper PDF that contains text
 #if [[ "$TEST" == "ticclpdftxt-eng" ]] || [[ "$TEST" == "all" ]]; then
 #    echo -e "\n\n======== Testing TICCL with PDF input (text; no OCR) (eng) =========">&2
@@ -27,7 +27,11 @@ params.clip = 1
 params.low = 5
 params.high = 35
 params.chainclean = 0
+params.correctbatch = 0
+params.chunksize = 0
 params.ngram = 1
+params.shards = 1
+params.publishmode = "copy"
 
 //Output usage information if --help is specified
 if (params.containsKey('help')) {
@@ -47,14 +51,29 @@ if (params.containsKey('help')) {
     log.info "  --inputclass CLASS       FoLiA text class to use for input, defaults to 'current' for FoLiA input; must be set to 'OCR' for FoLiA documents produced by ocr.nf"
     log.info "  --outputclass CLASS      FoLiA text class to use for output, defaults to 'current' for FoLiA output, but may not be equal to the class used for --inputclass"
     log.info "  --inputtype STR          Input type can be either 'folia' (default), 'text', or 'pdf' (i.e. pdf with text; no OCR)"
+    log.info "  --chunksize MB           Split text (and PDF) documents larger than this many megabytes into chunks at paragraph or page"
+    log.info "                           boundaries, which are processed in parallel and reassembled at the end (default: 0, no splitting)"
     log.info "  --virtualenv PATH        Path to Virtual Environment to load (usually path to LaMachine)"
+    log.info "  --lexiconindex FILE      Pre-computed anagram hash index of the lexicon (default: lexicon + .anaidx, if it exists; see scripts/lexiconindex.py)"
     log.info "  --artifrq INT            Default value for missing frequencies in the validated lexicon (default: 10000000)"
     log.info "  --distance INT           Levenshtein/edit distance (default: 2)"
     log.info "  --clip INT               Limit the number of variants per word (default: 10)"
     log.info "  --corpusfreqlist FILE    Corpus frequency list (skips the first step that would compute one for you)"
+    log.info "  --incremental            Compute the corpus frequency list incrementally: frequency lists are stored per document and only computed for new or changed documents"
+    log.info "  --freqlistcache DIR      Directory where per-document frequency lists are stored in incremental mode (default: .wordfreqlists in the input directory)"
+    log.info "  --rankedlist FILE        Ranked variant list from an earlier run on the same corpus (skips all steps up to FoLiA-correct, requires --unk and --punct)"
+    log.info "  --unk FILE               Unknown word list (*.unk) belonging to --rankedlist"
+    log.info "  --punct FILE             Punctuation map (*.punct) belonging to --rankedlist"
     log.info "  --low INT                skip entries from the anagram file shorter than 'low' characters. (default=5)"
     log.info "  --high INT               skip entries from the anagram file longer than 'high' characters. (default=35)"
+    log.info "  --shards INT             split indexing and resolving into this many tasks, which may run on different nodes (default=1)"
     log.info "  --chainclean BOOLINT     enable chain clean or not (1 = on, 0 = off, default)"
+    log.info "  --correctbatch INT       correct the documents in batches of this many documents per FoLiA-correct task, which may run on"
+    log.info "                           different nodes and pass on their output as soon as they are done (default=0, all documents in one task)"
+    log.info "  --publishmode MODE       How output is published to the output directories: copy [default], link (hard links, the output"
+    log.info "                           directories must be on the same filesystem as the work directory), symlink or move"
+    log.info "  --nointermediate         Do not publish intermediate TICCL output (anagram hashes, indices, confusion lists, uncorrected"
+    log.info "                           documents), only the final documents and the lists needed to reuse a run (see --rankedlist)"
     log.info "  --nofoliacorrect         skip the FoLiA correct step"
     log.info "  --nostringlinking        skip the final string linking step"
     exit 2
@@ -82,7 +101,44 @@ if (!params.containsKey('charconfus')) {
     log.info "Error: Missing --charconfus parameter, see --help for usage details"
     exit 2
 }
+if (params.containsKey('rankedlist') && (!params.containsKey('unk') || !params.containsKey('punct'))) {
+    log.info "Error: The --rankedlist parameter also requires --unk and --punct, see --help for usage details"
+    exit 2
+}
+
+//Use the pre-computed anagram hash index of the lexicon (see scripts/lexiconindex.py) if there is one
+if (params.containsKey('lexiconindex')) {
+    lexiconindex = new File(params.lexiconindex).getAbsolutePath()
+} else if (params.lexicon && new File(params.lexicon + ".anaidx").exists()) {
+    lexiconindex = new File(params.lexicon + ".anaidx").getAbsolutePath()
+} else {
+    lexiconindex = ""
+}
+
+
+def filehash(path, salt) {
+    //Computes a SHA-256 hash of the contents of a file (plus some salt), reading it in blocks rather than all at once
+    def digest = java.security.MessageDigest.getInstance("SHA-256")
+    path.withInputStream { stream ->
+        byte[] buffer = new byte[1048576]
+        int n
+        while ((n = stream.read(buffer)) > 0) {
+            digest.update(buffer, 0, n)
+        }
+    }
+    digest.update(salt.getBytes("UTF-8"))
+    return digest.digest().encodeHex().toString()
+}
+
+def ischunk(filename) {
+    //Is this file (derived from) a chunk of a large text document, as split by scripts/chunktext.py?
+    return (new File(filename.toString()).getName() =~ /_chunk[0-9]{5}\./).find()
+}
 
+def chunkdocument(filename) {
+    //Returns the name of the document a chunk belongs to
+    return new File(filename.toString()).getName().replaceAll(/_chunk[0-9]{5}\..*/, "")
+}
 
 //Initialise channels from various input files specified in parameters, these will be consumed as input by a process later on
 lexicon = Channel.fromPath(params.lexicon).ifEmpty("Lexicon file not found")
@@ -131,13 +187,42 @@ if (params.inputtype == "folia") {
 }
 
 if ((params.inputtype == "text") || (params.inputtype == "pdf")) { //(pdf will have been converted to text by prior process)
+    if (params.chunksize > 0) {
+        //split documents that exceed the chunk size into chunks that are processed in parallel (and reassembled after correction), smaller documents are passed on as they are
+        chunkbytes = (params.chunksize as long) * 1024 * 1024
+        textdocuments.into { textdocuments_whole; textdocuments_tosplit }
+
+        process chunktext {
+            /*
+                Split a large text document into chunks at paragraph or page boundaries
+            */
+
+            input:
+            file textdocument from textdocuments_tosplit.filter { it.size() > chunkbytes }
+            val chunkbytes from chunkbytes
+
+            output:
+            file "${textdocument.baseName}_chunk*.txt" into textchunks
+
+            script:
+            """
+            #!/bin/bash
+            python3 ${baseDir}/scripts/chunktext.py -s ${chunkbytes} "${textdocument}" || exit 1
+            """
+        }
+
+        textdocuments_whole.filter { it.size() <= chunkbytes }.mix(textchunks.flatten()).set { textunits }
+    } else {
+        textunits = textdocuments
+    }
+
     process txt2folia {
         /*
              Convert txt to FoLiA with FoLiA-txt
         */
 
         input:
-        file textdocument from textdocuments
+        file textdocument from textunits
         val virtualenv from params.virtualenv
 
         output:
@@ -167,316 +252,543 @@ if ((params.inputtype == "text") || (params.inputtype == "pdf")) { //(pdf will h
 //fork the above output channel into two so it can be used as input by two processes  (a channel is consumed upon input)
 folia_ocr_documents.into { folia_ocr_documents_forcorpusfrequency; folia_ocr_documents_forfoliacorrect }
 
-if (params.containsKey('corpusfreqlist')) {
-    //a corpus frequency is list explicitly provided as parameter, set up a channel
-    corpusfreqlist = Channel.fromPath(params.corpusfreqlist)
+if (params.containsKey('rankedlist')) {
+    //a ranked variant list is explicitly provided (e.g. from an earlier run on the very same corpus), along with the
+    //unknown word list and punctuation map that go with it, so we can skip all TICCL steps up to and including ranking
+    rankedlist_chained_cleaned = Channel.fromPath(params.rankedlist).ifEmpty("Ranked list not found")
+    unknownfreqlist = Channel.fromPath(params.unk).ifEmpty("Unknown word list not found")
+    punctuationmap = Channel.fromPath(params.punct).ifEmpty("Punctuation map not found")
 } else {
-    //no corpus frequency list is provided, so we compute one with FoLiA-stats
+    if (params.containsKey('corpusfreqlist')) {
+        //a corpus frequency is list explicitly provided as parameter, set up a channel
+        corpusfreqlist = Channel.fromPath(params.corpusfreqlist)
+    } else if (params.containsKey('incremental')) {
+        //no corpus frequency list is provided, so we compute one incrementally: frequency lists are computed per document and
+        //stored in a permanent cache, keyed by a hash of the document's contents (and the parameters that affect the counts),
+        //so only new or changed documents are counted again. The lists are then merged into a single corpus frequency list.
+
+        freqlistcache = params.containsKey('freqlistcache') ? params.freqlistcache : params.inputdir + "/.wordfreqlists"
+
+        folia_ocr_documents_forcorpusfrequency
+            .map { document -> tuple(filehash(document, inputclass + "\t" + params.ngram), document) }
+            .set { folia_ocr_documents_hashed }
+
+        process documentfrequency {
+            /*
+                Process a single document into a frequency list (with FoLiA-stats), sorted on the word so it can be merged later
+            */
+
+            storeDir freqlistcache //permanent cache, the process is skipped if the output already exists there
+
+            input:
+            set val(hash), file("doc." + params.extension) from folia_ocr_documents_hashed
+            val virtualenv from params.virtualenv
+            val inputclass from inputclass
+            val extension from params.extension
+            val ngram from params.ngram
+
+            output:
+            file "${hash}.wordfreqlist.tsv" into documentfreqlists
+
+            script:
+            """
+            #!/bin/bash
+            #set up the virtualenv if necessary
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            FoLiA-stats --class "$inputclass" -s -t 1 -e "$extension" --lang=none --collect --max-ngram ${ngram} --separator "_" -o doc . || exit 1
+            LC_ALL=C sort -t "\t" -k1,1 doc.wordfreqlist.?to?.tsv > "${hash}.wordfreqlist.tsv" || exit 1
+            """
+        }
+
+        process mergefrequency {
+            /*
+                Merge the per-document frequency lists into a single corpus frequency list
+            */
+
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+
+            input:
+            file documentfreqlists from documentfreqlists.collect()
+
+            output:
+            file "corpus.wordfreqlist.tsv" into corpusfreqlist
+
+            script:
+            """
+            #!/bin/bash
+            python3 ${baseDir}/scripts/wordfreqmerge.py -o corpus.wordfreqlist.tsv ${documentfreqlists} || exit 1
+
+            if [ ! -s "corpus.wordfreqlist.tsv" ]; then
+                echo "ERROR: Expected output corpus.wordfreqlist.tsv does not exist or is empty">&2
+                exit 6
+            fi
+            """
+        }
+    } else {
+        //no corpus frequency list is provided, so we compute one with FoLiA-stats
+
+        process corpusfrequency {
+            /*
+                Process corpus into frequency file for TICCL (with FoLiA-stats)
+            */
+
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+
+            input:
+            file "doc*." + params.extension from folia_ocr_documents_forcorpusfrequency.collect() //collects all documents first
+            val virtualenv from params.virtualenv
+            val inputclass from inputclass
+            val extension from params.extension
+            val ngram from params.ngram
+
+            output:
+            file "corpus.wordfreqlist.tsv" into corpusfreqlist
+
+            script:
+            """
+            #!/bin/bash
+            #set up the virtualenv if necessary
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            FoLiA-stats --class "$inputclass" -s -t ${task.cpus} -e "$extension" --lang=none --collect --max-ngram ${ngram} --separator "_" -o corpus . || exit 1
+            mv corpus.wordfreqlist.?to?.tsv corpus.wordfreqlist.tsv
 
-    process corpusfrequency {
+            if [ ! -s "corpus.wordfreqlist.tsv" ]; then
+                echo "ERROR: Expected output corpus.wordfreqlist.tsv does not exist or is empty">&2
+                exit 6
+            fi
+            """
+        }
+    }
+
+    alphabet_forunk = Channel.fromPath(params.alphabet).ifEmpty("Alphabet file not found")
+
+    process ticclunk {
         /*
-            Process corpus into frequency file for TICCL (with FoLiA-stats)
+            Filter a wordfrequency list (TICCL-unk)
         */
 
-        publishDir params.outputdir, mode: 'copy', overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+        publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
 
         input:
-        file "doc*." + params.extension from folia_ocr_documents_forcorpusfrequency
+        file corpusfreqlist from corpusfreqlist //corpus frequency list in FoLiA-stats format
+        file lexicon from lexicon
+        file alphabet from alphabet_forunk
         val virtualenv from params.virtualenv
-        val inputclass from inputclass
-        val extension from params.extension
-        val ngram from params.ngram
+        val artifrq from params.artifrq
 
         output:
-        file "corpus.wordfreqlist.tsv" into corpusfreqlist
+        file "${corpusfreqlist}.clean" into corpusfreqlist_clean //cleaned wordfrequency file
+        file "${corpusfreqlist}.unk" into unknownfreqlist //unknown words list
+        file "${corpusfreqlist}.punct" into punctuationmap //list of words mapping strings with leading/trailing punctuation to clean variants
 
         script:
         """
         #!/bin/bash
-        #set up the virtualenv if necessary
         set +u
         if [ ! -z "${virtualenv}" ]; then
             source ${virtualenv}/bin/activate
         fi
         set -u
 
-        FoLiA-stats --class "$inputclass" -s -t ${task.cpus} -e "$extension" --lang=none --collect --max-ngram ${ngram} --separator "_" -o corpus . || exit 1
-        mv corpus.wordfreqlist.?to?.tsv corpus.wordfreqlist.tsv
+        TICCL-unk --background "${lexicon}" --artifrq ${artifrq} --alph "${alphabet}" "${corpusfreqlist}" || exit 1
 
-        if [ ! -s "corpus.wordfreqlist.tsv" ]; then
-            echo "ERROR: Expected output corpus.wordfreqlist.tsv does not exist or is empty">&2
+        if [ ! -s "${corpusfreqlist}.clean" ]; then
+            echo "ERROR: Expected output ${corpusfreqlist}.clean does not exist or is empty">&2
             exit 6
         fi
         """
     }
-}
 
-alphabet_forunk = Channel.fromPath(params.alphabet).ifEmpty("Alphabet file not found")
-
-process ticclunk {
-    /*
-        Filter a wordfrequency list (TICCL-unk)
-    */
-
-    publishDir params.outputdir, mode: 'copy', overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
-
-    input:
-    file corpusfreqlist from corpusfreqlist //corpus frequency list in FoLiA-stats format
-    file lexicon from lexicon
-    file alphabet from alphabet_forunk
-    val virtualenv from params.virtualenv
-    val artifrq from params.artifrq
-
-    output:
-    file "${corpusfreqlist}.clean" into corpusfreqlist_clean //cleaned wordfrequency file
-    file "${corpusfreqlist}.unk" into unknownfreqlist //unknown words list
-    file "${corpusfreqlist}.punct" into punctuationmap //list of words mapping strings with leading/trailing punctuation to clean variants
-
-    script:
-    """
-    #!/bin/bash
-    set +u
-    if [ ! -z "${virtualenv}" ]; then
-        source ${virtualenv}/bin/activate
-    fi
-    set -u
-
-    TICCL-unk --background "${lexicon}" --artifrq ${artifrq} --alph "${alphabet}" "${corpusfreqlist}" || exit 1
-
-    if [ ! -s "${corpusfreqlist}.clean" ]; then
-        echo "ERROR: Expected output ${corpusfreqlist}.clean does not exist or is empty">&2
-        exit 6
-    fi
-    """
-}
+    //fork the above output channel so it can be used as input for THREE processes
+    corpusfreqlist_clean.into { corpusfreqlist_clean_foranahash; corpusfreqlist_clean_forresolver; corpusfreqlist_clean_forindexer }
 
-//fork the above output channel so it can be used as input for THREE processes
-corpusfreqlist_clean.into { corpusfreqlist_clean_foranahash; corpusfreqlist_clean_forresolver; corpusfreqlist_clean_forindexer }
+    process anahash {
+        /*
+            Read a clean wordfrequency list , and hash all items with TICCL-anahash
+        */
 
-process anahash {
-    /*
-        Read a clean wordfrequency list , and hash all items with TICCL-anahash
-    */
+        publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { params.containsKey('nointermediate') ? null : it } //publish the output for the end-user to see (rather than deleting this intermediate output), unless --nointermediate is set
 
-    publishDir params.outputdir, mode: 'copy', overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+        input:
+        file corpusfreqlist from corpusfreqlist_clean_foranahash
+        file alphabet from alphabet
+        val virtualenv from params.virtualenv
+        val artifrq from params.artifrq
+        val lexiconindex from lexiconindex
 
-    input:
-    file corpusfreqlist from corpusfreqlist_clean_foranahash
-    file alphabet from alphabet
-    val virtualenv from params.virtualenv
-    val artifrq from params.artifrq
+        output:
+        file "${corpusfreqlist}.anahash" into anahashlist
+        file "${corpusfreqlist}.corpusfoci" into corpusfocilist
 
-    output:
-    file "${corpusfreqlist}.anahash" into anahashlist
-    file "${corpusfreqlist}.corpusfoci" into corpusfocilist
+        script:
 
-    script:
+    	"""
+        #!/bin/bash
+        set +u
+        if [ ! -z "${virtualenv}" ]; then
+            source ${virtualenv}/bin/activate
+        fi
+        set -u
 
-	"""
-    #!/bin/bash
-    set +u
-    if [ ! -z "${virtualenv}" ]; then
-        source ${virtualenv}/bin/activate
-    fi
-    set -u
+        if [ ! -z "${lexiconindex}" ] && python3 ${baseDir}/scripts/lexiconindex.py split --index "${lexiconindex}" --alphabet "${alphabet}" --hashed lexicon.anahash --unhashed corpusonly.tsv "${corpusfreqlist}"; then
+            #the lexicon has been hashed in advance, only hash the words that are not in the lexicon index
+            TICCL-anahash --alph "${alphabet}" --artifrq ${artifrq} corpusonly.tsv --ngrams || exit 1
+            python3 ${baseDir}/scripts/lexiconindex.py merge -o "${corpusfreqlist}.anahash" lexicon.anahash corpusonly.tsv.anahash || exit 1
+            mv corpusonly.tsv.corpusfoci "${corpusfreqlist}.corpusfoci" || exit 1
+        else
+            TICCL-anahash --alph "${alphabet}" --artifrq ${artifrq} "${corpusfreqlist}" --ngrams || exit 1
+        fi
 
-    TICCL-anahash --alph "${alphabet}" --artifrq ${artifrq} "${corpusfreqlist}" --ngrams || exit 1
+        if [ ! -s "${corpusfreqlist}.anahash" ]; then
+            echo "ERROR: Expected output ${corpusfreqlist}.anahash does not exist or is empty">&2
+            exit 6
+        fi
 
-    if [ ! -s "${corpusfreqlist}.anahash" ]; then
-        echo "ERROR: Expected output ${corpusfreqlist}.anahash does not exist or is empty">&2
-        exit 6
-    fi
+        if [ ! -s "${corpusfreqlist}.corpusfoci" ]; then
+            echo "ERROR: Expected output ${corpusfreqlist}.corpusfoci does not exist or is empty">&2
+            exit 6
+        fi
+        """
+    }
 
-    if [ ! -s "${corpusfreqlist}.corpusfoci" ]; then
-        echo "ERROR: Expected output ${corpusfreqlist}.corpusfoci does not exist or is empty">&2
-        exit 6
-    fi
-    """
-}
 
+    //fork channels so we can consume them from multiple processes
+    anahashlist.into { anahashlist_forindexer; anahashlist_forresolver }
+    charconfuslist.into { charconfuslist_forindexer; charconfuslist_forrank }
 
-//fork channels so we can consume them from multiple processes
-anahashlist.into { anahashlist_forindexer; anahashlist_forresolver }
-charconfuslist.into { charconfuslist_forindexer; charconfuslist_forrank }
-
-process indexer {
-    /*
-        Computes an index from anagram hashes (TICCL-indexerNT)
-    */
-    publishDir params.outputdir, mode: 'copy', overwrite: true
-    label "multicore"
-
-    input:
-    file corpusfreqlist from corpusfreqlist_clean_forindexer //only used for naming purposes, not real input
-    file anahashlist from anahashlist_forindexer
-    file charconfuslist from charconfuslist_forindexer
-    file corpusfocilist from corpusfocilist
-    val virtualenv from params.virtualenv
-    val low from params.low
-    val high from params.high
-
-    output:
-    file "${corpusfreqlist}.indexNT" into index
-
-    script:
-    """
-    #!/bin/bash
-    set +u
-    if [ ! -z "${virtualenv}" ]; then
-        source ${virtualenv}/bin/activate
-    fi
-    set -u
-
-    TICCL-indexerNT --hash "${anahashlist}" --charconf "${charconfuslist}" --foci "${corpusfocilist}" -o "${corpusfreqlist}" -t ${task.cpus} --low ${low} --high ${high} || exit 1
-
-    if [ ! -e "${corpusfreqlist}.indexNT" ]; then
-        echo "ERROR: Expected output ${corpusfreqlist}.indexNT does not exist.">&2
-        exit 6
-    elif [ ! -s "${corpusfreqlist}.indexNT" ]; then
-        echo "ERROR: Expected output ${corpusfreqlist}.indexNT is empty. This means that no correction candidates could be found for any of the words in the input and that the pipeline finishes prematurely because no further processing can be done.">&2
-        exit 22
-    fi
-    """
-    //NOTE: -o option is a prefix only, extension indexNT will be appended !!
-}
+    if (params.shards > 1) {
+        //Sharded mode: the anagram hash space (the corpus foci) is partitioned and each partition is indexed in a separate
+        //task, so these tasks can be scheduled on different nodes. The same holds for resolving the resulting index.
+        //Partial outputs are merged into a canonical order that does not depend on the number of shards.
 
-//set up a new channel for the alphabet file for the resolved (the other one is consumed already)
-alphabet_forresolver = Channel.fromPath(params.alphabet).ifEmpty("Alphabet file not found")
-
-process resolver {
-    //Resolves numerical confusions back to word form confusions using TICCL-LDcalc
-    publishDir params.outputdir, mode: 'copy', overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
-    label "multicore"
-
-
-    input:
-    file index from index
-    file anahashlist from anahashlist_forresolver
-    file corpusfreqlist from corpusfreqlist_clean_forresolver
-    file alphabet from alphabet_forresolver
-    val distance from params.distance
-    val artifrq from params.artifrq
-    val virtualenv from params.virtualenv
-    val low from params.low
-    val high from params.high
-
-    output:
-    file "${corpusfreqlist}.ldcalc" into wordconfusionlist
-
-    script:
-    """
-    #!/bin/bash
-    set +u
-    if [ ! -z "${virtualenv}" ]; then
-        source ${virtualenv}/bin/activate
-    fi
-    set -u
-
-	TICCL-LDcalc --index "${index}" --hash "${anahashlist}" --clean "${corpusfreqlist}" --LD ${distance} --artifrq ${artifrq} -o "${corpusfreqlist}.ldcalc" -t ${task.cpus} --alph ${alphabet} --low ${low} --high ${high} || exit 1
-
-    if [ ! -s "${corpusfreqlist}.ldcalc" ]; then
-        echo "ERROR: Expected output ${corpusfreqlist}.ldcalc does not exist or is empty">&2
-        exit 6
-    fi
-    """
-}
+        //value channels, as these are consumed by every shard
+        corpusfreqlist_clean_forshards = corpusfreqlist_clean_forindexer.first()
+        anahashlist_forindexershards = anahashlist_forindexer.first()
+        anahashlist_forresolvershards = anahashlist_forresolver.first()
+        charconfuslist_forindexershards = charconfuslist_forindexer.first()
+        alphabet_forresolvershards = Channel.fromPath(params.alphabet).ifEmpty("Alphabet file not found").first()
 
-alphabet_forrank = Channel.fromPath(params.alphabet)
+        process splitfoci {
+            /*
+                Partition the corpus foci (anagram values to process) into shards
+            */
 
-process rank {
-    /*
-        Rank output using TICCL-rank
-    */
+            input:
+            file corpusfocilist from corpusfocilist
+            val shards from params.shards
 
-    publishDir params.outputdir, mode: 'copy', overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
-    label "multicore"
+            output:
+            file "${corpusfocilist}.shard*" into corpusfoci_shards
 
+            script:
+            """
+            #!/bin/bash
+            split -n l/${shards} -d -a 4 "${corpusfocilist}" "${corpusfocilist}.shard" || exit 1
+            """
+        }
 
-    input:
-    file wordconfusionlist from wordconfusionlist
-    file alphabet from alphabet_forrank
-    file charconfuslist from charconfuslist_forrank
-    val distance from params.distance
-    val artifrq from params.artifrq
-    val clip from params.clip
-    val virtualenv from params.virtualenv
+        process indexershard {
+            /*
+                Computes a partial index from anagram hashes for one shard of the corpus foci (TICCL-indexerNT)
+            */
+            label "multicore"
 
-    output:
-    file "${wordconfusionlist}.ranked" into rankedlist
+            input:
+            file corpusfocishard from corpusfoci_shards.flatten()
+            file anahashlist from anahashlist_forindexershards
+            file charconfuslist from charconfuslist_forindexershards
+            val virtualenv from params.virtualenv
+            val low from params.low
+            val high from params.high
 
-    script:
-    """
-    set +u
-    if [ ! -z "${virtualenv}" ]; then
-        source ${virtualenv}/bin/activate
-    fi
-    set -u
+            output:
+            file "${corpusfocishard}.indexNT" into index_shards
 
-    TICCL-rank --alph "${alphabet}" --charconf "${charconfuslist}" -o "${wordconfusionlist}.ranked" --subtractartifrqfeature2 0 --clip ${clip} --skipcols=1,10,11,13 -t ${task.cpus} "${wordconfusionlist}" || exit 1
+            script:
+            """
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
 
-    if [ ! -s "${wordconfusionlist}.ranked" ]; then
-        echo "ERROR: Expected output ${wordconfusionlist}.ranked does not exist or is empty">&2
-        exit 6
-    fi
-    """
-}
+            if [ ! -s "${corpusfocishard}" ]; then
+                #nothing to do for an empty shard
+                touch "${corpusfocishard}.indexNT"
+                exit 0
+            fi
 
-alphabet_forchain = Channel.fromPath(params.alphabet)
-
-process chainer {
-    /*
-        Find more distant variants (variants-of-variants are variants too)
-    */
-    publishDir params.outputdir, mode: 'copy', overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
-
-    input:
-    file rankedlist from rankedlist
-    file alphabet from alphabet_forchain
-    val virtualenv from params.virtualenv
-    val clip from params.clip
-
-    output:
-    file "${rankedlist}.chained.ranked" into rankedlist_chained
-
-    script:
-    """
-    #!/bin/bash
-    set +u
-    if [ ! -z "${virtualenv}" ]; then
-        source ${virtualenv}/bin/activate
-    fi
-    set -u
-
-    TICCL-chain --caseless ${rankedlist} --alph ${alphabet} || exit 1
-    mv ${rankedlist}.chained ${rankedlist}.chained.ranked || exit 2 #FoLiA-correct requires extension to be *.ranked so we add it
-
-    if [ ! -s "${rankedlist}.chained.ranked" ]; then
-        echo "ERROR: Expected output ${rankedlist}.chained.ranked does not exist or is empty">&2
-        exit 6
-    fi
-    """
-}
+            TICCL-indexerNT --hash "${anahashlist}" --charconf "${charconfuslist}" --foci "${corpusfocishard}" -o "${corpusfocishard}" -t ${task.cpus} --low ${low} --high ${high} || exit 1
 
-if (params.chainclean) {
+            if [ ! -e "${corpusfocishard}.indexNT" ]; then
+                echo "ERROR: Expected output ${corpusfocishard}.indexNT does not exist.">&2
+                exit 6
+            fi
+            """
+        }
 
-    lexicon_forchainclean = Channel.fromPath(params.lexicon).ifEmpty("Lexicon file not found")
+        process mergeindex {
+            /*
+                Merge the partial indices into a single index
+            */
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { params.containsKey('nointermediate') ? null : it } //intermediate output, not published with --nointermediate
 
-    process chainclean {
+            input:
+            file corpusfreqlist from corpusfreqlist_clean_forshards //only used for naming purposes, not real input
+            file indexshards from index_shards.collect()
+
+            output:
+            file "${corpusfreqlist}.indexNT" into index
+
+            script:
+            """
+            #!/bin/bash
+            python3 ${baseDir}/scripts/shardmerge.py --index -o "${corpusfreqlist}.indexNT" ${indexshards} || exit 1
+
+            if [ ! -s "${corpusfreqlist}.indexNT" ]; then
+                echo "ERROR: Expected output ${corpusfreqlist}.indexNT is empty. This means that no correction candidates could be found for any of the words in the input and that the pipeline finishes prematurely because no further processing can be done.">&2
+                exit 22
+            fi
+            """
+        }
+
+        process splitindex {
+            /*
+                Partition the index into shards
+            */
+
+            input:
+            file index from index
+            val shards from params.shards
+
+            output:
+            file "${index}.shard*" into index_shards_forresolver
+
+            script:
+            """
+            #!/bin/bash
+            split -n l/${shards} -d -a 4 "${index}" "${index}.shard" || exit 1
+            """
+        }
+
+        process resolvershard {
+            //Resolves numerical confusions back to word form confusions using TICCL-LDcalc, for one shard of the index
+            label "multicore"
+
+            input:
+            file indexshard from index_shards_forresolver.flatten()
+            file anahashlist from anahashlist_forresolvershards
+            file corpusfreqlist from corpusfreqlist_clean_forshards
+            file alphabet from alphabet_forresolvershards
+            val distance from params.distance
+            val artifrq from params.artifrq
+            val virtualenv from params.virtualenv
+            val low from params.low
+            val high from params.high
+
+            output:
+            file "${indexshard}.ldcalc" into ldcalc_shards
+
+            script:
+            """
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            if [ ! -s "${indexshard}" ]; then
+                #nothing to do for an empty shard
+                touch "${indexshard}.ldcalc"
+                exit 0
+            fi
+
+            TICCL-LDcalc --index "${indexshard}" --hash "${anahashlist}" --clean "${corpusfreqlist}" --LD ${distance} --artifrq ${artifrq} -o "${indexshard}.ldcalc" -t ${task.cpus} --alph ${alphabet} --low ${low} --high ${high} || exit 1
+
+            if [ ! -e "${indexshard}.ldcalc" ]; then
+                echo "ERROR: Expected output ${indexshard}.ldcalc does not exist">&2
+                exit 6
+            fi
+            """
+        }
+
+        process mergeldcalc {
+            /*
+                Merge the partial word confusion lists into a single list
+            */
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { params.containsKey('nointermediate') ? null : it } //publish the output for the end-user to see (rather than deleting this intermediate output), unless --nointermediate is set
+
+            input:
+            file corpusfreqlist from corpusfreqlist_clean_forshards //only used for naming purposes, not real input
+            file ldcalcshards from ldcalc_shards.collect()
+
+            output:
+            file "${corpusfreqlist}.ldcalc" into wordconfusionlist
+
+            script:
+            """
+            #!/bin/bash
+            python3 ${baseDir}/scripts/shardmerge.py -o "${corpusfreqlist}.ldcalc" ${ldcalcshards} || exit 1
+
+            if [ ! -s "${corpusfreqlist}.ldcalc" ]; then
+                echo "ERROR: Expected output ${corpusfreqlist}.ldcalc does not exist or is empty">&2
+                exit 6
+            fi
+            """
+        }
+
+    } else {
+        process indexer {
+            /*
+                Computes an index from anagram hashes (TICCL-indexerNT)
+            */
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { params.containsKey('nointermediate') ? null : it } //intermediate output, not published with --nointermediate
+            label "multicore"
+
+            input:
+            file corpusfreqlist from corpusfreqlist_clean_forindexer //only used for naming purposes, not real input
+            file anahashlist from anahashlist_forindexer
+            file charconfuslist from charconfuslist_forindexer
+            file corpusfocilist from corpusfocilist
+            val virtualenv from params.virtualenv
+            val low from params.low
+            val high from params.high
+
+            output:
+            file "${corpusfreqlist}.indexNT" into index
+
+            script:
+            """
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            TICCL-indexerNT --hash "${anahashlist}" --charconf "${charconfuslist}" --foci "${corpusfocilist}" -o "${corpusfreqlist}" -t ${task.cpus} --low ${low} --high ${high} || exit 1
+
+            if [ ! -e "${corpusfreqlist}.indexNT" ]; then
+                echo "ERROR: Expected output ${corpusfreqlist}.indexNT does not exist.">&2
+                exit 6
+            elif [ ! -s "${corpusfreqlist}.indexNT" ]; then
+                echo "ERROR: Expected output ${corpusfreqlist}.indexNT is empty. This means that no correction candidates could be found for any of the words in the input and that the pipeline finishes prematurely because no further processing can be done.">&2
+                exit 22
+            fi
+            """
+            //NOTE: -o option is a prefix only, extension indexNT will be appended !!
+        }
+
+        //set up a new channel for the alphabet file for the resolved (the other one is consumed already)
+        alphabet_forresolver = Channel.fromPath(params.alphabet).ifEmpty("Alphabet file not found")
+
+        process resolver {
+            //Resolves numerical confusions back to word form confusions using TICCL-LDcalc
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { params.containsKey('nointermediate') ? null : it } //publish the output for the end-user to see (rather than deleting this intermediate output), unless --nointermediate is set
+            label "multicore"
+
+
+            input:
+            file index from index
+            file anahashlist from anahashlist_forresolver
+            file corpusfreqlist from corpusfreqlist_clean_forresolver
+            file alphabet from alphabet_forresolver
+            val distance from params.distance
+            val artifrq from params.artifrq
+            val virtualenv from params.virtualenv
+            val low from params.low
+            val high from params.high
+
+            output:
+            file "${corpusfreqlist}.ldcalc" into wordconfusionlist
+
+            script:
+            """
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+        	TICCL-LDcalc --index "${index}" --hash "${anahashlist}" --clean "${corpusfreqlist}" --LD ${distance} --artifrq ${artifrq} -o "${corpusfreqlist}.ldcalc" -t ${task.cpus} --alph ${alphabet} --low ${low} --high ${high} || exit 1
+
+            if [ ! -s "${corpusfreqlist}.ldcalc" ]; then
+                echo "ERROR: Expected output ${corpusfreqlist}.ldcalc does not exist or is empty">&2
+                exit 6
+            fi
+            """
+        }
+    }
+
+    alphabet_forrank = Channel.fromPath(params.alphabet)
+
+    process rank {
         /*
-            Clean chain file, taking into account splits and merges
+            Rank output using TICCL-rank
         */
-        publishDir params.outputdir, mode: 'copy', overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+
+        publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+        label "multicore"
+
 
         input:
-        file rankedlist from rankedlist_chained
-        file lexicon from lexicon_forchainclean
-        val virtualenv from params.virtualenv
+        file wordconfusionlist from wordconfusionlist
+        file alphabet from alphabet_forrank
+        file charconfuslist from charconfuslist_forrank
+        val distance from params.distance
         val artifrq from params.artifrq
-        val low from params.low
+        val clip from params.clip
+        val virtualenv from params.virtualenv
 
         output:
-        file "${rankedlist}.chained.ranked.cleaned" into rankedlist_chained_cleaned
+        file "${wordconfusionlist}.ranked" into rankedlist
+
+        script:
+        """
+        set +u
+        if [ ! -z "${virtualenv}" ]; then
+            source ${virtualenv}/bin/activate
+        fi
+        set -u
 
+        TICCL-rank --alph "${alphabet}" --charconf "${charconfuslist}" -o "${wordconfusionlist}.ranked" --subtractartifrqfeature2 0 --clip ${clip} --skipcols=1,10,11,13 -t ${task.cpus} "${wordconfusionlist}" || exit 1
+
+        if [ ! -s "${wordconfusionlist}.ranked" ]; then
+            echo "ERROR: Expected output ${wordconfusionlist}.ranked does not exist or is empty">&2
+            exit 6
+        fi
+        """
+    }
+
+    alphabet_forchain = Channel.fromPath(params.alphabet)
+
+    process chainer {
+        /*
+            Find more distant variants (variants-of-variants are variants too)
+        */
+        publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+
+        input:
+        file rankedlist from rankedlist
+        file alphabet from alphabet_forchain
+        val virtualenv from params.virtualenv
+        val clip from params.clip
+
+        output:
+        file "${rankedlist}.chained.ranked" into rankedlist_chained
 
         script:
         """
@@ -487,36 +799,84 @@ if (params.chainclean) {
         fi
         set -u
 
-        TICCL-chainclean --lexicon ${lexicon} --low ${low} --artifrq ${artifrq} ${rankedlist}
+        TICCL-chain --caseless ${rankedlist} --alph ${alphabet} || exit 1
+        mv ${rankedlist}.chained ${rankedlist}.chained.ranked || exit 2 #FoLiA-correct requires extension to be *.ranked so we add it
 
-        if [ ! -s "${rankedlist}.chained.ranked.cleaned" ]; then
+        if [ ! -s "${rankedlist}.chained.ranked" ]; then
             echo "ERROR: Expected output ${rankedlist}.chained.ranked does not exist or is empty">&2
             exit 6
         fi
         """
-
     }
 
-} else {
-    rankedlist_chained_cleaned = rankedlist_chained
+    if (params.chainclean) {
+
+        lexicon_forchainclean = Channel.fromPath(params.lexicon).ifEmpty("Lexicon file not found")
+
+        process chainclean {
+            /*
+                Clean chain file, taking into account splits and merges
+            */
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (rather than deleting this intermediate output)
+
+            input:
+            file rankedlist from rankedlist_chained
+            file lexicon from lexicon_forchainclean
+            val virtualenv from params.virtualenv
+            val artifrq from params.artifrq
+            val low from params.low
+
+            output:
+            file "${rankedlist}.chained.ranked.cleaned" into rankedlist_chained_cleaned
+
+
+            script:
+            """
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            TICCL-chainclean --lexicon ${lexicon} --low ${low} --artifrq ${artifrq} ${rankedlist}
+
+            if [ ! -s "${rankedlist}.chained.ranked.cleaned" ]; then
+                echo "ERROR: Expected output ${rankedlist}.chained.ranked does not exist or is empty">&2
+                exit 6
+            fi
+            """
+
+        }
+
+    } else {
+        rankedlist_chained_cleaned = rankedlist_chained
+    }
 }
 
 
 if (!params.containsKey('nofoliacorrect')) {
 
+    if (params.correctbatch > 0) {
+        //fan the documents out over multiple FoLiA-correct tasks, each starts as soon as its documents and the ranked list are available
+        folia_ocr_documents_forfoliacorrect.buffer(size: params.correctbatch as int, remainder: true).set { foliacorrect_batches }
+    } else {
+        folia_ocr_documents_forfoliacorrect.collect().set { foliacorrect_batches } //collects all files first
+    }
+
     process foliacorrect {
         /*
             Correct the input documents using the ranked list, produces final output documents with <str>, using FoLiA-correct
         */
 
-        publishDir params.outputdir, mode: 'copy', overwrite: true
+        publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { params.containsKey('nointermediate') ? null : it } //intermediate output, not published with --nointermediate
         label "multicore"
 
         input:
-        file folia_ocr_documents from folia_ocr_documents_forfoliacorrect.collect() //collects all files first
-        file rankedlist from rankedlist_chained_cleaned
-        file punctuationmap from punctuationmap
-        file unknownfreqlist from unknownfreqlist
+        file folia_ocr_documents from foliacorrect_batches
+        file rankedlist from rankedlist_chained_cleaned.first() //the same ranked list, unknown words and punctuation map for all batches
+        file punctuationmap from punctuationmap.first()
+        file unknownfreqlist from unknownfreqlist.first()
         val extension from params.extension
         val inputclass from inputclass
         val outputclass from params.outputclass
@@ -567,14 +927,14 @@ if (!params.containsKey('nofoliacorrect')) {
              This invokes a tool that adds text markup information (t-str and t-correction) linking to the substrings. It adds a level of redundancy that is needed for proper visualisation in FLAT.
             */
 
-            publishDir params.outputdir, mode: 'copy', overwrite: true //publish the output for the end-user to see (this is the final output)
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { ischunk(it) ? null : it } //publish the output for the end-user to see (this is the final output, chunks are reassembled first)
 
             input:
-            file foliadoc from foliacorrect_documents
+            file foliadoc from foliacorrect_documents.flatten() //one document at a time, as soon as its batch is corrected
             val virtualenv from params.virtualenv
 
             output:
-            file "*.ticcl.folia.xml" into folia_ticcl_documents
+            file "*.ticcl.folia.xml" into folia_ticcl_pieces
 
             script:
             """
@@ -593,13 +953,13 @@ if (!params.containsKey('nofoliacorrect')) {
         process nolinkstrings {
             """Simple file rename step"""
 
-            publishDir params.outputdir, mode: 'copy', overwrite: true //publish the output for the end-user to see (this is the final output)
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true, saveAs: { ischunk(it) ? null : it } //publish the output for the end-user to see (this is the final output, chunks are reassembled first)
 
             input:
-            file foliadoc from foliacorrect_documents
+            file foliadoc from foliacorrect_documents.flatten() //one document at a time, as soon as its batch is corrected
 
             output:
-            file "*.ticcl.folia.xml" into folia_ticcl_documents
+            file "*.ticcl.folia.xml" into folia_ticcl_pieces
 
             script:
             """
@@ -608,6 +968,48 @@ if (!params.containsKey('nofoliacorrect')) {
         }
     }
 
+    if (params.chunksize > 0) {
+        //documents that were split into chunks are reassembled in order, all others are final as they are
+        folia_ticcl_pieces.into { folia_ticcl_whole; folia_ticcl_chunks }
+        folia_ticcl_chunks
+            .filter { ischunk(it) }
+            .map { [ chunkdocument(it), it ] }
+            .groupTuple()
+            .set { folia_ticcl_chunkgroups }
+
+        process reassemble {
+            /*
+                Concatenate the corrected chunks of a document into a single document again
+            */
+
+            publishDir params.outputdir, mode: params.publishmode, overwrite: true //publish the output for the end-user to see (this is the final output)
+
+            input:
+            set val(documentname), file(chunks) from folia_ticcl_chunkgroups
+            val virtualenv from params.virtualenv
+
+            output:
+            file "${documentname}.ticcl.folia.xml" into folia_ticcl_reassembled
+
+            script:
+            """
+            #!/bin/bash
+            set +u
+            if [ ! -z "${virtualenv}" ]; then
+                source ${virtualenv}/bin/activate
+            fi
+            set -u
+
+            foliainput=\$(ls -1v *_chunk*.ticcl.folia.xml | tr '\\n' ' ')
+            foliacat -i "${documentname}" -o "${documentname}.ticcl.folia.xml" \$foliainput || exit 1
+            """
+        }
+
+        folia_ticcl_whole.filter { !ischunk(it) }.mix(folia_ticcl_reassembled).set { folia_ticcl_documents }
+    } else {
+        folia_ticcl_documents = folia_ticcl_pieces
+    }
+
     //explicitly report the final documents created to stdout
     folia_ticcl_documents.subscribe { println "TICCL output document written to " +  params.outputdir + "/" + it.name }
 }
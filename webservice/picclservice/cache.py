@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#Content-addressed, size-bounded cache for intermediate PICCL results that can be shared between CLAM projects
+
+#If we run on Python 2.7, behave as much as Python 3 as possible
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import sys
+import os
+import time
+import shutil
+import hashlib
+import json
+import fcntl
+
+
+def filehash(filename, blocksize=1024*1024):
+    """Computes the SHA-256 hash of the contents of a file (symlinks are followed)"""
+    h = hashlib.sha256()
+    with open(filename,'rb') as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+def contenthash(filenames, parameters):
+    """Computes a cache key from the contents of the specified files and a dictionary of parameters.
+    Only the contents of the files count, not their names or order, so a re-submission of the same documents hits the same key"""
+    h = hashlib.sha256()
+    for digest in sorted(filehash(filename) for filename in filenames):
+        h.update(digest.encode('ascii'))
+    h.update(json.dumps(parameters, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+class DirectoryCache(object):
+    """A cache of directories on disk, bounded in size (in MB) and with least-recently-used eviction.
+    Each entry is a subdirectory named after its key, the modification time of that subdirectory marks when it was last used."""
+
+    def __init__(self, rootdir, maxsize=0, graceperiod=3600):
+        self.rootdir = rootdir
+        self.maxsize = maxsize #maximum size in MB (0 = unbounded)
+        self.graceperiod = graceperiod #entries used more recently than this (in seconds) are never evicted, as running jobs may still depend on them
+        if not os.path.isdir(self.rootdir):
+            os.makedirs(self.rootdir)
+
+    def path(self, key):
+        return os.path.join(self.rootdir, key)
+
+    def get(self, key):
+        """Returns the path of the cache entry for the given key (marking it as used), or None if there is no such entry"""
+        path = self.path(key)
+        if os.path.isdir(path):
+            os.utime(path, None)
+            return path
+        return None
+
+    def put(self, key, filenames):
+        """Stores copies of the specified files under the given key and returns the path of the entry.
+        The entry is assembled in a temporary directory first, so concurrent readers never see a partial entry."""
+        path = self.path(key)
+        tmppath = os.path.join(self.rootdir, "." + key + "." + str(os.getpid()))
+        if os.path.exists(tmppath):
+            shutil.rmtree(tmppath)
+        os.mkdir(tmppath)
+        try:
+            for filename in filenames:
+                shutil.copyfile(filename, os.path.join(tmppath, os.path.basename(filename))) #copyfile follows symlinks, which is what we want as project directories are ephemeral
+            if os.path.isdir(path):
+                #another job was faster than us, keep theirs
+                shutil.rmtree(tmppath)
+            else:
+                os.rename(tmppath, path)
+        except:
+            if os.path.exists(tmppath):
+                shutil.rmtree(tmppath)
+            raise
+        self.evict(keep=key)
+        return path
+
+    def claim(self, key):
+        """Claims the entry for the given key as a working directory (creating it if needed), for cache entries that are
+        used in place rather than copied, such as a Nextflow work directory. Returns (path, lock), or None if another job
+        currently holds the entry. The lock (an open file) must be passed to release() when done."""
+        path = self.path(key)
+        if not os.path.isdir(path):
+            try:
+                os.mkdir(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+        lock = open(os.path.join(path, '.lock'), 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            lock.close()
+            return None
+        os.utime(path, None)
+        return path, lock
+
+    def release(self, key, lock):
+        """Releases a claimed entry, marks it as used and evicts other entries if the cache exceeds its size budget"""
+        os.utime(self.path(key), None)
+        fcntl.flock(lock, fcntl.LOCK_UN)
+        lock.close()
+        self.evict(keep=key)
+
+    def claimed(self, key):
+        """Is the entry for the given key currently claimed by a job?"""
+        lockfile = os.path.join(self.path(key), '.lock')
+        if not os.path.exists(lockfile):
+            return False
+        with open(lockfile, 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                return True
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        return False
+
+    def entries(self):
+        """Returns a list of (lastused, size, key) tuples for all entries, least recently used first"""
+        entries = []
+        for key in os.listdir(self.rootdir):
+            path = self.path(key)
+            if key.startswith('.') or not os.path.isdir(path):
+                continue
+            size = 0
+            for root, _, files in os.walk(path):
+                for filename in files:
+                    size += os.path.getsize(os.path.join(root, filename))
+            entries.append( (os.path.getmtime(path), size, key) )
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Removes least recently used entries until the cache fits in its size budget again"""
+        if not self.maxsize:
+            return
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for lastused, size, key in entries:
+            if total <= self.maxsize * 1024 * 1024:
+                break
+            if key == keep or now - lastused < self.graceperiod or self.claimed(key):
+                continue
+            print("Evicting cache entry " + key + " (" + str(round(size / 1024 / 1024)) + " MB)", file=sys.stderr)
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            total -= size
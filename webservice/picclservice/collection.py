@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#Batch processing of whole collections (e.g. thousands of books) as a single PICCL run, rather than as many separate
+#projects that each build their own (statistically weak) ranked list and each repeat the fixed costs of a run.
+#
+#A collection is a CLAM project: documents are uploaded into it in as many requests as needed (uploads are resumable,
+#documents already in the collection are skipped), after which one pipeline run computes a single corpus-wide frequency
+#list and ranked list and fans the correction out over all documents (see CORRECTBATCH in the service configuration).
+#Every run writes a document index (documents.json) to its output, listing the output files of every input document,
+#so the results can be retrieved per document:
+#
+#   python3 -m picclservice.collection URL register COLLECTION
+#   python3 -m picclservice.collection URL upload COLLECTION --inputtemplate pdfimages books/*.pdf
+#   python3 -m picclservice.collection URL start COLLECTION --lang nld
+#   python3 -m picclservice.collection URL status COLLECTION
+#   python3 -m picclservice.collection URL fetch COLLECTION -O results/ [--document DOCUMENT]
+
+#If we run on Python 2.7, behave as much as Python 3 as possible
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import sys
+import os
+import io
+import json
+import time
+
+DOCUMENTINDEX = "documents.json"
+
+#extensions of the input documents, as in the input templates of the service
+INPUTEXTENSIONS = ('.folia.xml','.pdf','.djvu','.tif','.tiff','.txt')
+
+
+def documentname(filename):
+    """Returns the name of a document by the filename of its input (without extension)"""
+    for extension in INPUTEXTENSIONS:
+        if filename.lower().endswith(extension):
+            return filename[:-len(extension)]
+    return filename
+
+def inputdocuments(inputdir):
+    """Returns the filenames of the input documents in an input directory (not the lexicon or the CLAM metadata)"""
+    return [ filename for filename in sorted(os.listdir(inputdir)) if not filename.startswith('.') and documentname(filename) != filename ]
+
+def documentindex(inputdir, outputdir):
+    """Maps every input document to the output files that derive from it (those named after the document, the longest
+    matching document name wins). Returns a dictionary."""
+    documents = dict( (documentname(filename), {'input': filename, 'output': []}) for filename in inputdocuments(inputdir) )
+    names = sorted(documents, key=len, reverse=True)
+    for filename in sorted(os.listdir(outputdir)):
+        for name in names:
+            if filename.startswith(name + "."):
+                documents[name]['output'].append(filename)
+                break
+    return documents
+
+def writeindex(inputdir, outputdir):
+    """Writes the document index to the output directory, returns the number of documents without output"""
+    documents = documentindex(inputdir, outputdir)
+    with io.open(os.path.join(outputdir, DOCUMENTINDEX),'w',encoding='utf-8') as f:
+        f.write(json.dumps({'documents': documents}, indent=1, sort_keys=True))
+    return sum( 1 for document in documents.values() if not document['output'] )
+
+def correctbatch(documentcount, batchsize):
+    """Returns the number of documents per FoLiA-correct task for a run (0 for a single task): collections of more than
+    batchsize documents are corrected in batches, which pass on their output as soon as they are done"""
+    if batchsize and documentcount > batchsize:
+        return batchsize
+    return 0
+
+
+class Collection(object):
+    """Client for a collection (project) on a PICCL webservice"""
+
+    def __init__(self, url, collection, user=None, password=None, basicauth=False):
+        import clam.common.client #only needed client-side
+        self.client = clam.common.client.CLAMClient(url, user, password, basicauth=basicauth)
+        self.collection = collection
+
+    def register(self):
+        """Creates the collection (if it does not exist yet)"""
+        import clam.common.data
+        try:
+            self.client.get(self.collection)
+        except clam.common.data.NotFound:
+            self.client.create(self.collection)
+
+    def upload(self, filenames, inputtemplate, **metadata):
+        """Uploads documents into the collection, skipping those that are in it already (so an interrupted upload can
+        simply be repeated). Returns the number of documents uploaded."""
+        data = self.client.get(self.collection)
+        template = data.inputtemplate(inputtemplate)
+        done = set( inputfile.filename for inputfile in data.input )
+        count = 0
+        for filename in filenames:
+            if os.path.basename(filename) in done:
+                continue
+            self.client.addinputfile(self.collection, template, filename, **metadata)
+            count += 1
+            if count % 100 == 0:
+                print("Uploaded " + str(count) + " documents", file=sys.stderr)
+        return count
+
+    def start(self, **parameters):
+        """Starts a single run over all documents in the collection"""
+        self.client.startsafe(self.collection, **parameters)
+
+    def status(self):
+        """Returns (status, message, completion) of the collection, status as in clam.common.status"""
+        data = self.client.get(self.collection)
+        return data.status, data.statusmessage, data.completion
+
+    def wait(self, interval=30):
+        import clam.common.status
+        while True:
+            status, message, completion = self.status()
+            if status == clam.common.status.DONE:
+                return
+            print(str(completion) + "% " + message, file=sys.stderr)
+            time.sleep(interval)
+
+    def index(self):
+        """Returns the document index of a finished run"""
+        data = self.client.get(self.collection)
+        for outputfile in data.output:
+            if outputfile.filename == DOCUMENTINDEX:
+                return json.loads(outputfile.read())['documents']
+        raise KeyError("No document index in the output of " + self.collection + ", has the run finished?")
+
+    def fetch(self, outputdir, documents=None):
+        """Downloads the output of the given documents (all if None) into outputdir, returns the number of files"""
+        index = self.index()
+        count = 0
+        for name in (documents if documents else sorted(index)):
+            if name not in index:
+                raise KeyError("No such document in " + self.collection + ": " + name)
+            for filename in index[name]['output']:
+                self.client.download(self.collection, filename, os.path.join(outputdir, filename))
+                count += 1
+        return count
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Processes whole collections of documents as a single PICCL run on a PICCL webservice", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('url', help="URL of the PICCL webservice")
+    parser.add_argument('-u','--user', type=str, help="Username", action='store')
+    parser.add_argument('-p','--password', type=str, help="Password", action='store')
+    parser.add_argument('--basicauth', help="Use HTTP Basic Authentication rather than Digest Authentication", action='store_true')
+    subparsers = parser.add_subparsers(dest='command')
+    subparser = subparsers.add_parser('register', help="Register a collection")
+    subparser.add_argument('collection', help="Name of the collection")
+    subparser = subparsers.add_parser('upload', help="Upload documents into a collection (documents that are uploaded already are skipped)")
+    subparser.add_argument('collection', help="Name of the collection")
+    subparser.add_argument('-t','--inputtemplate', type=str, help="Input template (pdfimages, pdfmixed, pdftext, tif, djvu, textocr, foliaocr)", action='store', required=True)
+    subparser.add_argument('-m','--meta', type=str, help="Metadata for the documents (key=value)", action='append', default=[])
+    subparser.add_argument('files', nargs='+', help="Documents")
+    subparser = subparsers.add_parser('start', help="Start a run over all documents in a collection")
+    subparser.add_argument('collection', help="Name of the collection")
+    subparser.add_argument('-l','--lang', type=str, help="Language", action='store', required=True)
+    subparser.add_argument('-P','--parameter', type=str, help="Other parameters of the run (key=value)", action='append', default=[])
+    subparser.add_argument('-w','--wait', help="Wait until the run is done", action='store_true')
+    subparser = subparsers.add_parser('status', help="Show the status of a collection")
+    subparser.add_argument('collection', help="Name of the collection")
+    subparser = subparsers.add_parser('fetch', help="Download the output of a finished run, per document")
+    subparser.add_argument('collection', help="Name of the collection")
+    subparser.add_argument('-O','--outputdir', type=str, help="Output directory", action='store', default=".")
+    subparser.add_argument('-d','--document', type=str, help="Document to download the output of (may be repeated), defaults to all", action='append')
+    args = parser.parse_args()
+
+    if not args.command:
+        parser.print_help()
+        sys.exit(2)
+    collection = Collection(args.url, args.collection, args.user, args.password, args.basicauth)
+    if args.command == 'register':
+        collection.register()
+        print("Collection " + args.collection + " registered", file=sys.stderr)
+    elif args.command == 'upload':
+        count = collection.upload(args.files, args.inputtemplate, **dict( meta.split('=',1) for meta in args.meta ))
+        print("Uploaded " + str(count) + " documents into " + args.collection, file=sys.stderr)
+    elif args.command == 'start':
+        parameters = dict( parameter.split('=',1) for parameter in args.parameter )
+        parameters['lang'] = args.lang
+        collection.start(**parameters)
+        print("Run of " + args.collection + " started", file=sys.stderr)
+        if args.wait:
+            collection.wait()
+            print("Run of " + args.collection + " done", file=sys.stderr)
+    elif args.command == 'status':
+        status, message, completion = collection.status()
+        print(str(status) + "\t" + str(completion) + "%\t" + message)
+    elif args.command == 'fetch':
+        if not os.path.isdir(args.outputdir):
+            os.makedirs(args.outputdir)
+        count = collection.fetch(args.outputdir, args.document)
+        print("Downloaded " + str(count) + " files into " + args.outputdir, file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
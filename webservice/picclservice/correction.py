@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#Online correction of small documents against an existing TICCL model (the 'correct' action of the webservice)
+#
+#A model is a directory holding the ranked variant list, unknown word list and punctuation map of an earlier TICCL run
+#(as published in ticcl_output/, e.g. corpus.wordfreqlist.tsv.clean.ldcalc.ranked.chained.ranked, corpus.wordfreqlist.tsv.unk
+#and corpus.wordfreqlist.tsv.punct). Models are loaded once and kept resident: the ranked list as a memory-mapped store
+#(see rankedstore.py) and the other two lists in memory. To correct a document, only the entries for the words that
+#occur in it are written to small temporary lists, so FoLiA-correct (which does the actual correction, exactly as in
+#the pipeline) starts up in a fraction of a second rather than parsing the full lists.
+
+#If we run on Python 2.7, behave as much as Python 3 as possible
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import os
+import io
+import sys
+import glob
+import shutil
+import tempfile
+import threading
+import subprocess
+import xml.etree.ElementTree as ElementTree
+
+if __package__:
+    from . import rankedstore
+else:
+    import rankedstore #imported by the wrapper (or run as a script) from the webservice directory
+
+#ranked lists in order of preference (the final list as used by FoLiA-correct in the pipeline comes first)
+RANKEDSUFFIXES = ('.ranked.chained.ranked.cleaned', '.ranked.chained.ranked', '.ranked')
+FOLIANS = '{http://ilk.uvt.nl/folia}'
+PUNCTUATION = '.,:;!?"\'()[]{}<>-'
+MAXNGRAM = 3 #longest word n-grams to consider (TICCL joins the words of n-grams with an underscore)
+
+MODELS = {} #resident models, by directory
+MODELSLOCK = threading.Lock()
+
+
+def readlist(filename):
+    """Reads a word list (unknown words, punctuation map) into a dictionary of raw lines, keyed by the word in the first column"""
+    entries = {}
+    with io.open(filename,'rb') as f:
+        for line in f:
+            key = line.split(b'\t',1)[0].split(b'#',1)[0]
+            if key:
+                entries.setdefault(key, []).append(line if line.endswith(b'\n') else line + b'\n')
+    return entries
+
+
+class CorrectionModel(object):
+    """The TICCL lists of an earlier run, loaded for correcting individual documents"""
+
+    def __init__(self, modeldir):
+        self.modeldir = modeldir
+        self.rankedlist = None
+        for suffix in RANKEDSUFFIXES:
+            candidates = sorted(glob.glob(os.path.join(modeldir, '*' + suffix)))
+            if candidates:
+                self.rankedlist = candidates[0]
+                break
+        if not self.rankedlist:
+            raise ValueError("No ranked list found in " + modeldir)
+        self.unkfile = self.find('.unk')
+        self.punctfile = self.find('.punct')
+        storefile = self.rankedlist + '.rnk'
+        if not os.path.exists(storefile) or os.path.getmtime(storefile) < os.path.getmtime(self.rankedlist):
+            rankedstore.build(self.rankedlist, storefile)
+        self.store = rankedstore.RankedStore(storefile)
+        self.unk = readlist(self.unkfile)
+        self.punct = readlist(self.punctfile)
+        self.mtime = self.modified()
+
+    def find(self, suffix):
+        filenames = sorted(glob.glob(os.path.join(self.modeldir, '*' + suffix)))
+        if not filenames:
+            raise ValueError("No " + suffix + " file found in " + self.modeldir)
+        return filenames[0]
+
+    def modified(self):
+        """Returns the last modification time of the model files"""
+        return max(os.path.getmtime(filename) for filename in (self.rankedlist, self.unkfile, self.punctfile))
+
+    def close(self):
+        self.store.close()
+
+    def writesubset(self, words, directory):
+        """Writes the entries of the ranked list, unknown word list and punctuation map for the given words (bytes) to
+        the directory, returns the file names (ranked, unk, punct)"""
+        rankedfile = os.path.join(directory, 'subset.ranked')
+        unkfile = os.path.join(directory, 'subset.unk')
+        punctfile = os.path.join(directory, 'subset.punct')
+        with io.open(rankedfile,'wb') as ranked, io.open(unkfile,'wb') as unk, io.open(punctfile,'wb') as punct:
+            for word in sorted(words):
+                i = self.store.find(word)
+                if i is not None:
+                    _, data = self.store.record(i)
+                    for line in data.split(b"\n"):
+                        if line:
+                            candidate, variantfrequency, candidatefrequency, distance, score = line.split(b"\t")
+                            ranked.write(b"#".join((word, variantfrequency, candidate, candidatefrequency, distance, score)) + b"\n")
+                for line in self.unk.get(word, []):
+                    unk.write(line)
+                for line in self.punct.get(word, []):
+                    punct.write(line)
+        return rankedfile, unkfile, punctfile
+
+
+def getmodel(modelsdir, name):
+    """Returns the resident model with the given name (a subdirectory of modelsdir), loading it on first use or when it changed on disk"""
+    if not name or os.sep in name or name.startswith('.'):
+        raise ValueError("Invalid model name")
+    modeldir = os.path.join(modelsdir, name)
+    if not os.path.isdir(modeldir):
+        raise ValueError("No such model: " + name)
+    with MODELSLOCK:
+        model = MODELS.get(modeldir)
+        if model is not None and model.modified() > model.mtime:
+            model.close()
+            model = None
+        if model is None:
+            model = MODELS[modeldir] = CorrectionModel(modeldir)
+        return model
+
+def listmodels(modelsdir):
+    """Returns the names of the models available in a directory"""
+    if not modelsdir or not os.path.isdir(modelsdir):
+        return []
+    return sorted( name for name in os.listdir(modelsdir) if not name.startswith('.') and os.path.isdir(os.path.join(modelsdir, name)) )
+
+def documentwords(foliafile, textclass):
+    """Returns the set of words (bytes) in the text of the given class in a FoLiA document, along with the word n-grams
+    and the words stripped of punctuation, as they may occur in the TICCL lists"""
+    words = set()
+    for _, element in ElementTree.iterparse(foliafile):
+        if element.tag == FOLIANS + 't' and element.get('class','current') == textclass:
+            tokens = "".join(element.itertext()).split()
+            for i, token in enumerate(tokens):
+                words.add(token)
+                words.add(token.strip(PUNCTUATION))
+                for n in range(2, MAXNGRAM+1):
+                    if i + n <= len(tokens):
+                        words.add("_".join(tokens[i:i+n]))
+    return set( word.encode('utf-8') for word in words if word )
+
+def run(cmd, cwd):
+    process = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    if process.returncode != 0:
+        raise Exception(cmd[0] + " failed: " + output.decode('utf-8','ignore'))
+
+def correct(modelsdir, model, document, inputtype='folia', inputclass='current', outputclass='current', linkstrings=True):
+    """Corrects a single document (FoLiA XML or plain text, as a string) against a model, returns the corrected FoLiA document"""
+    model = getmodel(modelsdir, model)
+    if not isinstance(document, bytes):
+        document = document.encode('utf-8')
+    tmpdir = tempfile.mkdtemp(prefix='piccl-correct-')
+    try:
+        inputdir = os.path.join(tmpdir, 'input')
+        outputdir = os.path.join(tmpdir, 'output')
+        os.mkdir(inputdir)
+        os.mkdir(outputdir)
+        if inputtype == 'text':
+            with io.open(os.path.join(tmpdir,'document.txt'),'wb') as f:
+                f.write(document)
+            run(['FoLiA-txt','--class','OCR','-t','1','-O',inputdir,'document.txt'], tmpdir)
+            inputclass = 'OCR'
+        else:
+            with io.open(os.path.join(inputdir,'document.folia.xml'),'wb') as f:
+                f.write(document)
+        rankedfile, unkfile, punctfile = model.writesubset(documentwords(os.path.join(inputdir,'document.folia.xml'), inputclass), tmpdir)
+        run(['FoLiA-correct','--inputclass',inputclass,'--outputclass',outputclass,'--nums','10','-e','folia.xml','-O',outputdir + '/','--unk',unkfile,'--punct',punctfile,'--rank',rankedfile,'-t','1',inputdir], tmpdir)
+        outputfiles = glob.glob(os.path.join(outputdir,'*.xml'))
+        if not outputfiles:
+            raise Exception("FoLiA-correct produced no output")
+        if linkstrings:
+            #add the text markup linking to the strings, as the linkstrings step of the pipeline does
+            process = subprocess.Popen(['foliatextcontent','-M',outputfiles[0]], stdout=subprocess.PIPE)
+            output = process.communicate()[0]
+            if process.returncode == 0:
+                return output.decode('utf-8')
+            print("foliatextcontent failed, returning the document without string links", file=sys.stderr)
+        with io.open(outputfiles[0],'r',encoding='utf-8') as f:
+            return f.read()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Corrects a single document against the TICCL lists of an earlier run", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('modelsdir', help="Directory with models (CORRECTIONMODELDIR in the service configuration)")
+    parser.add_argument('model', help="Model (subdirectory)")
+    parser.add_argument('document', help="Document (FoLiA or plain text)")
+    parser.add_argument('--inputtype', type=str, help="folia or text", action='store', default="folia", choices=('folia','text'))
+    parser.add_argument('--inputclass', type=str, help="Input text class (FoLiA)", action='store', default="current")
+    parser.add_argument('--outputclass', type=str, help="Output text class", action='store', default="current")
+    args = parser.parse_args()
+    with io.open(args.document,'rb') as f:
+        document = f.read()
+    sys.stdout.write(correct(args.modelsdir, args.model, document, args.inputtype, args.inputclass, args.outputclass))
+
+if __name__ == '__main__':
+    main()
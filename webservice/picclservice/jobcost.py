@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#Cost estimation of PICCL jobs from their input, used to schedule jobs in the worker pool (see workerpool.py)
+#
+#The cost of a job is expressed in page equivalents: the work of OCRing a single scanned page. Documents that need no
+#OCR (text, FoLiA, PDF with a text layer) only pass through TICCL and enrichment, which is far cheaper per page.
+
+#If we run on Python 2.7, behave as much as Python 3 as possible
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import os
+import subprocess
+import xml.etree.ElementTree as ElementTree
+
+IMAGEEXTENSIONS = ('tif','tiff','jpg','jpeg','png','gif')
+TEXTEXTENSIONS = ('txt','xml')
+
+TEXTPAGESIZE = 3000 #bytes of text in a typical page
+PDFPAGESIZE = 100000 #bytes per page of a scanned PDF, used if pdfinfo is unavailable
+DJVUPAGESIZE = 50000 #bytes per page of a DjVu document, used if djvused is unavailable
+TEXTPAGECOST = 0.05 #cost of a page that needs no OCR, relative to one that does
+
+#Relative cost of OCR per language (models that are slower than the default)
+LANGUAGEFACTOR = {
+    'deu_frak': 1.5,
+    'grc': 1.5,
+}
+
+
+def jobinfo(datafile):
+    """Reads the user, project and selected language from the CLAM data file of a job (clam.xml), without loading CLAM itself"""
+    info = {'user': 'anonymous', 'project': None, 'lang': None}
+    try:
+        root = ElementTree.parse(datafile).getroot()
+    except (IOError, OSError, ElementTree.ParseError):
+        return info
+    if root.get('user'):
+        info['user'] = root.get('user')
+    info['project'] = root.get('project')
+    for element in root.iter():
+        if element.get('id') == 'lang' and element.get('value'):
+            info['lang'] = element.get('value')
+    return info
+
+def commandoutput(cmd):
+    try:
+        return subprocess.check_output(cmd, stderr=open(os.devnull,'w')).decode('utf-8','ignore')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def pdfpages(filename):
+    """Returns the number of pages of a PDF document"""
+    output = commandoutput(['pdfinfo', filename])
+    if output:
+        for line in output.split('\n'):
+            if line.startswith('Pages:'):
+                return int(line.split(':')[1])
+    return max(1, os.path.getsize(filename) // PDFPAGESIZE)
+
+def djvupages(filename):
+    """Returns the number of pages of a DjVu document"""
+    output = commandoutput(['djvused', '-e', 'n', filename])
+    if output and output.strip().isdigit():
+        return int(output.strip())
+    return max(1, os.path.getsize(filename) // DJVUPAGESIZE)
+
+def estimate(inputdir, datafile=None):
+    """Estimates the cost of a job. Returns a dictionary with the number of pages that need OCR (ocrpages), the number
+    of pages that do not (textpages), the total input size in bytes, the language, the user and the cost"""
+    info = jobinfo(datafile) if datafile else {'user': 'anonymous', 'project': None, 'lang': None}
+    ocrpages = textpages = size = 0
+    if os.path.isdir(inputdir):
+        for filename in os.listdir(inputdir):
+            path = os.path.join(inputdir, filename)
+            if filename.startswith('.') or not os.path.isfile(path):
+                continue
+            extension = filename.split('.')[-1].lower()
+            size += os.path.getsize(path)
+            if extension == 'pdf':
+                #we can't tell scanned PDFs and PDFs with a text layer apart cheaply, assume the worst
+                ocrpages += pdfpages(path)
+            elif extension == 'djvu':
+                ocrpages += djvupages(path)
+            elif extension in IMAGEEXTENSIONS:
+                ocrpages += 1
+            elif extension in TEXTEXTENSIONS:
+                textpages += max(1, os.path.getsize(path) // TEXTPAGESIZE)
+    info['ocrpages'] = ocrpages
+    info['textpages'] = textpages
+    info['size'] = size
+    info['cost'] = ocrpages * LANGUAGEFACTOR.get(info['lang'], 1.0) + textpages * TEXTPAGECOST
+    return info
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#Per-task performance metrics of PICCL runs, kept in an append-only store (metrics.jsonl in the statistics directory)
+#
+#After every run, the wrapper converts the Nextflow trace into one record per task (process name, wall-clock time, CPU
+#usage, peak memory, I/O), annotated with the job (project, language, input size). The store can be aggregated into
+#the Prometheus text exposition format (for scraping through the 'metrics' action of the webservice) or into a summary
+#per process, to see which stage to scale and when a stage became slower.
+
+#If we run on Python 2.7, behave as much as Python 3 as possible
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import os
+import io
+import json
+import time
+import argparse
+
+if __package__:
+    from . import nftrace
+else:
+    import nftrace #imported by the wrapper (or run as a script) from the webservice directory
+
+METRICSFILE = 'metrics.jsonl'
+
+#trace fields kept in the records (as named in the trace, values in seconds, percentages and bytes)
+FIELDS = ('status','exit','realtime','duration','%cpu','peak_rss','peak_vmem','rchar','wchar','read_bytes','write_bytes')
+
+
+class MetricsStore(object):
+    """Append-only store of task records, one JSON object per line"""
+
+    def __init__(self, statsdir):
+        self.statsdir = statsdir
+        self.filename = os.path.join(statsdir, METRICSFILE)
+
+    def add(self, records, job):
+        """Adds the task records of a trace (as read by nftrace.readtrace) along with the job metadata, returns the number of records"""
+        if not os.path.isdir(self.statsdir):
+            os.makedirs(self.statsdir)
+        now = time.time()
+        lines = []
+        for record in records:
+            entry = dict( (key, record.get(key)) for key in FIELDS )
+            entry['process'] = record.get('process')
+            entry['time'] = record.get('submit') or now
+            entry.update(job)
+            lines.append(json.dumps(entry) + "\n")
+        if lines:
+            #a single write to a file opened for appending, so records of concurrent jobs do not interleave
+            with io.open(self.filename,'a',encoding='utf-8') as f:
+                f.write("".join(lines))
+        return len(lines)
+
+    def __iter__(self):
+        if not os.path.exists(self.filename):
+            return
+        with io.open(self.filename,'r',encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue #partially written
+
+    def records(self, since=None):
+        """Returns all records, optionally only those of tasks submitted after the given time (seconds since the epoch)"""
+        return [ record for record in self if since is None or (record.get('time') or 0) >= since ]
+
+
+def aggregate(records):
+    """Aggregates records per (process, language), returns a dictionary of statistics"""
+    groups = {}
+    for record in records:
+        key = (record.get('process') or 'unknown', record.get('lang') or 'unknown')
+        group = groups.setdefault(key, {'count': 0, 'failed': 0, 'realtime': [], 'cpu': [], 'peak_rss': 0, 'read': 0, 'write': 0})
+        group['count'] += 1
+        if record.get('status') not in nftrace.FINISHED:
+            group['failed'] += 1
+        if record.get('realtime') is not None:
+            group['realtime'].append(record['realtime'])
+        if record.get('%cpu') is not None:
+            group['cpu'].append(record['%cpu'])
+        group['peak_rss'] = max(group['peak_rss'], record.get('peak_rss') or 0)
+        group['read'] += record.get('read_bytes') or record.get('rchar') or 0
+        group['write'] += record.get('write_bytes') or record.get('wchar') or 0
+    return groups
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values)-1, int(p * len(values)))]
+
+def prometheus(records):
+    """Returns the aggregated metrics in the Prometheus text exposition format"""
+    groups = aggregate(records)
+    metrics = (
+        ('piccl_task_total', 'counter', "Number of tasks run", lambda g: g['count']),
+        ('piccl_task_failed_total', 'counter', "Number of tasks that failed", lambda g: g['failed']),
+        ('piccl_task_realtime_seconds_sum', 'counter', "Total wall-clock time of tasks", lambda g: sum(g['realtime'])),
+        ('piccl_task_realtime_seconds_p90', 'gauge', "90th percentile of the wall-clock time of tasks", lambda g: percentile(g['realtime'], 0.9)),
+        ('piccl_task_cpu_percent_avg', 'gauge', "Average CPU usage of tasks (100 per core)", lambda g: sum(g['cpu']) / len(g['cpu']) if g['cpu'] else None),
+        ('piccl_task_peak_rss_bytes_max', 'gauge', "Highest peak resident memory of tasks", lambda g: g['peak_rss']),
+        ('piccl_task_read_bytes_total', 'counter', "Bytes read by tasks", lambda g: g['read']),
+        ('piccl_task_write_bytes_total', 'counter', "Bytes written by tasks", lambda g: g['write']),
+    )
+    lines = []
+    for name, metrictype, description, value in metrics:
+        lines.append("# HELP " + name + " " + description)
+        lines.append("# TYPE " + name + " " + metrictype)
+        for (process, lang), group in sorted(groups.items()):
+            v = value(group)
+            if v is not None:
+                lines.append(name + '{process="' + process + '",lang="' + lang + '"} ' + str(round(v,3) if isinstance(v,float) else v))
+    return "\n".join(lines) + "\n"
+
+def summary(records):
+    """Returns a human readable summary per process and language"""
+    groups = aggregate(records)
+    lines = ["\t".join(("process","lang","tasks","failed","realtime_mean","realtime_p50","realtime_p90","cpu%_mean","peak_rss_max_mb"))]
+    for (process, lang), group in sorted(groups.items()):
+        lines.append("\t".join((
+            process, lang, str(group['count']), str(group['failed']),
+            str(round(sum(group['realtime']) / len(group['realtime']),2)) if group['realtime'] else "-",
+            str(percentile(group['realtime'], 0.5)) if group['realtime'] else "-",
+            str(percentile(group['realtime'], 0.9)) if group['realtime'] else "-",
+            str(round(sum(group['cpu']) / len(group['cpu']),1)) if group['cpu'] else "-",
+            str(round(group['peak_rss'] / 1024 / 1024)),
+        )))
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregates the performance metrics of PICCL runs", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('statsdir', help="Statistics directory (STATSDIR in the service configuration)")
+    parser.add_argument('--format', type=str, help="Output format: summary or prometheus", action='store', default="summary", choices=('summary','prometheus'))
+    parser.add_argument('--since', type=float, help="Only consider tasks of the last N hours", action='store')
+    parser.add_argument('--process', type=str, help="Only consider tasks of this process", action='store')
+    args = parser.parse_args()
+    records = MetricsStore(args.statsdir).records(time.time() - args.since * 3600 if args.since else None)
+    if args.process:
+        records = [ record for record in records if record.get('process') == args.process ]
+    if args.format == 'prometheus':
+        print(prometheus(records), end="")
+    else:
+        print(summary(records), end="")
+
+if __name__ == '__main__':
+    main()
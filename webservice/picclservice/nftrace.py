@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#Reader for Nextflow trace files (-with-trace), which Nextflow appends a record to whenever a task completes
+
+#If we run on Python 2.7, behave as much as Python 3 as possible
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import io
+import re
+import time
+
+DURATIONUNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+SIZEUNITS = {'B': 1, 'KB': 1024, 'MB': 1024**2, 'GB': 1024**3, 'TB': 1024**4}
+
+DURATIONFIELDS = ('duration','realtime')
+SIZEFIELDS = ('peak_rss','peak_vmem','rss','vmem','rchar','wchar','syscr','syscw','read_bytes','write_bytes')
+PERCENTAGEFIELDS = ('%cpu','%mem')
+TIMEFIELDS = ('submit','start','complete')
+
+FINISHED = ('COMPLETED','CACHED')
+
+
+def parseduration(value):
+    """Parses a Nextflow duration (e.g. 1h 2m 3s, 350ms) into seconds"""
+    seconds = 0.0
+    for amount, unit in re.findall(r'([0-9.]+)\s*(ms|s|m|h|d)\b', value):
+        seconds += float(amount) * DURATIONUNITS[unit]
+    return seconds
+
+def parsesize(value):
+    """Parses a Nextflow memory size (e.g. 12.3 MB) into bytes"""
+    fields = value.split()
+    if len(fields) == 2 and fields[1] in SIZEUNITS:
+        return int(float(fields[0]) * SIZEUNITS[fields[1]])
+    return int(float(fields[0]))
+
+def parsetime(value):
+    """Parses a Nextflow timestamp (e.g. 2018-01-01 12:00:00.000, local time) into seconds since the epoch"""
+    timestamp, _, milliseconds = value.partition('.')
+    return time.mktime(time.strptime(timestamp, '%Y-%m-%d %H:%M:%S')) + (float('0.' + milliseconds) if milliseconds else 0)
+
+def parsevalue(field, value):
+    """Converts a field of a trace record to a number where applicable, missing values become None"""
+    if value in ('-',''):
+        return None
+    try:
+        if field in DURATIONFIELDS:
+            return parseduration(value)
+        elif field in SIZEFIELDS:
+            return parsesize(value)
+        elif field in PERCENTAGEFIELDS:
+            return float(value.rstrip('%'))
+        elif field in TIMEFIELDS:
+            return parsetime(value)
+        elif field in ('exit','task_id'):
+            return int(value)
+    except ValueError:
+        return None
+    return value
+
+def processname(taskname):
+    """Returns the process name of a task, e.g. tesseract for 'tesseract (12)'"""
+    return taskname.split(' (')[0]
+
+def readtrace(filename):
+    """Reads a trace file, returns a list of task records (dictionaries). Values are converted to numbers (seconds, bytes,
+    percentages), and a 'process' field holds the process name. Incomplete lines (still being written) are skipped."""
+    records = []
+    try:
+        f = io.open(filename,'r',encoding='utf-8')
+    except (IOError, OSError):
+        return records
+    with f:
+        header = None
+        for line in f:
+            if not line.endswith('\n'):
+                break #partially written
+            fields = line.rstrip('\n').split('\t')
+            if header is None:
+                header = fields
+                continue
+            if len(fields) != len(header):
+                continue
+            record = dict( (key, parsevalue(key, value)) for key, value in zip(header, fields) )
+            if 'name' in record and record['name']:
+                record['process'] = processname(record['name'])
+            records.append(record)
+    return records
+
+def finished(records):
+    """Returns only the records of tasks that finished successfully (or were cached from a previous run)"""
+    return [ record for record in records if record.get('status') in FINISHED ]
+
+def count(records, process):
+    """Counts the finished tasks of a process"""
+    return sum( 1 for record in finished(records) if record.get('process') == process )
+
+def span(records, processes):
+    """Returns the wall-clock time (in seconds) from the submission of the first task of any of the given processes
+    until the completion of the last one, or None if unknown"""
+    begin = end = None
+    for record in finished(records):
+        if record.get('process') in processes and record.get('submit') is not None and record.get('duration') is not None:
+            if begin is None or record['submit'] < begin:
+                begin = record['submit']
+            if end is None or record['submit'] + record['duration'] > end:
+                end = record['submit'] + record['duration']
+    if begin is None:
+        return None
+    return end - begin
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#Compressed output of PICCL jobs: the FoLiA documents in the output directory of a project are stored gzip-compressed
+#(under their usual names, so CLAM still matches them to the output templates), see compressoutput(). The WSGI
+#middleware in this module (used by picclservice.wsgi) serves them transparently:
+#
+# * compressed output files are passed on as they are stored, with Content-Encoding: gzip, to clients that accept it,
+#   and are decompressed on the fly for all others (so forwarders, whose services retrieve documents over HTTP, keep
+#   working). CLAM itself reads output files as text, so it can not serve them.
+# * the archive downloads of the output of a project (output/ and output/zip/, output/gz/, output/bz2/) are streamed
+#   as they are built rather than first written to disk, with the documents decompressed. output/tar/ holds the
+#   compressed documents as they are stored (as *.gz).
+#
+#Viewers that CLAM runs server-side (FLAT) do not pass through the middleware, the FoLiA output templates therefore
+#use a FLAT viewer that decompresses documents before uploading them (see picclservice.py).
+#
+#Authentication remains with CLAM: the middleware only serves a request once CLAM accepted the same credentials for
+#a route of the project that requires login, and only from the project directory of that user.
+
+#If we run on Python 2.7, behave as much as Python 3 as possible
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import os
+import io
+import re
+import time
+import zlib
+import struct
+import base64
+import tarfile
+import zipfile
+import gzip
+import bz2
+
+if __package__:
+    from . import collection
+else:
+    import collection #imported by the wrapper from the webservice directory
+
+GZIPMAGIC = b'\x1f\x8b'
+BLOCKSIZE = 1024 * 1024
+
+#maximum compression ratio of deflate, to tell whether the size recorded in a gzip file (modulo 2^32) can be trusted
+MAXRATIO = 1032
+
+#routes of CLAM for output files and archives (output/ and output/zip/ for zip, output/gz/, output/bz2/),
+#and output/tar/ for the documents as stored
+OUTPUTPATH = re.compile(r'^/(\w+)/output/(.+)$', re.UNICODE)
+ARCHIVEPATH = re.compile(r'^/(\w+)/output/?(?:(zip|gz|bz2|tar)/?)?$', re.UNICODE)
+ARCHIVEROUTES = {'zip': 'zip', 'gz': 'tar.gz', 'bz2': 'tar.bz2', 'tar': 'tar'}
+
+
+def iscompressed(filename):
+    with io.open(filename,'rb') as f:
+        return f.read(2) == GZIPMAGIC
+
+def compressfile(filename, level=6):
+    """Compresses a file in place (gzip), a symlink is replaced by the compressed contents of its target, and the
+    target removed. Returns the size saved in bytes."""
+    source = os.path.realpath(filename)
+    size = os.path.getsize(source)
+    tmpfile = filename + ".gz.part"
+    with io.open(source,'rb') as f_in:
+        with io.open(tmpfile,'wb') as f_out:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) #gzip container
+            for block in iter(lambda: f_in.read(BLOCKSIZE), b""):
+                f_out.write(compressor.compress(block))
+            f_out.write(compressor.flush())
+    os.rename(tmpfile, filename) #replaces the symlink (if any)
+    if source != os.path.abspath(filename):
+        os.unlink(source)
+    return size - os.path.getsize(filename)
+
+def compressoutput(outputdir, extension=".folia.xml", threads=4):
+    """Compresses all documents with the given extension in the output directory, returns the size saved in bytes"""
+    from concurrent.futures import ThreadPoolExecutor #zlib releases the GIL while compressing
+    filenames = [ os.path.join(outputdir, filename) for filename in os.listdir(outputdir) if filename.endswith(extension) ]
+    pool = ThreadPoolExecutor(max_workers=threads)
+    try:
+        return sum(pool.map(compressfile, filenames))
+    finally:
+        pool.shutdown()
+
+def decompressing(chunks):
+    """Decompresses a stream of gzip chunks"""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+def readblocks(filename, decompress=False):
+    with io.open(filename,'rb') as f:
+        blocks = iter(lambda: f.read(BLOCKSIZE), b"")
+        for block in (decompressing(blocks) if decompress else blocks):
+            yield block
+
+def decompressedsize(filename):
+    """Returns the size of a gzip-compressed file once decompressed"""
+    size = os.path.getsize(filename)
+    if size * MAXRATIO < 2**32:
+        with io.open(filename,'rb') as f:
+            f.seek(-4, os.SEEK_END)
+            return struct.unpack(str('<I'), f.read(4))[0] #the size modulo 2^32, as recorded in the gzip trailer
+    return sum( len(block) for block in readblocks(filename, True) )
+
+def outputfiles(outputdir):
+    """Returns (filename, path, compressed) for all output files of a project (not the CLAM metadata)"""
+    files = []
+    for root, dirs, filenames in os.walk(outputdir):
+        dirs[:] = sorted( d for d in dirs if not d.startswith('.') )
+        for filename in sorted(filenames):
+            if not filename.startswith('.'):
+                path = os.path.join(root, filename)
+                files.append((os.path.relpath(path, outputdir), path, iscompressed(path)))
+    return files
+
+
+class ArchiveStream(object):
+    """Write-only file object that collects what is written, for streaming"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def streamtar(files, project, decompress=False):
+    """Yields a tar archive of the given output files, block by block. Without decompress, compressed files are stored
+    as they are, with the extension .gz"""
+    for filename, path, compressed in files:
+        info = tarfile.TarInfo(project + "/" + filename + (".gz" if compressed and not decompress else ""))
+        info.size = decompressedsize(path) if compressed and decompress else os.path.getsize(path)
+        info.mtime = int(os.path.getmtime(path))
+        info.mode = 0o644
+        yield info.tobuf(tarfile.GNU_FORMAT)
+        for block in readblocks(path, compressed and decompress):
+            yield block
+        if info.size % tarfile.BLOCKSIZE:
+            yield tarfile.NUL * (tarfile.BLOCKSIZE - info.size % tarfile.BLOCKSIZE)
+    yield tarfile.NUL * (tarfile.BLOCKSIZE * 2) #end of archive (readers do not require padding to a full record)
+
+def streamtargz(files, project):
+    """Yields a gzip-compressed tar archive of the given output files, with the documents decompressed"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for block in streamtar(files, project, decompress=True):
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def streamtarbz2(files, project):
+    """Yields a bzip2-compressed tar archive of the given output files, with the documents decompressed"""
+    compressor = bz2.BZ2Compressor(9)
+    for block in streamtar(files, project, decompress=True):
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def streamzip(files, project):
+    """Yields a zip archive of the given output files, with the documents decompressed"""
+    stream = ArchiveStream()
+    archive = zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) #an unseekable file is written with data descriptors
+    for filename, path, compressed in files:
+        info = zipfile.ZipInfo(project + "/" + filename, time.localtime(os.path.getmtime(path))[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(info, 'w', force_zip64=True) as member:
+            for block in readblocks(path, compressed):
+                member.write(block)
+                yield stream.take()
+        yield stream.take()
+    archive.close()
+    yield stream.take()
+
+ARCHIVEFORMATS = {
+    'tar': ('application/x-tar', lambda files, project: streamtar(files, project)),
+    'tar.gz': ('application/gzip', streamtargz),
+    'tar.bz2': ('application/x-bzip2', streamtarbz2),
+    'zip': ('application/zip', streamzip),
+}
+
+
+def authuser(environ, settings):
+    """Returns the user CLAM will authenticate a request as (given the service configuration), as far as it can be
+    told from the request itself, or None if it can not (e.g. OAuth) or the name is not valid for CLAM"""
+    if getattr(settings, 'OAUTH', False):
+        return None
+    elif getattr(settings, 'PREAUTHHEADER', None):
+        headers = settings.PREAUTHHEADER.split() if isinstance(settings.PREAUTHHEADER, str) else settings.PREAUTHHEADER
+        user = next(( environ['HTTP_' + header.upper().replace('-','_')] for header in headers if environ.get('HTTP_' + header.upper().replace('-','_')) ), None)
+    elif getattr(settings, 'USERS', None) or getattr(settings, 'USERS_FILE', None) or getattr(settings, 'USERS_MYSQL', None):
+        authorization = environ.get('HTTP_AUTHORIZATION','')
+        user = None
+        if authorization.startswith('Digest '):
+            match = re.search(r'username="([^"]*)"', authorization)
+            user = match.group(1) if match else None
+        elif authorization.startswith('Basic '):
+            try:
+                user = base64.b64decode(authorization[6:].strip()).decode('utf-8').split(':',1)[0]
+            except (ValueError, UnicodeDecodeError):
+                pass
+    else:
+        user = 'anonymous'
+    if not user or '/' in user or user in ('.','..'):
+        return None
+    return user
+
+
+class DecompressedFile(object):
+    """Read-only file object with the decompressed contents of a (compressed) output file, for viewers that pass the
+    file on to another service rather than through the middleware"""
+
+    def __init__(self, path, filename):
+        self.filename = filename
+        self.f = gzip.open(path, 'rb')
+
+    def read(self, size=-1):
+        return self.f.read(size)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class OutputMiddleware(object):
+    """WSGI middleware that serves the compressed output of PICCL jobs (see the module description)"""
+
+    def __init__(self, app, settings):
+        self.app = app
+        self.settings = settings #the service configuration
+        self.prefix = getattr(settings, 'INTERNALURLPREFIX', '') or ''
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO','')
+        if environ.get('REQUEST_METHOD','GET') == 'GET' and path.startswith(self.prefix):
+            path = path[len(self.prefix):]
+            match = ARCHIVEPATH.match(path)
+            if match:
+                return self.archive(environ, start_response, match.group(1), ARCHIVEROUTES[match.group(2) or 'zip'])
+            else:
+                match = OUTPUTPATH.match(path)
+                if match:
+                    return self.outputfile(environ, start_response, match.group(1), match.group(2))
+        return self.app(environ, start_response)
+
+    def outputdir(self, environ, project):
+        """Returns the output directory of a project for the user of the request, or None if it can not be told"""
+        user = authuser(environ, self.settings)
+        if user is None:
+            return None
+        outputdir = os.path.join(self.settings.ROOT, 'projects', user, project, 'output')
+        return outputdir if os.path.isdir(outputdir) else None
+
+    def authorised(self, environ, project, filename):
+        """Does CLAM authenticate the request? Asks CLAM for the metadata of an output file of the project, a route that
+        requires login (the answer is 404 if the file has no metadata, but that is after authentication)"""
+        probe = dict(environ, PATH_INFO=self.prefix + '/' + project + '/output/' + filename + '/metadata', QUERY_STRING='')
+        response = []
+        def capture(status, headers, exc_info=None): #pylint: disable=unused-argument
+            response[:] = [status]
+            return lambda data: None
+        body = self.app(probe, capture)
+        for _ in body: #pylint: disable=unused-variable
+            pass
+        if hasattr(body, 'close'):
+            body.close()
+        return bool(response) and response[0][:3] in ('200','404')
+
+    def outputfile(self, environ, start_response, project, filename):
+        """Serves a compressed output file: as it is stored with Content-Encoding: gzip to clients that accept it,
+        decompressed on the fly to all others. Anything else (uncompressed files, viewers, metadata) is left to CLAM,
+        which reads output files as text."""
+        outputdir = self.outputdir(environ, project)
+        path = os.path.join(outputdir, filename) if outputdir and '..' not in filename.split('/') else None
+        if path is None or not os.path.isfile(path) or not iscompressed(path) or not self.authorised(environ, project, filename):
+            return self.app(environ, start_response)
+        headers = [('Content-Type', 'text/xml; charset=utf-8' if filename.endswith('.xml') else 'application/octet-stream'), ('Vary','Accept-Encoding')]
+        if 'gzip' in environ.get('HTTP_ACCEPT_ENCODING',''):
+            start_response('200 OK', headers + [('Content-Encoding','gzip'), ('Content-Length', str(os.path.getsize(path)))])
+            return readblocks(path)
+        start_response('200 OK', headers)
+        return readblocks(path, decompress=True)
+
+    def archive(self, environ, start_response, project, archiveformat):
+        """Streams an archive of the output of a project, once CLAM authenticated the request"""
+        outputdir = self.outputdir(environ, project)
+        if outputdir is None or not self.authorised(environ, project, collection.DOCUMENTINDEX):
+            return self.app(environ, start_response) #CLAM responds (e.g. with an authentication challenge)
+        mimetype, stream = ARCHIVEFORMATS[archiveformat]
+        start_response('200 OK', [('Content-Type', mimetype), ('Content-Disposition', 'attachment; filename="' + project + '.' + archiveformat + '"')])
+        return stream(outputfiles(outputdir), project)
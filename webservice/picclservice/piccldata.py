@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#Installs and verifies the PICCL language data (data/) from a manifest, per language and in parallel
+#
+#A manifest (JSON) lists every data file with its path (relative to the data directory), size, SHA-256 checksum and
+#the language it belongs to (files in int/LANG/ belong to LANG, all others to "common"). Archives (*.tar.gz) may be
+#listed instead of individual files, with "extract": true, they are then extracted into the data directory once
+#verified. Files are fetched from a local mirror directory (with the same layout as the data directory) or from a
+#base URL, written under a temporary name, and only moved into place once their checksum matches.
+#
+#Verified files are recorded in a marker per language (.verified/LANG in the data directory, one "checksum size path"
+#line per file), so later installs and checks skip them without reading them again. Files that are missing, of a
+#different size, or not recorded as verified (e.g. left behind by an interrupted extraction) are fetched again.
+#
+#   piccldata.py manifest data/ -o manifest.json            builds a manifest from an existing (trusted) data directory
+#   piccldata.py install manifest.json data/ --languages nld,eng (--mirror DIR | --url URL)
+#   piccldata.py verify manifest.json data/ --languages nld,eng
+
+#If we run on Python 2.7, behave as much as Python 3 as possible
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import sys
+import os
+import io
+import json
+import shutil
+import tarfile
+import hashlib
+import argparse
+import fcntl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen #Python 2
+
+MARKERDIR = ".verified"
+COMMON = "common"
+
+
+def filehash(filename, blocksize=1024*1024):
+    """Computes the SHA-256 hash of the contents of a file"""
+    h = hashlib.sha256()
+    with io.open(filename,'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def datalanguage(language):
+    """Returns the language of the data a service language uses (the wrapper uses the German data for Fraktur)"""
+    return 'deu' if language == 'deu_frak' else language
+
+def filelanguage(path):
+    """Returns the language a data file belongs to, by its path relative to the data directory"""
+    fields = path.split('/')
+    if len(fields) >= 3 and fields[0] == 'int':
+        return fields[1]
+    return COMMON
+
+def entrylanguage(entry):
+    return entry.get('language', filelanguage(entry['path']))
+
+def buildmanifest(datadir):
+    """Builds a manifest from the files in a data directory"""
+    entries = []
+    for root, dirs, files in os.walk(datadir):
+        dirs[:] = sorted( d for d in dirs if not d.startswith('.') )
+        for filename in sorted(files):
+            if filename.startswith('.') or filename.endswith('.anaidx'): #lexicon indices are compiled locally
+                continue
+            fullpath = os.path.join(root, filename)
+            path = os.path.relpath(fullpath, datadir).replace(os.sep, '/')
+            entries.append({'path': path, 'size': os.path.getsize(fullpath), 'sha256': filehash(fullpath), 'language': filelanguage(path)})
+    return {'files': entries}
+
+def loadmanifest(filename):
+    with io.open(filename,'r',encoding='utf-8') as f:
+        return json.load(f)
+
+def selectentries(manifest, languages=None):
+    """Returns the manifest entries needed for the given languages (all if None), common entries are always included"""
+    if languages is None:
+        return manifest['files']
+    languages = set( datalanguage(language) for language in languages ) | set([COMMON])
+    return [ entry for entry in manifest['files'] if entrylanguage(entry) in languages ]
+
+
+class Markers(object):
+    """The verified files of a data directory, per language"""
+
+    def __init__(self, datadir):
+        self.datadir = datadir
+        self.markerdir = os.path.join(datadir, MARKERDIR)
+        self.verified = {}
+        self.lock = threading.Lock()
+
+    def load(self, language, reload=False):
+        if reload or language not in self.verified:
+            self.verified[language] = {}
+            markerfile = os.path.join(self.markerdir, language)
+            if os.path.exists(markerfile):
+                with io.open(markerfile,'r',encoding='utf-8') as f:
+                    for line in f:
+                        fields = line.rstrip('\n').split(' ', 2)
+                        if len(fields) == 3:
+                            self.verified[language][fields[2]] = (fields[0], int(fields[1]))
+        return self.verified[language]
+
+    def isverified(self, entry):
+        """Is this entry installed and verified? (checks the size on disk, not the checksum)"""
+        language = entrylanguage(entry)
+        with self.lock:
+            recorded = self.load(language).get(entry['path'])
+        if recorded != (entry['sha256'], entry['size']):
+            return False
+        if entry.get('extract'):
+            return True #the archive itself is removed after extraction
+        filename = os.path.join(self.datadir, entry['path'])
+        return os.path.exists(filename) and os.path.getsize(filename) == entry['size']
+
+    def add(self, entry):
+        """Records an entry as verified (appends to the marker of its language)"""
+        language = entrylanguage(entry)
+        with self.lock:
+            self.load(language)[entry['path']] = (entry['sha256'], entry['size'])
+            if not os.path.isdir(self.markerdir):
+                os.makedirs(self.markerdir)
+            with io.open(os.path.join(self.markerdir, language),'a',encoding='utf-8') as f:
+                f.write(entry['sha256'] + " " + str(entry['size']) + " " + entry['path'] + "\n")
+
+
+def fetch(entry, targetfile, mirror=None, url=None):
+    """Fetches the file of an entry from a mirror directory or base URL into targetfile"""
+    if mirror:
+        source = os.path.join(mirror, entry['path'])
+        shutil.copyfile(source, targetfile)
+    elif url:
+        response = urlopen(url.rstrip('/') + '/' + entry['path'])
+        try:
+            with io.open(targetfile,'wb') as f:
+                shutil.copyfileobj(response, f, 1024*1024)
+        finally:
+            response.close()
+    else:
+        raise ValueError("No mirror or URL to fetch " + entry['path'] + " from")
+
+def installentry(entry, datadir, markers, mirror=None, url=None):
+    """Installs a single entry, returns True if it had to be fetched, raises an exception if it fails verification"""
+    if markers.isverified(entry):
+        return False
+    targetfile = os.path.join(datadir, entry['path'])
+    if not os.path.isdir(os.path.dirname(targetfile)):
+        try:
+            os.makedirs(os.path.dirname(targetfile))
+        except OSError:
+            pass #created concurrently
+    tmpfile = targetfile + ".part"
+    if os.path.exists(targetfile) and not entry.get('extract') and os.path.getsize(targetfile) == entry['size'] and filehash(targetfile) == entry['sha256']:
+        #present but not recorded yet (e.g. installed by an earlier version of download-data.nf), no need to fetch it
+        markers.add(entry)
+        return False
+    try:
+        fetch(entry, tmpfile, mirror, url)
+        if os.path.getsize(tmpfile) != entry['size'] or filehash(tmpfile) != entry['sha256']:
+            raise ValueError("Checksum mismatch for " + entry['path'])
+        if entry.get('extract'):
+            with tarfile.open(tmpfile) as archive:
+                for member in archive.getmembers():
+                    if member.name.startswith('/') or '..' in member.name.split('/'):
+                        raise ValueError("Unsafe path in archive " + entry['path'] + ": " + member.name)
+                archive.extractall(os.path.dirname(targetfile))
+            os.unlink(tmpfile)
+        else:
+            os.rename(tmpfile, targetfile)
+    finally:
+        if os.path.exists(tmpfile):
+            os.unlink(tmpfile)
+    markers.add(entry) #only once the file is completely in place
+    return True
+
+def install(manifest, datadir, languages=None, mirror=None, url=None, threads=4):
+    """Installs (and verifies) all data for the given languages, skipping what is verified already. Returns the number
+    of files fetched. Installs of the same language (e.g. the common data) into the same data directory wait for one
+    another, installs of different languages run concurrently."""
+    markers = Markers(datadir)
+    if not os.path.isdir(markers.markerdir):
+        try:
+            os.makedirs(markers.markerdir)
+        except OSError:
+            pass #created concurrently
+    entries = selectentries(manifest, languages)
+    count = 0
+    for language in sorted(set( entrylanguage(entry) for entry in entries )):
+        with io.open(os.path.join(markers.markerdir, language + ".lock"),'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                markers.load(language, reload=True) #another install may have finished meanwhile
+                todo = [ entry for entry in entries if entrylanguage(entry) == language and not markers.isverified(entry) ]
+                if todo:
+                    print("Installing " + str(len(todo)) + " files for " + language, file=sys.stderr)
+                    pool = ThreadPoolExecutor(max_workers=threads)
+                    try:
+                        count += sum( pool.map(lambda entry: installentry(entry, datadir, markers, mirror, url), todo) )
+                    finally:
+                        pool.shutdown()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    return count
+
+def verify(manifest, datadir, languages=None, full=False):
+    """Returns the paths of the entries for the given languages that are not installed or do not verify. Without full,
+    entries recorded as verified are trusted (only their size is checked)."""
+    markers = Markers(datadir)
+    failed = []
+    for entry in selectentries(manifest, languages):
+        if markers.isverified(entry) and (not full or entry.get('extract')):
+            continue
+        filename = os.path.join(datadir, entry['path'])
+        if entry.get('extract') or not os.path.exists(filename) or os.path.getsize(filename) != entry['size'] or filehash(filename) != entry['sha256']:
+            failed.append(entry['path'])
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Installs and verifies the PICCL language data from a manifest", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    manifestparser = subparsers.add_parser('manifest', help="Build a manifest from an existing data directory")
+    manifestparser.add_argument('-o','--output', type=str, help="Output file", action='store', required=True)
+    manifestparser.add_argument('datadir', help="Data directory")
+    installparser = subparsers.add_parser('install', help="Install the data for some or all languages")
+    verifyparser = subparsers.add_parser('verify', help="Verify the installed data for some or all languages")
+    for subparser in (installparser, verifyparser):
+        subparser.add_argument('manifest', help="Manifest file")
+        subparser.add_argument('datadir', help="Data directory")
+        subparser.add_argument('-l','--languages', type=str, help="Languages (comma separated), defaults to all in the manifest", action='store')
+    installparser.add_argument('-m','--mirror', type=str, help="Local mirror directory to install from", action='store')
+    installparser.add_argument('-u','--url', type=str, help="Base URL to install from", action='store')
+    installparser.add_argument('-j','--threads', type=int, help="Number of files to fetch in parallel", action='store', default=4)
+    verifyparser.add_argument('--full', help="Compute the checksums of all files, also of those recorded as verified", action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'manifest':
+        manifest = buildmanifest(args.datadir)
+        with io.open(args.output,'w',encoding='utf-8') as f:
+            f.write(json.dumps(manifest, indent=1, sort_keys=True))
+        print("Manifest of " + str(len(manifest['files'])) + " files written to " + args.output, file=sys.stderr)
+    elif args.command in ('install','verify'):
+        manifest = loadmanifest(args.manifest)
+        languages = args.languages.split(',') if args.languages else None
+        if args.command == 'install':
+            if not args.mirror and not args.url:
+                print("Specify --mirror or --url", file=sys.stderr)
+                sys.exit(2)
+            count = install(manifest, args.datadir, languages, args.mirror, args.url, args.threads)
+            print("Installed " + str(count) + " files into " + args.datadir, file=sys.stderr)
+        else:
+            failed = verify(manifest, args.datadir, languages, args.full)
+            for path in failed:
+                print("Missing or corrupt: " + path, file=sys.stderr)
+            if failed:
+                sys.exit(1)
+            print("All data verified", file=sys.stderr)
+    else:
+        parser.print_help()
+        sys.exit(2)
+
+if __name__ == '__main__':
+    main()
@@ -28,7 +28,9 @@ from clam.common.digestauth import pwhash
 import clam
 import sys
 import os
+import json
 from base64 import b64decode as D
+from picclservice import outputstream
 
 REQUIRE_VERSION = "2.4.5"
 
@@ -108,6 +110,49 @@ FLATURL = "https://flat.cls.ru.nl"
 AUTOSEARCH_FORWARD_URL = None
 SWITCHBOARD_FORWARD_URL = None
 
+# ======== PERFORMANCE =============
+
+#Directory for a cache of intermediate TICCL results (ranked lists etc) that is shared between projects, so re-submissions of the same corpus with the same parameters need not redo all TICCL steps. Set to None to disable.
+TICCLCACHEDIR = None
+#Maximum size of the TICCL cache (in MB), least recently used entries are evicted first. Set to 0 for no limit.
+TICCLCACHESIZE = 50000
+#Directory in which performance statistics of finished jobs are kept (throughput per language, used to estimate the time remaining for new jobs, and the metrics of all tasks, available through the 'metrics' action). Set to None to disable.
+STATSDIR = None
+#Spool directory of a pool of pre-initialised workers (see workerpool.py), jobs are then queued and picked up by these workers rather than each starting from scratch. The pool has to be started separately (python3 -m picclservice.workerpool serve). Set to None to run every job in its own process.
+WORKERPOOL = None
+#Number of workers in the pool, i.e. the maximum number of concurrently running jobs. Set to 0 to derive it from the total memory and REQUIREMEMORY.
+WORKERS = 0
+#Maximum number of cores a single job may use in the worker pool. Set to 0 to divide the cores evenly over the workers.
+MAXCPUSPERJOB = 0
+#The worker pool runs small jobs ahead of large ones. To prevent large jobs from starving, waiting jobs gain this many page equivalents of priority per minute.
+SCHEDULERAGING = 10
+#Relative share of the worker pool per user (default 1), e.g. {'alice': 2}
+USERWEIGHTS = {}
+#Directory in which the Nextflow work directory of every corpus is kept, so re-submissions and retries after a failure resume from the tasks that completed earlier (Nextflow -resume) rather than starting over. Set to None to remove the work directory after every job.
+RESUMEDIR = None
+#Maximum size of RESUMEDIR (in MB), the work directories of the least recently used corpora are evicted first. Set to 0 for no limit.
+RESUMESIZE = 200000
+#Node-local directory in which the tasks of a job run (Nextflow scratch), only their output is moved to the work directory afterwards. Saves I/O when the project directories are on a shared/network filesystem. Set to True to use $TMPDIR, None to run the tasks in the work directory.
+SCRATCHDIR = None
+#How the pipeline publishes its output from the work directory: "link" (hard links, no data is written at all), "copy", or "auto" (hard links when the work directory is on the same filesystem as the project directory, copies otherwise).
+PUBLISHMODE = "auto"
+#Manifest of the language data (see piccldata.py), data for a language is then installed (and verified) on demand when the first job in that language runs, from DATAMIRROR (a local directory) or DATAURL. Set to None to rely on the data in PICCLDATAROOT as it is.
+DATAMANIFEST = None
+DATAMIRROR = None
+DATAURL = None
+#Projects with more input documents than this (collections) are corrected in batches of this many documents per FoLiA-correct task, which pass on their output as soon as they are done, rather than in a single task for the entire collection. Set to 0 to always correct in a single task.
+CORRECTBATCH = 100
+#Split TICCL's indexing and resolving into this many tasks (--shards), so they can be scheduled on different nodes. Set to 1 to run each in a single task.
+TICCLSHARDS = 1
+#Directory in which frequency lists are stored per document (keyed by their contents), so the corpus frequency list of a job is computed incrementally (--incremental): documents that were counted before, in any project, are not counted again. Set to None to count all documents in every job.
+FREQLISTCACHE = None
+#Pages of a document that are OCRed per task, with a single Tesseract engine (--ocrbatch), rather than loading the model for every page. Set to 1 for one page per task.
+OCRBATCH = 1
+#Store the FoLiA output of jobs gzip-compressed (under the usual filenames). It is served compressed to clients that accept it and decompressed to all others by the middleware in picclservice.wsgi, so the service must be run through picclservice.wsgi (not clamservice) when this is enabled.
+COMPRESSOUTPUT = False
+#Directory of TICCL models for the 'correct' action, which corrects single documents synchronously: each subdirectory holds the ranked list, unknown word list and punctuation map of an earlier run (the contents of ticcl_output/). Set to None to disable.
+CORRECTIONMODELDIR = None
+
 # ======== LOAD EXTERNAL CONFIGURATION =============
 # Load external configuration file (see piccl.config.yml)
 # This can override any of the variables set until this point, and should take care of setting host specific variables
@@ -132,115 +177,118 @@ loadconfig(__name__)
 
 LANGUAGECHOICES = [('eng','English'),('nld','Dutch'),('fin','Finnish'),('fra','French'),('deu','German'),('deu_frak','German Fraktur'),('ell','Greek (Modern)'),('grc','Greek (Classical)'),('isl','Icelandic'),('ita','Italian'),('lat','Latin'),('pol','Polish'),('por','Portuguese'),('ron','Romanian'),('rus','Russian'),('spa','Spanish'),('swe','Swedish')]
 
-INPUTSOURCES = []
-if os.path.exists(PICCLDATAROOT + "/corpora/TIFF/NLD"):
-    INPUTSOURCES.append(InputSource(id='dutchtif', label="[Dutch] Demonstrator data: Martinet DPO_35 Scanned page images (tif format)",
-        path=PICCLDATAROOT + "/corpora/TIFF/NLD/",
-        metadata=TiffImageFormat(None),
-        inputtemplate='tif'
-    ))
-if os.path.exists(PICCLDATAROOT + "/corpora/PDF/ENG"):
-    INPUTSOURCES += [InputSource(id='englishpdf', label="[English] Demonstrator data: Geets paper (PDF format)",
-        path=PICCLDATAROOT + "/corpora/PDF/ENG/",
-        metadata=PDFFormat(None),
-        inputtemplate='pdfimages'
-    ),
-    InputSource(id='englishimageslarge', label="[English] Demonstrator data: Russell -- Western Philosophy (DJVU format)",
-        path=PICCLDATAROOT + "/corpora/DJVU/ENG/",
-        metadata=DjVuFormat(None),
-        inputtemplate='djvu'
-    ),
-    InputSource(id='englishtxt', label="[English] Demonstrator data: Russell -- Western Philosophy (Plain text format)",
-        path=PICCLDATAROOT + "/corpora/TXT/ENG/",
-        metadata=PlainTextFormat(None, encoding='utf-8'),
-        inputtemplate='textocr'
-    )]
-if os.path.exists(PICCLDATAROOT + "/corpora/FOLIA/DEU-FRAK"):
-    INPUTSOURCES += [InputSource(id='germandata', label="[German Fraktur] Demonstrator data: Bolzano Gold Standard post-OCR FoLiA xml",
-        path=PICCLDATAROOT + "/corpora/FOLIA/DEU-FRAK/",
-        metadata=FoLiAXMLFormat(None, encoding='utf-8'),
-        inputtemplate='foliaocr'
-    ),
-    InputSource(id='germanPDFbook', label="[German Fraktur] Demonstrator data: Bolzano Wissenschaftslehre PDF-images - full book",
-        path=PICCLDATAROOT + "/corpora/PDF/DEU-FRAK/BolzanoWLfull",
-        metadata=PDFFormat(None),
-        inputtemplate='pdfimages'
-    ),
-    InputSource(id='germanPDFdemo', label="[German Fraktur] Demonstrator data: Bolzano Wissenschaftslehre PDF-images - Vorrede only",
-        path=PICCLDATAROOT + "/corpora/PDF/DEU-FRAK/BolzanoWLdemo",
-        metadata=PDFFormat(None),
-        inputtemplate='pdfimages'
-    )]
-if os.path.exists(PICCLDATAROOT + "/corpora/PDF/FRA"):
-    INPUTSOURCES += [InputSource(id='frenchimagessmall', label="[French] Demonstrator data: Delpher dpo-7270 (PDF-images)",
-        path=PICCLDATAROOT + "/corpora/PDF/FRA/",
-        metadata=PDFFormat(None),
-        inputtemplate='pdfimages'
-    )]
-if os.path.exists(PICCLDATAROOT + "/corpora/OCR"):
-    INPUTSOURCES += [InputSource(id='dutchnew', label="[Dutch] TEST data: VUDNC Kalliopi Selection",
-        path=PICCLDATAROOT + "/corpora/OCR/VUDNCtest/",
-        metadata=FoLiAXMLFormat(None, encoding='utf-8'),
-        inputtemplate='foliaocr'
-    ),
-    InputSource(id='dutchold', label="[Dutch (historical)] TEST data: DPO35 Kalliopi Selection",
-        path=PICCLDATAROOT + "/corpora/OCR/DPO35test/",
-        metadata=FoLiAXMLFormat(None, encoding='utf-8'),
-        inputtemplate='foliaocr'
-    )]
-if os.path.exists(PICCLDATAROOT + "/corpora/OCR/DPO35tif"):
-    INPUTSOURCES += [InputSource(id='dpo35tif', label="[Dutch (historical)] Demonstrator/test data: DPO35 - Martinet book (full)",
-        path=PICCLDATAROOT + "/corpora/OCR/DPO35tif/",
-        metadata=TiffImageFormat(None),
-        inputtemplate='tif'
-    )]
-if os.path.exists(PICCLDATAROOT + "/data/int/nld"):
-    INPUTSOURCES += [InputSource(id='contempNLDlex', label="[Lexicon] Contemporary Dutch Lexicon (Aspell)",
-        path=PICCLDATAROOT + "/data/int/nld/nld.aspell.dict",
-        metadata=PlainTextFormat(None, encoding='utf-8',language='nld'),
-        inputtemplate='lexicon'
+#Demonstrator corpora and lexicons that are offered as input sources when they are present in PICCLDATAROOT:
+#(id, label, path relative to PICCLDATAROOT, format, format arguments, input template)
+DEMOSOURCES = [
+    ('dutchtif', "[Dutch] Demonstrator data: Martinet DPO_35 Scanned page images (tif format)", "corpora/TIFF/NLD/", TiffImageFormat, {}, 'tif'),
+    ('englishpdf', "[English] Demonstrator data: Geets paper (PDF format)", "corpora/PDF/ENG/", PDFFormat, {}, 'pdfimages'),
+    ('englishimageslarge', "[English] Demonstrator data: Russell -- Western Philosophy (DJVU format)", "corpora/DJVU/ENG/", DjVuFormat, {}, 'djvu'),
+    ('englishtxt', "[English] Demonstrator data: Russell -- Western Philosophy (Plain text format)", "corpora/TXT/ENG/", PlainTextFormat, {'encoding': 'utf-8'}, 'textocr'),
+    ('germandata', "[German Fraktur] Demonstrator data: Bolzano Gold Standard post-OCR FoLiA xml", "corpora/FOLIA/DEU-FRAK/", FoLiAXMLFormat, {'encoding': 'utf-8'}, 'foliaocr'),
+    ('germanPDFbook', "[German Fraktur] Demonstrator data: Bolzano Wissenschaftslehre PDF-images - full book", "corpora/PDF/DEU-FRAK/BolzanoWLfull", PDFFormat, {}, 'pdfimages'),
+    ('germanPDFdemo', "[German Fraktur] Demonstrator data: Bolzano Wissenschaftslehre PDF-images - Vorrede only", "corpora/PDF/DEU-FRAK/BolzanoWLdemo", PDFFormat, {}, 'pdfimages'),
+    ('frenchimagessmall', "[French] Demonstrator data: Delpher dpo-7270 (PDF-images)", "corpora/PDF/FRA/", PDFFormat, {}, 'pdfimages'),
+    ('dutchnew', "[Dutch] TEST data: VUDNC Kalliopi Selection", "corpora/OCR/VUDNCtest/", FoLiAXMLFormat, {'encoding': 'utf-8'}, 'foliaocr'),
+    ('dutchold', "[Dutch (historical)] TEST data: DPO35 Kalliopi Selection", "corpora/OCR/DPO35test/", FoLiAXMLFormat, {'encoding': 'utf-8'}, 'foliaocr'),
+    ('dpo35tif', "[Dutch (historical)] Demonstrator/test data: DPO35 - Martinet book (full)", "corpora/OCR/DPO35tif/", TiffImageFormat, {}, 'tif'),
+    ('contempNLDlex', "[Lexicon] Contemporary Dutch Lexicon (Aspell)", "data/int/nld/nld.aspell.dict", PlainTextFormat, {'encoding': 'utf-8', 'language': 'nld'}, 'lexicon'),
+    ('contempNLD2lex', "[Lexicon] Contemporary Dutch Lexicon (Compilation)", "data/int/nld/ARG4.SGDLEX.UTF8.TICCL.v.4.lst", PlainTextFormat, {'encoding': 'utf-8', 'language': 'nld'}, 'lexicon'),
+    ('histNLDlex', "[Lexicon] Historical and Contemporary Dutch Lexicon, with names", "data/int/nld/nuTICCL.OldandINLlexandINLNamesAspell.v2.COL1.tsv", PlainTextFormat, {'encoding': 'utf-8', 'language': 'nld'}, 'lexicon'),
+]
+
+def datarootindex(dataroot, paths):
+    """Returns which of the given paths (relative to the data root) exist. The result is cached in an index in ROOT, so
+    (re)starting workers need not check all paths again; the index is refreshed when the corpora/ or data/int/
+    directory of the data root changes (as it does when download-examples.nf or download-data.nf install into it)"""
+    signature = [dataroot, sorted(paths)] + [ os.path.getmtime(os.path.join(dataroot, d)) if os.path.exists(os.path.join(dataroot, d)) else None for d in ('corpora','data/int') ]
+    indexfile = os.path.join(ROOT, '.datarootindex.json')
+    try:
+        with open(indexfile,'r',encoding='utf-8') as f:
+            index = json.load(f)
+        if index['signature'] == signature:
+            return set(index['paths'])
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+    existing = [ path for path in paths if os.path.exists(os.path.join(dataroot, path)) ]
+    try:
+        with open(indexfile + "." + str(os.getpid()),'w',encoding='utf-8') as f:
+            json.dump({'signature': signature, 'paths': existing}, f)
+        os.rename(indexfile + "." + str(os.getpid()), indexfile) #atomic, workers may start concurrently
+    except (IOError, OSError):
+        pass #not writable, no index
+    return set(existing)
+
+DEMOPATHS = datarootindex(PICCLDATAROOT, [ path for _, _, path, _, _, _ in DEMOSOURCES ])
+INPUTSOURCES = [ InputSource(id=sourceid, label=label, path=os.path.join(PICCLDATAROOT, path), metadata=formatclass(None, **formatargs), inputtemplate=inputtemplate)
+                 for sourceid, label, path, formatclass, formatargs, inputtemplate in DEMOSOURCES if path in DEMOPATHS ]
+
+
+class FoLiAFLATViewer(FLATViewer):
+    """FLAT viewer for FoLiA output that may be stored compressed (see COMPRESSOUTPUT). CLAM uploads the document to
+    FLAT itself, not through the middleware in picclservice.wsgi, so it is decompressed here."""
+
+    def view(self, file, **kwargs): #pylint: disable=redefined-builtin
+        path = file.projectpath + file.basedir + '/' + file.filename if hasattr(file, 'projectpath') else None
+        if path and os.path.isfile(path) and outputstream.iscompressed(path):
+            with outputstream.DecompressedFile(path, file.filename) as decompressed:
+                return super(FoLiAFLATViewer, self).view(decompressed, **kwargs)
+        return super(FoLiAFLATViewer, self).view(file, **kwargs)
+
+#Viewers of FoLiA output, shared by all output templates
+FLATVIEWER = FoLiAFLATViewer(url=FLATURL, mode='viewer') if FLATURL else None
+AUTOSEARCHVIEWER = ForwardViewer(id='autosearchforwarder',name="Open in AutoSearch",forwarder=Forwarder('autosearch','AutoSearch',AUTOSEARCH_FORWARD_URL)) if AUTOSEARCH_FORWARD_URL else None
+SWITCHBOARDVIEWER = ForwardViewer(id='switchboardforwarder',name="Open in CLARIN Switchboard",forwarder=Forwarder('switchboard','CLARIN Switchboard',SWITCHBOARD_FORWARD_URL),allowdefault=False) if SWITCHBOARD_FORWARD_URL else None
+
+#Output templates that do not depend on the input, shared by all profiles
+RANKEDTEMPLATES = [
+    ParameterCondition(ticcl="yes", then=
+        #TICCL was enabled, so we obtain TICCL output:
+        OutputTemplate('ranked', PlainTextFormat, 'Ranked Variant Output (TICCL)',
+           SetMetaField('encoding','utf-8'),
+           filename='corpus.wordfreqlist.tsv.clean.ldcalc.ranked',
+           unique=True,
+        ),
     ),
-    InputSource(id='contempNLD2lex', label="[Lexicon] Contemporary Dutch Lexicon (Compilation)",
-        path=PICCLDATAROOT + "/data/int/nld/ARG4.SGDLEX.UTF8.TICCL.v.4.lst",
-        metadata=PlainTextFormat(None, encoding='utf-8',language='nld'),
-        inputtemplate='lexicon'
+    ParameterCondition(ticcl="yes", then=
+        OutputTemplate('rankedstore', BinaryDataFormat, 'Ranked Variant Output (TICCL), indexed for lookups with rankedstore.py',
+           filename='corpus.wordfreqlist.tsv.clean.ldcalc.ranked.rnk',
+           unique=True,
+        ),
     ),
-    InputSource(id='histNLDlex', label="[Lexicon] Historical and Contemporary Dutch Lexicon, with names",
-        path=PICCLDATAROOT + "/data/int/nld/nuTICCL.OldandINLlexandINLNamesAspell.v2.COL1.tsv",
-        metadata=PlainTextFormat(None, encoding='utf-8',language='nld'),
-        inputtemplate='lexicon'
-    )]
+]
 
+#Index of the output files of every input document (see collection.py)
+DOCUMENTINDEXTEMPLATE = OutputTemplate('documentindex', PlainTextFormat, 'Output files per input document (JSON)',
+   SetMetaField('encoding','utf-8'),
+   filename='documents.json',
+   unique=True,
+)
 
+OUTPUTTEMPLATES = {} #output templates by (ocrinput, inputextension), see generateoutputtemplates()
 
 def generateoutputtemplates(ocrinput=True,inputextension='.pdf'):
     """Because we reuse output template for a large number of profiles, we return them on the fly there so we don't have
-    unnecessary duplication"""
+    unnecessary duplication. The templates are built once for every combination of arguments and shared by all profiles
+    that use it."""
+    if (ocrinput, inputextension) in OUTPUTTEMPLATES:
+        return OUTPUTTEMPLATES[(ocrinput, inputextension)]
     outputtemplates = []
     if ocrinput:
         #do we have an OCR input stage? then we get OCR output
         outputtemplates += [OutputTemplate('ocrfolia', FoLiAXMLFormat, 'OCR Output (Tesseract)',
-            FLATViewer(url=FLATURL, mode='viewer') if FLATURL else None,
-            ForwardViewer(id='autosearchforwarder',name="Open in AutoSearch",forwarder=Forwarder('autosearch','AutoSearch',AUTOSEARCH_FORWARD_URL)) if AUTOSEARCH_FORWARD_URL else None,
-            ForwardViewer(id='switchboardforwarder',name="Open in CLARIN Switchboard",forwarder=Forwarder('switchboard','CLARIN Switchboard',SWITCHBOARD_FORWARD_URL),allowdefault=False) if SWITCHBOARD_FORWARD_URL else None,
+            FLATVIEWER,
+            AUTOSEARCHVIEWER,
+            SWITCHBOARDVIEWER,
             removeextension=inputextension,
             extension='ocr.folia.xml',
             multi=True,
         )]
-    outputtemplates += [
-         ParameterCondition(ticcl="yes", then=
-            #TICCL was enabled, so we obtain TICCL output:
-            OutputTemplate('ranked', PlainTextFormat, 'Ranked Variant Output (TICCL)',
-               SetMetaField('encoding','utf-8'),
-               filename='corpus.wordfreqlist.tsv.clean.ldcalc.ranked',
-               unique=True,
-            ),
-        ),
+    outputtemplates += RANKEDTEMPLATES + [
         ParameterCondition(ticcl="yes", then=
             OutputTemplate('ticclfolia', FoLiAXMLFormat, 'OCR post-correction output (TICCL)',
-                FLATViewer(url=FLATURL, mode='viewer') if FLATURL else None,
-                ForwardViewer(id='autosearchforwarder',name="Open in AutoSearch",forwarder=Forwarder('autosearch','AutoSearch',AUTOSEARCH_FORWARD_URL)) if AUTOSEARCH_FORWARD_URL else None,
-                ForwardViewer(id='switchboardforwarder',name="Open in CLARIN Switchboard",forwarder=Forwarder('switchboard','CLARIN Switchboard',SWITCHBOARD_FORWARD_URL),allowdefault=False) if SWITCHBOARD_FORWARD_URL else None,
+                FLATVIEWER,
+                AUTOSEARCHVIEWER,
+                SWITCHBOARDVIEWER,
                 removeextension=inputextension,
                 extension='ticcl.folia.xml',
                 multi=True,
@@ -249,9 +297,9 @@ def generateoutputtemplates(ocrinput=True,inputextension='.pdf'):
         ParameterCondition(frog="yes", then=
             #Frog was enabled, so we obtain Frog output:
             OutputTemplate('frogfolia', FoLiAXMLFormat, 'Linguistic enrichment output (Frog)',
-                FLATViewer(url=FLATURL, mode='viewer') if FLATURL else None,
-                ForwardViewer(id='autosearchforwarder',name="Open in AutoSearch",forwarder=Forwarder('autosearch','AutoSearch',AUTOSEARCH_FORWARD_URL)) if AUTOSEARCH_FORWARD_URL else None,
-                ForwardViewer(id='switchboardforwarder',name="Open in CLARIN Switchboard",forwarder=Forwarder('switchboard','CLARIN Switchboard',SWITCHBOARD_FORWARD_URL),allowdefault=False) if SWITCHBOARD_FORWARD_URL else None,
+                FLATVIEWER,
+                AUTOSEARCHVIEWER,
+                SWITCHBOARDVIEWER,
                 removeextension=inputextension,
                 extension='frogged.folia.xml',
                 multi=True,
@@ -259,14 +307,16 @@ def generateoutputtemplates(ocrinput=True,inputextension='.pdf'):
         ),
         ParameterCondition(ucto="yes", then=
             OutputTemplate('uctofolia', FoLiAXMLFormat, 'Tokeniser Output (ucto)',
-                FLATViewer(url=FLATURL, mode='viewer') if FLATURL else None,
-                ForwardViewer(id='switchboardforwarder',name="Open in CLARIN Switchboard",forwarder=Forwarder('switchboard','CLARIN Switchboard',SWITCHBOARD_FORWARD_URL),allowdefault=False) if SWITCHBOARD_FORWARD_URL else None,
+                FLATVIEWER,
+                SWITCHBOARDVIEWER,
                 removeextensions=[inputextension,"ticcl.folia.xml"],
                 extension='tok.folia.xml',
                 multi=True,
             ),
         )
     ]
+    outputtemplates.append(DOCUMENTINDEXTEMPLATE)
+    OUTPUTTEMPLATES[(ocrinput, inputextension)] = outputtemplates
     return outputtemplates
 
 try:
@@ -277,6 +327,13 @@ except NameError:
     pass
 
 
+#Custom lexicon input, shared by all profiles
+LEXICONTEMPLATE = InputTemplate('lexicon', PlainTextFormat, "Custom Lexicon",
+   StaticParameter(id='encoding',name='Encoding',description='The character encoding of the file', value='utf-8'),
+   filename='lexicon.lst',
+   optional=True,
+)
+
 PROFILES = [
 
     Profile(
@@ -284,11 +341,7 @@ PROFILES = [
            extension='tif',
            multi=True,
         ),
-        InputTemplate('lexicon', PlainTextFormat, "Custom Lexicon",
-           StaticParameter(id='encoding',name='Encoding',description='The character encoding of the file', value='utf-8'),
-           filename='lexicon.lst',
-           optional=True,
-        ),
+        LEXICONTEMPLATE,
         *generateoutputtemplates(ocrinput=True, inputextension='.tif'),
     ),
 
@@ -297,11 +350,16 @@ PROFILES = [
            extension='pdf',
            multi=True,
         ),
-        InputTemplate('lexicon', PlainTextFormat, "Custom Lexicon",
-           StaticParameter(id='encoding',name='Encoding',description='The character encoding of the file', value='utf-8'),
-           filename='lexicon.lst',
-           optional=True,
+        LEXICONTEMPLATE,
+        *generateoutputtemplates(ocrinput=True, inputextension='.pdf'), #this function is defined above to prevent unnecessary duplication
+    ),
+
+    Profile(
+        InputTemplate('pdfmixed', PDFFormat, 'PDF document with both scanned pages and pages with embedded text (perform OCR only where needed)',
+           extension='pdf',
+           multi=True,
         ),
+        LEXICONTEMPLATE,
         *generateoutputtemplates(ocrinput=True, inputextension='.pdf'), #this function is defined above to prevent unnecessary duplication
     ),
 
@@ -310,11 +368,7 @@ PROFILES = [
            extension='pdf',
            multi=True,
         ),
-        InputTemplate('lexicon', PlainTextFormat, "Custom Lexicon",
-           StaticParameter(id='encoding',name='Encoding',description='The character encoding of the file', value='utf-8'),
-           filename='lexicon.lst',
-           optional=True,
-        ),
+        LEXICONTEMPLATE,
         *generateoutputtemplates(ocrinput=False, inputextension='.pdf'), #this function is defined above to prevent unnecessary duplication
 
     ),
@@ -325,11 +379,7 @@ PROFILES = [
            extension='djvu',
            multi=True,
         ),
-        InputTemplate('lexicon', PlainTextFormat, "Custom Lexicon",
-           StaticParameter(id='encoding',name='Encoding',description='The character encoding of the file', value='utf-8'),
-           filename='lexicon.lst',
-           optional=True,
-        ),
+        LEXICONTEMPLATE,
         *generateoutputtemplates(ocrinput=True, inputextension='.djvu'), #this function is defined above to prevent unnecessary duplication
 
     ),
@@ -340,11 +390,7 @@ PROFILES = [
            extension='txt',
            multi=True,
         ),
-        InputTemplate('lexicon', PlainTextFormat, "Custom Lexicon",
-           StaticParameter(id='encoding',name='Encoding',description='The character encoding of the file', value='utf-8'),
-           filename='lexicon.lst',
-           optional=True,
-        ),
+        LEXICONTEMPLATE,
         *generateoutputtemplates(ocrinput=True, inputextension='.txt'), #this function is defined above to prevent unnecessary duplication
 
     ),
@@ -354,11 +400,7 @@ PROFILES = [
            extension='folia.xml',
            multi=True,
         ),
-        InputTemplate('lexicon', PlainTextFormat, "Custom Lexicon",
-           StaticParameter(id='encoding',name='Encoding',description='The character encoding of the file', value='utf-8'),
-           filename='lexicon.lst',
-           optional=True,
-        ),
+        LEXICONTEMPLATE,
         *generateoutputtemplates(ocrinput=False, inputextension='.folia.xml'), #this function is defined above to prevent unnecessary duplication
     ),
 
@@ -387,10 +429,44 @@ PROFILES = [
 #                        (set to "anonymous" if there is none)
 #     $PARAMETERS      - List of chosen parameters, using the specified flags
 #
+
+#Host-specific performance settings are passed on to the wrapper script through the environment
+WRAPPERENV = ""
+if TICCLCACHEDIR:
+    WRAPPERENV += "PICCL_TICCLCACHE=" + TICCLCACHEDIR + " PICCL_TICCLCACHESIZE=" + str(TICCLCACHESIZE) + " "
+if STATSDIR:
+    WRAPPERENV += "PICCL_STATSDIR=" + STATSDIR + " "
+if RESUMEDIR:
+    WRAPPERENV += "PICCL_RESUMEDIR=" + RESUMEDIR + " PICCL_RESUMESIZE=" + str(RESUMESIZE) + " "
+if SCRATCHDIR:
+    WRAPPERENV += "PICCL_SCRATCH=" + ("true" if SCRATCHDIR is True else SCRATCHDIR) + " "
+WRAPPERENV += "PICCL_PUBLISHMODE=" + PUBLISHMODE + " "
+if COMPRESSOUTPUT:
+    WRAPPERENV += "PICCL_COMPRESSOUTPUT=1 "
+if CORRECTBATCH:
+    WRAPPERENV += "PICCL_CORRECTBATCH=" + str(CORRECTBATCH) + " "
+if TICCLSHARDS > 1:
+    WRAPPERENV += "PICCL_SHARDS=" + str(TICCLSHARDS) + " "
+if FREQLISTCACHE:
+    WRAPPERENV += "PICCL_FREQLISTCACHE=" + FREQLISTCACHE + " "
+if OCRBATCH > 1:
+    WRAPPERENV += "PICCL_OCRBATCH=" + str(OCRBATCH) + " "
+if DATAMANIFEST:
+    WRAPPERENV += "PICCL_DATAMANIFEST=" + DATAMANIFEST + " "
+    if DATAMIRROR:
+        WRAPPERENV += "PICCL_DATAMIRROR=" + DATAMIRROR + " "
+    if DATAURL:
+        WRAPPERENV += "PICCL_DATAURL=" + DATAURL + " "
+
+WRAPPER = WEBSERVICEDIR + "/picclservice_wrapper.py"
+if WORKERPOOL:
+    #hand the job to the worker pool and wait for it
+    WRAPPER = "python3 " + WEBSERVICEDIR + "/workerpool.py submit " + WORKERPOOL + " -- " + WRAPPER
+
 if PICCLDIR:
-    COMMAND = WEBSERVICEDIR + "/picclservice_wrapper.py $DATAFILE $STATUSFILE $INPUTDIRECTORY $OUTPUTDIRECTORY " + PICCLDATAROOT + " " + PICCLDIR
+    COMMAND = WRAPPERENV + WRAPPER + " $DATAFILE $STATUSFILE $INPUTDIRECTORY $OUTPUTDIRECTORY " + PICCLDATAROOT + " " + PICCLDIR
 else:
-    COMMAND = WEBSERVICEDIR + "/picclservice_wrapper.py $DATAFILE $STATUSFILE $INPUTDIRECTORY $OUTPUTDIRECTORY " + PICCLDATAROOT
+    COMMAND = WRAPPERENV + WRAPPER + " $DATAFILE $STATUSFILE $INPUTDIRECTORY $OUTPUTDIRECTORY " + PICCLDATAROOT
 
 
 # ======== PARAMETER DEFINITIONS ===========
@@ -454,6 +530,27 @@ ACTIONS = [
     #Action(id='multiply',name='Multiply',parameters=[IntegerParameter(id='x',name='Value'),IntegerParameter(id='y',name='Multiplier'), function=lambda x,y: x*y ])
 ]
 
+if STATSDIR:
+    from picclservice import metrics
+    ACTIONS.append(Action(id='metrics', name='Metrics', description="Performance metrics of the tasks of all PICCL runs, per process and language, in the Prometheus text format", function=lambda: metrics.prometheus(metrics.MetricsStore(STATSDIR).records()), mimetype='text/plain'))
+
+if WORKERPOOL:
+    #a command rather than a function, as only commands are passed the requesting user: users see their own jobs only (administrators see all)
+    ACTIONS.append(Action(id='queue', name='Queue', description="Shows your jobs that are currently running in the worker pool, and your queued jobs with their position in the queue", command="PYTHONPATH=" + os.path.dirname(WEBSERVICEDIR) + " python3 -m picclservice.workerpool status --json --user $USERNAME", mimetype='application/json'))
+
+if CORRECTIONMODELDIR:
+    from picclservice import correction
+    ACTIONS.append(Action(id='correct', name='Correct', description="Corrects a single (small) document right away, against the TICCL lists of an earlier run that are kept loaded. Returns the corrected FoLiA document.",
+        function=lambda model, document, inputtype='folia', inputclass='current', outputclass='current': correction.correct(CORRECTIONMODELDIR, model, document, inputtype or 'folia', inputclass or 'current', outputclass or 'current'),
+        mimetype='text/xml',
+        parameters=[
+            StringParameter(id='model', name='Model', description="TICCL model to correct against, one of: " + ", ".join(correction.listmodels(CORRECTIONMODELDIR)), required=True),
+            TextParameter(id='document', name='Document', description="The document to correct (FoLiA XML or plain text)", required=True),
+            ChoiceParameter(id='inputtype', name='Input type', description="Format of the document", choices=[('folia','FoLiA XML'),('text','Plain text')], default='folia'),
+            StringParameter(id='inputclass', name='Input text class', description="Text class of the FoLiA document to correct", default='current'),
+            StringParameter(id='outputclass', name='Output text class', description="Text class for the corrected text", default='current'),
+        ]))
+
 
 # ======== DISPATCHING (ADVANCED! YOU CAN SAFELY SKIP THIS!) ========
 
@@ -19,11 +19,23 @@ import os
 import glob
 import shutil
 import locale
+import subprocess
 
 #import CLAM-specific modules. The CLAM API makes a lot of stuff easily accessible.
 import clam.common.data
 import clam.common.status
 
+#import PICCL-specific modules (these reside alongside this wrapper script)
+import cache
+import jobcost
+import progress
+import nftrace
+import metrics
+import rankedstore
+import piccldata
+import collection
+import outputstream
+
 #When the wrapper is started, the current working directory corresponds to the project directory, input files are in input/ , output files should go in output/ .
 
 #make a shortcut to the shellsafe() function
@@ -71,17 +83,22 @@ if clamdata.get('debug'):
     print("NXF_HOME: ", os.environ.get('NXF_HOME', "(none)"), file=sys.stderr)
     print("LM_PREFIX: ", os.environ.get('LM_PREFIX', "(none)"), file=sys.stderr)
 
-os.system("tesseract --version >&2")
+if not os.environ.get('PICCL_WARMWORKER'):
+    #(workers in the worker pool have done this already when they were started)
+    os.system("tesseract --version >&2")
 
 #You now have access to all data. A few properties at your disposition now are:
 # clamdata.system_id , clamdata.project, clamdata.user, clamdata.status , clamdata.parameters, clamdata.inputformats, clamdata.outputformats , clamdata.input , clamdata.output
 
 clam.common.status.write(statusfile, "Starting...")
 
+resumecache = None #set when the Nextflow work directory is kept per corpus (see below)
+
 def fail(prefix=None):
     if prefix:
         nextflowout(prefix)
-    if os.path.exists('work'):
+    #a work directory kept per corpus is left in place (and released when the run ends), so a re-submission or retry resumes where this run stopped
+    if resumecache is None and os.path.exists('work'):
         if 'debug' not in clamdata or not clamdata['debug']:
             shutil.rmtree('work')
     sys.exit(1)
@@ -99,6 +116,16 @@ def nextflowout(prefix):
     os.unlink(prefix+'.nextflow.out.log')
 
     if os.path.exists('trace.txt'):
+        if os.environ.get('PICCL_STATSDIR'):
+            #keep the performance metrics of all tasks
+            try:
+                metrics.MetricsStore(os.environ['PICCL_STATSDIR']).add(nftrace.readtrace('trace.txt'), {
+                    'project': clamdata.project,
+                    'lang': clamdata['lang'],
+                    'inputsize': sum(os.path.getsize(f) for f in glob.glob(os.path.join(inputdir,'*')) if os.path.isfile(f)),
+                })
+            except Exception as e:
+                print("Unable to store metrics: " + str(e), file=sys.stderr)
         print("[" + prefix + "] Nextflow trace summary",file=sys.stderr)
         print("-------------------------------------------------",file=sys.stderr)
         print(open('trace.txt','r',encoding='utf-8').read(), file=sys.stderr)
@@ -118,6 +145,17 @@ if clamdata.get('frog'):
     if lang != 'nld':
         print("Input document is not dutch (got + " + str(lang) + "), defiantly ignoring linguistic enrichment choice!",file=sys.stderr)
 
+if os.environ.get('PICCL_DATAMANIFEST'):
+    #install the data for this language on demand (nodes need only be provisioned with the languages they serve), verified against the manifest
+    try:
+        clam.common.status.write(statusfile, "Installing language data...")
+        piccldata.install(piccldata.loadmanifest(os.environ['PICCL_DATAMANIFEST']), os.path.join(piccldataroot,'data'), [lang], os.environ.get('PICCL_DATAMIRROR'), os.environ.get('PICCL_DATAURL'))
+    except Exception as e:
+        errmsg = "ERROR: Unable to install data files for language '" + lang + "': " + str(e)
+        clam.common.status.write(statusfile, errmsg,0) # status update
+        print(errmsg,file=sys.stderr)
+        sys.exit(4)
+
 datadir = os.path.join(piccldataroot,'data','int',lang)
 if not os.path.exists(datadir):
     errmsg = "ERROR: Unable to find data files for language '" + lang + "' in path " + piccldataroot
@@ -131,6 +169,7 @@ if not os.path.exists("lexicon.lst") and have_lexicon:
     os.symlink(inputdir+"/lexicon.lst", 'lexicon.lst')
 
 #loop over all data files and copy (symlink actually to save diskspace and time) to the current working directory (project dir)
+lexiconindex = None
 for f in glob.glob(datadir + '/*'):
     if f.split('.')[-1] == 'dict' and not have_lexicon:
         if os.path.exists('lexicon.lst'): os.unlink('lexicon.lst') #remove any existing
@@ -138,6 +177,9 @@ for f in glob.glob(datadir + '/*'):
             os.symlink(f, 'lexicon.lst')
         except Exception as e:
             print(str(e),file=sys.stderr)
+        if os.path.exists(f + '.anaidx'):
+            #pre-computed anagram hash index of the lexicon (compiled by download-data.nf), used directly rather than symlinked so it is shared between projects
+            lexiconindex = f + '.anaidx'
     if f.split('.')[-1] == 'chars':
         if os.path.exists('alphabet.lst'): os.unlink('alphabet.lst') #remove any existing
         try:
@@ -172,7 +214,7 @@ if not os.path.exists('confusion.lst'):
 inputtype = ''
 for inputfile in clamdata.input:
     inputtemplate = inputfile.metadata.inputtemplate
-    if inputtemplate in ('pdfimages', 'pdftext', 'tif','jpg','png','gif','foliaocr','textocr'):
+    if inputtemplate in ('pdfimages', 'pdfmixed', 'pdftext', 'tif','jpg','png','gif','foliaocr','textocr'):
         inputtype = inputtemplate
 
 if not inputtype:
@@ -181,96 +223,94 @@ if not inputtype:
     print(errmsg,file=sys.stderr)
     sys.exit(5)
 
+#All stages (OCR, TICCL, Frog/ucto) are run as a single combined workflow (piccl.nf), in one Nextflow session, so
+#documents flow from one stage into the next without waiting for the entire corpus to pass each stage
+ocr_outputdir = "ocr_output"
+ticcl_outputdir = 'ticcl_out'
+frog_outputdir = "frog_outputdir"
+tok_outputdir = "tok_outputdir"
+
 if inputtype == 'foliaocr':
-    #FoLiA input files provided directly, no need to run OCR pipeline
-    ticcl_inputdir = "."
-    ticcl_inputtype = "folia"
-    ocr_outputdir = inputdir
-    enrichment_inputtype = "folia" #for frog and ucto later on
+    #FoLiA input files provided directly, no need to run OCR
+    piccl_inputtype = "folia"
     ocr_enabled = False
 elif inputtype == 'textocr':
-    #Text input files provided directly, no need to run OCR pipeline
-    ticcl_inputdir = "."
-    ticcl_inputtype = "text"
-    ocr_outputdir = inputdir
-    enrichment_inputtype = "text" #for frog and ucto, may be overriden by ticcl
+    #Text input files provided directly, no need to run OCR
+    piccl_inputtype = "text"
     ocr_enabled = False
 elif inputtype == 'pdftext':
-    #PDF with text provided directly, no need to run OCR pipeline
-    ticcl_inputdir = "."
-    ticcl_inputtype = "pdf"
-    enrichment_inputtype = "folia" #for frog and ucto later on
-    ocr_outputdir = inputdir
+    #PDF with text provided directly, no need to run OCR
+    piccl_inputtype = "pdftext"
     ocr_enabled = False
 else:
     ocr_enabled = True
-    enrichment_inputtype = "folia" #for frog and ucto later on
-    #run the OCR pipeline prior to running TICCL
-    clam.common.status.write(statusfile, "Running OCR Pipeline",1) # status update
-
-    ocr_outputdir = "ocr_output"
-
-    cmd = run_piccl + "ocr.nf --inputdir " + shellsafe(inputdir,'"') + " --outputdir " + shellsafe(ocr_outputdir,'"') + " --inputtype " + shellsafe(inputtype,'"') + " --language " + shellsafe(clamdata['lang'],'"') +" -with-trace >ocr.nextflow.out.log 2>ocr.nextflow.err.log"
-    print("Command: " + cmd, file=sys.stderr)
-    if os.system(cmd) != 0: #use original clamdata['lang'] (may be deu_frak)
-        fail('ocr')
-
-
-    #Print Nextflow information to stderr so it ends up in the CLAM error.log and is available for inspection
-    nextflowout('ocr')
-
-    #make output files available
-    publish(ocr_outputdir)
-
-    ticcl_inputdir = ocr_outputdir
-    ticcl_inputtype = "folia"
+    piccl_inputtype = "pdf" if inputtype in ('pdfimages','pdfmixed') else inputtype
 
 pdfhandling = 'reassemble' if clamdata.get('reassemble') else 'single'
 
+piccl_opts = " --inputdir " + shellsafe(inputdir,'"') + " --inputtype " + piccl_inputtype + " --language " + shellsafe(clamdata['lang'],'"') + " --pdfhandling " + pdfhandling  #use original clamdata['lang'] (may be deu_frak)
+if ocr_enabled:
+    piccl_opts += " --ocroutputdir " + shellsafe(ocr_outputdir,'"')
+    if inputtype == 'pdfmixed':
+        piccl_opts += " --pdftriage" #only OCR pages without a text layer
+    ocrbatch = int(os.environ.get('PICCL_OCRBATCH',1))
+    if ocrbatch > 1:
+        piccl_opts += " --ocrbatch " + str(ocrbatch)
+elif inputtype == 'foliaocr' and 'inputtextclass' in clamdata and clamdata['inputtextclass']:
+    piccl_opts += " --inputclass " +  shellsafe(clamdata['inputtextclass'])
+
+ticclcache = None
+ticcl_cached = False
+if clamdata.get('ticcl') == 'yes':
+    #Is there a shared cache of TICCL intermediate results (configured in the service configuration)?
+    if os.environ.get('PICCL_TICCLCACHE'):
+        ticclcache = cache.DirectoryCache(os.environ['PICCL_TICCLCACHE'], int(os.environ.get('PICCL_TICCLCACHESIZE',0)))
+        #the key covers the input documents, the language data and all parameters that influence the ranked list
+        ticclcache_key = cache.contenthash(glob.glob(os.path.join(inputdir,'*')) + ['lexicon.lst','alphabet.lst','confusion.lst'], {
+            'inputtype': inputtype,
+            'lang': clamdata['lang'],
+            'inputclass': clamdata.get('inputtextclass') if inputtype == 'foliaocr' else "OCR",
+            'pdfhandling': pdfhandling,
+            'clip': clamdata['rank'],
+            'distance': clamdata['distance'],
+        })
+        cachedir = ticclcache.get(ticclcache_key)
+        if cachedir:
+            print("Reusing cached TICCL results from " + cachedir, file=sys.stderr)
+            if not os.path.exists(ticcl_outputdir): os.mkdir(ticcl_outputdir)
+            for filename in glob.glob(os.path.join(cachedir, '*')):
+                #hard links (or copies across filesystems) rather than symlinks, as the entry may be evicted while this job still runs
+                try:
+                    os.link(filename, os.path.join(ticcl_outputdir, os.path.basename(filename)))
+                except OSError:
+                    shutil.copyfile(filename, os.path.join(ticcl_outputdir, os.path.basename(filename)))
+            piccl_opts += " --rankedlist " + ticcl_outputdir + "/corpus.wordfreqlist.tsv.clean.ldcalc.ranked.chained.ranked --unk " + ticcl_outputdir + "/corpus.wordfreqlist.tsv.unk --punct " + ticcl_outputdir + "/corpus.wordfreqlist.tsv.punct"
+            ticclcache = None #nothing to store afterwards
+            ticcl_cached = True
+    piccl_opts += " --outputdir " + shellsafe(ticcl_outputdir,'"') + " --lexicon lexicon.lst --alphabet alphabet.lst --charconfus confusion.lst --clip " + shellsafe(clamdata['rank']) + " --distance " + shellsafe(clamdata['distance'])
+    if lexiconindex:
+        piccl_opts += " --lexiconindex " + shellsafe(lexiconindex,'"')
+    #large collections are corrected in batches rather than in a single FoLiA-correct task
+    batchsize = collection.correctbatch(len(collection.inputdocuments(inputdir)), int(os.environ.get('PICCL_CORRECTBATCH',0)))
+    if batchsize:
+        piccl_opts += " --correctbatch " + str(batchsize)
+    if int(os.environ.get('PICCL_SHARDS',1)) > 1:
+        piccl_opts += " --shards " + os.environ['PICCL_SHARDS']
+    if os.environ.get('PICCL_FREQLISTCACHE'):
+        #frequency lists are kept per document across jobs, so only documents that were not counted before are counted
+        piccl_opts += " --incremental --freqlistcache " + shellsafe(os.environ['PICCL_FREQLISTCACHE'],'"')
+    ticcl_enabled = True
+else:
+    print("TICCL skipped as requested...",file=sys.stderr)
+    piccl_opts += " --noticcl"
+    ticcl_enabled = False
+
 if clamdata.get('frog') == 'yes':
     print("Frog enabled (" + str(clamdata['frog']) + ")",file=sys.stderr)
     frog_enabled = True
 else:
     frog_enabled = False
 
-
-if clamdata.get('ticcl') == 'yes':
-    clam.common.status.write(statusfile, "Running TICCL Pipeline",50) # status update
-    ticcl_outputdir = 'ticcl_out'
-    ticcl_textclass_opts = ""
-    if ocr_enabled:
-        ticcl_textclass_opts = "--inputclass \"OCR\""
-    elif 'inputtextclass' in clamdata and clamdata['inputtextclass'] and clamdata['inputtextclass'] != "current":
-        ticcl_textclass_opts = "--inputclass " +  shellsafe(clamdata['inputtextclass'])
-    else:
-        ticcl_textclass_opts = "--inputclass \"current\""
-    cmd = run_piccl + "ticcl.nf --inputdir " + ticcl_inputdir + " " + ticcl_textclass_opts + " --inputtype " + ticcl_inputtype + " --outputdir " + shellsafe(ticcl_outputdir,'"') + " --lexicon lexicon.lst --alphabet alphabet.lst --charconfus confusion.lst --clip " + shellsafe(clamdata['rank']) + " --distance " + shellsafe(clamdata['distance']) + " --pdfhandling " + pdfhandling + " -with-trace >ticcl.nextflow.out.log 2>ticcl.nextflow.err.log"
-    print("Command: " + cmd, file=sys.stderr)
-    if os.system(cmd) != 0:
-        fail('ticcl')
-
-    #Print Nextflow information to stderr so it ends up in the CLAM error.log and is available for inspection
-    nextflowout('ticcl')
-
-    publish(ticcl_outputdir)
-
-    enrichment_inputdir = ticcl_outputdir
-    enrichment_inputtype = "folia"
-    textclass_opts = ""
-else:
-    print("TICCL skipped as requested...",file=sys.stderr)
-    textclass_opts = ""
-    if ocr_enabled:
-        enrichment_inputdir = ocr_outputdir
-        textclass_opts = "--inputclass \"OCR\" --outputclass \"current\"" #extra textclass opts for both frog and/or ucto
-    else:
-        assert ocr_outputdir == inputdir
-        enrichment_inputdir = ocr_outputdir
-        if 'inputtextclass' in clamdata and clamdata['inputtextclass'] and clamdata['inputtextclass'] != "current":
-            textclass_opts = "--inputclass " +  shellsafe(clamdata['inputtextclass']) + " --outputclass \"current\"" #extra textclass opts for both frog and/or ucto
-
-
-
 if frog_enabled and lang != "nld":
     print("Frog automatically *DISABLED* because input is not dutch", file=sys.stderr)
     frog_enabled = False
@@ -282,6 +322,7 @@ elif not frog_enabled and lang == "nld":
             break
 
 if frog_enabled:
+    #is Frog selected?
     skip = ""
     #PoS can't be skipped
     if not clamdata.get('lemma'):
@@ -294,57 +335,121 @@ if frog_enabled:
         skip += 'n'
     if not clamdata.get('chunker'):
         skip += 'c'
+    piccl_opts += " --frog --frogoutputdir " + shellsafe(frog_outputdir,'"')
     if skip:
-        skip = "--skip=" + skip
-
-
-#for frog and ucto, they may handle both folia and text as input, but we need to know which
-if enrichment_inputtype == "folia":
-    extension = "folia.xml"
-elif enrichment_inputtype == "text":
-    extension = "txt"
-else:
-    raise ValueError("Unexpected inputtype" + enrichment_inputtype)
-
-
-
-if frog_enabled:
-    #is Frog selected?
-    frog_outputdir = "frog_outputdir"
-    if not os.path.exists(frog_outputdir): os.mkdir(frog_outputdir)
-    print("Running Frog...",file=sys.stderr)
-    clam.common.status.write(statusfile, "Running Frog Pipeline (linguistic enrichment)",75) # status update
-    cmd = run_antilope + "frog.nf " + textclass_opts + " " + skip + " --inputdir " + shellsafe(enrichment_inputdir,'"') + " --inputformat " + enrichment_inputtype + " --extension " + extension + " --outputdir " + shellsafe(frog_outputdir,'"') + " -with-trace >frog.nextflow.out.log 2>frog.nextflow.err.log"
-    print("Command: " + cmd, file=sys.stderr)
-    if os.system(cmd) != 0:
-        fail('frog')
-    nextflowout('frog')
-    publish(frog_outputdir)
-
+        piccl_opts += " --frogskip " + skip
 elif clamdata.get('ucto') == 'yes':
     #fallback in case only tokenisation is enabled, no need for Frog but use ucto
-
-    tok_outputdir = "tok_outputdir"
-    if not os.path.exists(tok_outputdir): os.mkdir(tok_outputdir)
-    clam.common.status.write(statusfile, "Running Tokeniser (ucto)",75) # status update
-    cmd = run_antilope + "tokenize.nf " + textclass_opts + " --language " + shellsafe(lang,'"') + " --inputformat " + enrichment_inputtype + " --inputdir " + shellsafe(enrichment_inputdir,'"') + " --extension " + extension + " --outputdir " + shellsafe(tok_outputdir,'"') + " -with-trace >ucto.nextflow.out.log 2>ucto.nextflow.err.log"
+    piccl_opts += " --ucto --uctooutputdir " + shellsafe(tok_outputdir,'"')
+
+clam.common.status.write(statusfile, "Running PICCL Pipeline",1) # status update
+nextflow_opts = " -with-trace"
+if os.environ.get('PICCL_RESUMEDIR'):
+    #Keep the Nextflow work directory and task cache per corpus (identified by the contents of the input documents), so
+    #a re-submission of the same corpus, or a retry after a failure, reuses all tasks that completed before (-resume)
+    resumecache = cache.DirectoryCache(os.environ['PICCL_RESUMEDIR'], int(os.environ.get('PICCL_RESUMESIZE',0)))
+    resumekey = cache.contenthash(glob.glob(os.path.join(inputdir,'*')), {'lang': clamdata['lang']})
+    claimed = resumecache.claim(resumekey)
+    if claimed:
+        resumedir, resumelock = claimed
+        if not os.path.isdir(os.path.join(resumedir, '.nextflow')):
+            os.mkdir(os.path.join(resumedir, '.nextflow'))
+        if not os.path.exists('.nextflow'):
+            os.symlink(os.path.join(resumedir, '.nextflow'), '.nextflow') #the task cache of Nextflow resides in the launch directory
+        nextflow_opts += " -w " + shellsafe(os.path.join(resumedir, 'work'),'"')
+        if os.path.exists(os.path.join(resumedir, '.nextflow', 'history')):
+            print("Resuming from the work directory of an earlier run on this corpus (" + resumedir + ")", file=sys.stderr)
+            nextflow_opts += " -resume"
+        #tasks are identified by the contents of their input files rather than their paths, as the input documents of a re-submission reside in another project
+        os.environ['PICCL_DEEPCACHE'] = "1"
+    else:
+        print("The work directory of this corpus is in use by another job, not resuming", file=sys.stderr)
+        resumecache = None
+
+#The run proper, the work directory of the corpus (if claimed) is released however it ends (also on failure or errors),
+#so a re-submission or retry can resume from it
+try:
+    #Publish the output of the pipeline by hard links rather than copies where possible, intermediate TICCL output that
+    #is not offered to the user is not published at all (unless debugging)
+    publishmode = os.environ.get('PICCL_PUBLISHMODE','auto')
+    if publishmode == 'auto':
+        workdir = os.path.join(resumedir, 'work') if resumecache is not None else 'work'
+        publishmode = 'link' if os.stat(os.path.dirname(os.path.abspath(workdir))).st_dev == os.stat('.').st_dev else 'copy'
+    piccl_opts += " --publishmode " + publishmode
+    if ticcl_enabled and not clamdata.get('debug'):
+        piccl_opts += " --nointermediate"
+
+    cmd = run_piccl + "piccl.nf" + piccl_opts + nextflow_opts + " >piccl.nextflow.out.log 2>piccl.nextflow.err.log"
     print("Command: " + cmd, file=sys.stderr)
-    if os.system(cmd) != 0:
-        fail('ucto')
-    nextflowout('ucto')
-    publish(tok_outputdir)
+    #follow the trace of the pipeline while it runs, to report the progress and the estimated time remaining
+    tracker = progress.Progress('trace.txt', clamdata['lang'],
+        ocrpages=jobcost.estimate(inputdir)['ocrpages'] if ocr_enabled else 0,
+        ticcl=ticcl_enabled and not ticcl_cached,
+        freqlist=os.path.join(ticcl_outputdir, 'corpus.wordfreqlist.tsv'),
+        statsdir=os.environ.get('PICCL_STATSDIR'),
+        ocrbatch=ocrbatch if ocr_enabled else 1,
+        triage=inputtype == 'pdfmixed')
+    pipeline = subprocess.Popen(cmd, shell=True)
+    while True:
+        try:
+            pipeline.wait(timeout=10)
+            break
+        except subprocess.TimeoutExpired:
+            message, percentage = tracker.update()
+            clam.common.status.write(statusfile, message, percentage) # status update
+    if pipeline.returncode != 0:
+        fail('piccl')
+    try:
+        tracker.finish()
+    except Exception as e:
+        print("Unable to record throughput: " + str(e), file=sys.stderr)
 
-#PICCL produces concatenative output filenames (e.g  $documentbase.ocr.ticcl.frogged.folia.xml)
-#this goes beyond CLAM's ability to predict so we rename everything to retain only the last three extension elements (*.$system.folia.xml)
-for filename in glob.glob(os.path.join(outputdir,"*.folia.xml")):
-    basename = os.path.basename(filename)
-    newbasename = ".".join([ field for field in basename.split('.')[:-3] if field not in ('ticcl','ocr','tok','frogged','folia','txt') ]) + "." + ".".join(basename.split('.')[-3:])
-    if newbasename != basename:
-        os.rename(filename, os.path.join(outputdir, newbasename))
+    #Print Nextflow information to stderr so it ends up in the CLAM error.log and is available for inspection
+    nextflowout('piccl')
 
+    if ticclcache is not None:
+        #store the intermediate TICCL results (everything except the documents) so later submissions of the same corpus can reuse them
+        try:
+            ticclcache.put(ticclcache_key, glob.glob(os.path.join(ticcl_outputdir, 'corpus.wordfreqlist.tsv*')))
+        except Exception as e:
+            print("Unable to store TICCL results in cache: " + str(e), file=sys.stderr)
+
+    #make output files available
+    for d, enabled in ((ocr_outputdir, ocr_enabled), (ticcl_outputdir, ticcl_enabled), (frog_outputdir, frog_enabled), (tok_outputdir, not frog_enabled and clamdata.get('ucto') == 'yes')):
+        if enabled:
+            publish(d)
+
+    if ticcl_enabled and os.path.exists(os.path.join(ticcl_outputdir, 'corpus.wordfreqlist.tsv.clean.ldcalc.ranked')):
+        #an indexed store of the ranked list, so individual words can be looked up without parsing the whole list
+        try:
+            rankedstore.build(os.path.join(ticcl_outputdir, 'corpus.wordfreqlist.tsv.clean.ldcalc.ranked'), os.path.join(outputdir, 'corpus.wordfreqlist.tsv.clean.ldcalc.ranked.rnk'))
+        except Exception as e:
+            print("Unable to build ranked list store: " + str(e), file=sys.stderr)
+
+    #PICCL produces concatenative output filenames (e.g  $documentbase.ocr.ticcl.frogged.folia.xml)
+    #this goes beyond CLAM's ability to predict so we rename everything to retain only the last three extension elements (*.$system.folia.xml)
+    for filename in glob.glob(os.path.join(outputdir,"*.folia.xml")):
+        basename = os.path.basename(filename)
+        newbasename = ".".join([ field for field in basename.split('.')[:-3] if field not in ('ticcl','ocr','tok','frogged','folia','txt') ]) + "." + ".".join(basename.split('.')[-3:])
+        if newbasename != basename:
+            os.rename(filename, os.path.join(outputdir, newbasename))
+
+    if os.environ.get('PICCL_COMPRESSOUTPUT'):
+        #store the FoLiA output compressed (the symlinked originals are removed), it is decompressed when served if needed
+        clam.common.status.write(statusfile, "Compressing output",99) # status update
+        saved = outputstream.compressoutput(outputdir, threads=int(os.environ.get('PICCL_MAXCPUS',0)) or 4)
+        print("Compressing the output saved " + str(saved // (1024*1024)) + " MB", file=sys.stderr)
+
+    #an index of the output files of every input document, so the output of a collection can be retrieved per document
+    missing = collection.writeindex(inputdir, outputdir)
+    if missing:
+        print("No output for " + str(missing) + " input document(s), see " + collection.DOCUMENTINDEX, file=sys.stderr)
+finally:
+    if resumecache is not None:
+        resumecache.release(resumekey, resumelock)
 
 #cleanup
-if not clamdata.get('debug'):
+if resumecache is None and not clamdata.get('debug') and os.path.exists('work'):
     shutil.rmtree('work')
 
 #A nice status message to indicate we're done
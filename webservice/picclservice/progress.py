@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#Progress reporting for PICCL runs: follows the Nextflow trace file while the pipeline runs, counts the finished tasks
+#of each stage against the expected totals and estimates the remaining time from the throughput of earlier jobs in the
+#same language. The throughput of every finished job is recorded (when a statistics directory is configured), both as
+#a history of individual jobs (throughput.jsonl) and as a running average per language (throughput.json), which also
+#serves capacity planning and makes regressions in throughput visible.
+
+#If we run on Python 2.7, behave as much as Python 3 as possible
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import os
+import io
+import time
+import glob
+import fcntl
+import json
+
+if __package__:
+    from . import nftrace
+else:
+    import nftrace #imported by the wrapper (or run as a script) from the webservice directory
+
+OCRPROCESSES = ('tesseract','tesseractbatch','foliaassemble')
+
+#The TICCL steps in order, with the processes that conclude each of them (in regular and sharded runs)
+TICCLSTAGES = (
+    ('frequency', ('corpusfrequency','mergefrequency')),
+    ('unk', ('ticclunk',)),
+    ('anahash', ('anahash',)),
+    ('indexer', ('indexer','mergeindex')),
+    ('resolver', ('resolver','mergeldcalc')),
+    ('rank', ('rank',)),
+    ('chainer', ('chainer',)),
+    ('correct', ('foliacorrect',)),
+)
+#the processes of the TICCL steps that follow the frequency list (which overlaps with OCR)
+TICCLPROCESSES = ('ticclunk','anahash','indexer','indexershard','mergeindex','splitindex','resolver','resolvershard','mergeldcalc','rank','chainer','chainclean','foliacorrect')
+
+HISTORYWEIGHT = 0.3 #weight of the most recent job in the running averages
+
+
+def formatduration(seconds):
+    """Formats a duration for humans"""
+    if seconds < 60:
+        return "<1 min"
+    elif seconds < 3600:
+        return str(int(round(seconds / 60))) + " min"
+    else:
+        return str(int(seconds // 3600)) + "h" + str(int(round((seconds % 3600) / 60))).zfill(2)
+
+def countlines(filename):
+    """Counts the lines in a file, returns None if it does not exist (yet)"""
+    if not os.path.exists(filename):
+        return None
+    with io.open(filename,'rb') as f:
+        return sum(1 for _ in f)
+
+
+class Throughput(object):
+    """Throughput history per language, kept in a statistics directory"""
+
+    def __init__(self, statsdir):
+        self.statsdir = statsdir
+        self.averages = {}
+        if statsdir:
+            if not os.path.isdir(statsdir):
+                os.makedirs(statsdir)
+            self.averages = self.load()
+
+    def load(self):
+        """Reads the running averages from the statistics directory"""
+        averagesfile = os.path.join(self.statsdir,'throughput.json')
+        if os.path.exists(averagesfile):
+            try:
+                with io.open(averagesfile,'r',encoding='utf-8') as f:
+                    return json.load(f)
+            except ValueError:
+                pass
+        return {}
+
+    def get(self, lang, key):
+        """Returns the average of a throughput measure for a language (None if there is no history)"""
+        return self.averages.get(lang,{}).get(key)
+
+    def add(self, record):
+        """Adds the throughput of a finished job to the history and the running averages"""
+        if not self.statsdir:
+            return
+        with io.open(os.path.join(self.statsdir,'throughput.jsonl'),'a',encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+        #jobs finish concurrently: the averages are re-read and rewritten under a lock, so no job overwrites the update of another
+        with io.open(os.path.join(self.statsdir,'.throughput.lock'),'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.averages = self.load()
+            averages = self.averages.setdefault(record['lang'],{'jobs': 0})
+            for key in ('ocrpagespersec','typespersec','typesperpage'):
+                if record.get(key):
+                    averages[key] = record[key] if key not in averages else (1-HISTORYWEIGHT) * averages[key] + HISTORYWEIGHT * record[key]
+            averages['jobs'] += 1
+            tmpfile = os.path.join(self.statsdir,'.throughput.json.' + str(os.getpid()))
+            with io.open(tmpfile,'w',encoding='utf-8') as f:
+                f.write(json.dumps(self.averages, indent=4))
+            os.rename(tmpfile, os.path.join(self.statsdir,'throughput.json'))
+
+
+class Progress(object):
+    """Tracks the progress of a single PICCL run"""
+
+    def __init__(self, tracefile, lang, ocrpages=0, ticcl=False, freqlist=None, statsdir=None, ocrbatch=1, triage=False):
+        self.tracefile = tracefile
+        self.lang = lang
+        self.ocrpages = ocrpages #expected number of pages to OCR (0 if there is no OCR)
+        self.ocrbatch = ocrbatch #pages per OCR task (--ocrbatch)
+        self.triage = triage #pages with a text layer are not OCRed (--pdftriage)
+        self.textpages = {} #work directory of a finished pdftextlayer task => number of pages it took from the text layer
+        self.ticcl = ticcl
+        self.freqlist = freqlist #corpus frequency list, its size (number of types) determines the duration of TICCL
+        self.throughput = Throughput(statsdir)
+        self.started = time.time()
+        self.records = []
+
+    def types(self):
+        """Returns the number of word types in the corpus, or an estimate if the frequency list is not available yet"""
+        types = countlines(self.freqlist) if self.freqlist else None
+        if types is None and self.ocrpages and self.throughput.get(self.lang,'typesperpage'):
+            types = self.ocrpages * self.throughput.get(self.lang,'typesperpage')
+        return types
+
+    def textpagesdone(self):
+        """Returns the number of pages taken from the text layer so far (--pdftriage), counted from the text files in the
+        work directories of the finished pdftextlayer tasks"""
+        if not self.triage:
+            return 0
+        for record in nftrace.finished(self.records):
+            if record.get('process') == 'pdftextlayer' and record.get('workdir') and record['workdir'] not in self.textpages:
+                self.textpages[record['workdir']] = len(glob.glob(os.path.join(record['workdir'],'*.txt')))
+        return sum(self.textpages.values())
+
+    def ocrpagesexpected(self):
+        """Returns the number of pages to OCR: all pages of the input, less those taken from the text layer so far"""
+        return max(0, self.ocrpages - self.textpagesdone())
+
+    def ocrpagesdone(self):
+        """Returns the number of pages OCRed so far"""
+        return min(self.ocrpagesexpected(), nftrace.count(self.records, 'tesseract') + nftrace.count(self.records, 'tesseractbatch') * self.ocrbatch)
+
+    def stages(self):
+        """Returns a list of (name, done, total, fraction, estimated duration) tuples for all stages of this run"""
+        stages = []
+        if self.ocrpages:
+            expected = self.ocrpagesexpected()
+            done = self.ocrpagesdone()
+            rate = self.throughput.get(self.lang,'ocrpagespersec')
+            stages.append( ("OCR", done, expected, min(1.0, done / expected) if expected else 1.0, expected / rate if rate else None) )
+        if self.ticcl:
+            done = sum(1 for _, processes in TICCLSTAGES if any(nftrace.count(self.records, process) for process in processes))
+            types = self.types()
+            rate = self.throughput.get(self.lang,'typespersec')
+            stages.append( ("TICCL", done, len(TICCLSTAGES), done / len(TICCLSTAGES), types / rate if rate and types else None) )
+        return stages
+
+    def update(self):
+        """Reads the trace file and returns a (message, percentage) tuple for a CLAM status update"""
+        self.records = nftrace.readtrace(self.tracefile)
+        stages = self.stages()
+        if not stages:
+            return "Running PICCL Pipeline", 1
+        if all(duration is not None for _, _, _, _, duration in stages):
+            #weigh the stages by their expected duration
+            total = sum(duration for _, _, _, _, duration in stages)
+            completed = sum(fraction * duration for _, _, _, fraction, duration in stages)
+            remaining = total - completed
+        else:
+            total = len(stages)
+            completed = sum(fraction for _, _, _, fraction, _ in stages)
+            remaining = None
+        percentage = 1 + int(98 * completed / total) if total else 1
+        message = "Running PICCL Pipeline: " + ", ".join( name + " " + str(done) + "/" + str(expected) + (" pages" if name == "OCR" else " steps") for name, done, expected, _, _ in stages )
+        if remaining is not None:
+            message += " (estimated time remaining: " + formatduration(remaining) + ")"
+        return message, percentage
+
+    def finish(self):
+        """Records the throughput of this (successful) run in the history"""
+        self.records = nftrace.readtrace(self.tracefile)
+        record = {'lang': self.lang, 'time': time.time(), 'duration': round(time.time() - self.started, 1)}
+        if self.ocrpages:
+            pages = self.ocrpagesdone()
+            ocrtime = nftrace.span(self.records, OCRPROCESSES)
+            record['ocrpages'] = pages
+            if pages and ocrtime:
+                record['ocrpagespersec'] = pages / ocrtime
+        if self.ticcl and self.freqlist:
+            types = countlines(self.freqlist)
+            ticcltime = nftrace.span(self.records, TICCLPROCESSES)
+            record['types'] = types
+            if types and ticcltime:
+                record['typespersec'] = types / ticcltime
+            if types and record.get('ocrpages'):
+                record['typesperpage'] = types / record['ocrpages']
+        self.throughput.add(record)
+        return record
+
+
+def main():
+    """Prints the throughput history per language, to plan capacity and spot regressions"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Shows the throughput of earlier PICCL jobs per language", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('statsdir', help="Statistics directory (STATSDIR in the service configuration)")
+    parser.add_argument('-n', type=int, help="Number of most recent jobs to show per language", action='store', default=10)
+    args = parser.parse_args()
+    history = {}
+    historyfile = os.path.join(args.statsdir,'throughput.jsonl')
+    if os.path.exists(historyfile):
+        with io.open(historyfile,'r',encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                history.setdefault(record['lang'],[]).append(record)
+    throughput = Throughput(args.statsdir)
+    for lang in sorted(history):
+        print(lang + " (" + str(len(history[lang])) + " jobs, average OCR pages/s: " + str(throughput.get(lang,'ocrpagespersec')) + ", TICCL types/s: " + str(throughput.get(lang,'typespersec')) + ")")
+        for record in history[lang][-args.n:]:
+            print("\t" + time.strftime('%Y-%m-%d %H:%M', time.localtime(record['time'])) + "\tduration=" + str(record['duration']) + "s\tocrpages/s=" + str(record.get('ocrpagespersec','-')) + "\ttypes/s=" + str(record.get('typespersec','-')))
+
+if __name__ == '__main__':
+    main()
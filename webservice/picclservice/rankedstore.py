@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#Compact, indexed store of a TICCL ranked variant list (*.ranked, *.chained.ranked), so individual words can be looked
+#up without parsing the whole list. The store is a single binary file that is memory-mapped on use: opening it costs
+#next to nothing regardless of its size, and concurrent readers share it through the page cache.
+#
+#A ranked list has lines of the form variant#variantfrequency#candidate#candidatefrequency#distance#score, with the
+#candidates of a variant in ranked order. In the store, all candidates of a variant form a single record, and records
+#are found through a hash table (FNV-1a, open addressing with linear probing).
+#
+#Store format (all integers little-endian):
+#   magic (8 bytes) | version (uint32) | reserved (uint32) | number of variants N (uint64) | number of hash slots M (uint64)
+#   M hash slots (uint64): record number + 1, or 0 for an empty slot
+#   N+1 record offsets (uint64, relative to the start of the data section)
+#   data section: N records "variant\0" followed by a line "candidate\tvariantfrequency\tcandidatefrequency\tdistance\tscore\n"
+#   per candidate, sorted on the variant (byte order), candidates in ranked order
+
+#If we run on Python 2.7, behave as much as Python 3 as possible
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import os
+import io
+import sys
+import mmap
+import struct
+import array
+import argparse
+import subprocess
+import tempfile
+
+MAGIC = b"PICCLRNK"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQ")
+SLOT = struct.Struct("<Q")
+SEPARATOR = b"#"
+
+FNVOFFSET = 0xcbf29ce484222325
+FNVPRIME = 0x100000001b3
+MASK64 = 0xffffffffffffffff
+
+
+def fnv1a(data):
+    """64-bit FNV-1a hash of a byte string"""
+    h = FNVOFFSET
+    for byte in bytearray(data):
+        h = ((h ^ byte) * FNVPRIME) & MASK64
+    return h
+
+def parserankedline(line):
+    """Parses a line of a ranked list (bytes), returns (variant, (candidate, variantfrequency, candidatefrequency, distance, score)) or None"""
+    fields = line.rstrip(b"\r\n").split(SEPARATOR)
+    if len(fields) < 6 or not fields[0]:
+        return None
+    return fields[0], (fields[2], fields[1], fields[3], fields[4], fields[5])
+
+def tonumber(value):
+    """Converts a field to a number where possible (scores may also be non-numeric markers)"""
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+def sortedranked(filename):
+    """Yields the lines of a ranked list sorted on the variant (byte order), keeping the ranked order of the candidates, by invoking sort(1)"""
+    env = dict(os.environ, LC_ALL='C')
+    sortprocess = subprocess.Popen(['sort','-s','-t','#','-k1,1',filename], stdout=subprocess.PIPE, env=env)
+    for line in sortprocess.stdout:
+        yield line
+    if sortprocess.wait() != 0:
+        raise Exception("sort failed")
+
+def groupedranked(filename):
+    """Yields (variant, [candidate tuples]) for a ranked list, sorted on the variant"""
+    variant = None
+    candidates = []
+    for line in sortedranked(filename):
+        parsed = parserankedline(line)
+        if parsed is None:
+            continue
+        if parsed[0] != variant:
+            if variant is not None:
+                yield variant, candidates
+            variant = parsed[0]
+            candidates = []
+        candidates.append(parsed[1])
+    if variant is not None:
+        yield variant, candidates
+
+
+def build(rankedfile, storefile):
+    """Builds a store from a ranked list, returns the number of variants"""
+    offsets = array.array(str('Q'), [0])
+    hashes = array.array(str('Q'))
+    #the data section is written to a temporary file first, as the size of the hash table and offsets is not known in advance
+    tmpdata = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(storefile)))
+    try:
+        position = 0
+        for variant, candidates in groupedranked(rankedfile):
+            record = variant + b"\0" + b"".join( b"\t".join(candidate) + b"\n" for candidate in candidates )
+            tmpdata.write(record)
+            position += len(record)
+            offsets.append(position)
+            hashes.append(fnv1a(variant))
+        size = len(hashes)
+        slots = 1
+        while slots < size * 2: #load factor of at most 0.5
+            slots *= 2
+        table = array.array(str('Q'), [0]) * slots
+        for i, h in enumerate(hashes):
+            slot = h & (slots - 1)
+            while table[slot]:
+                slot = (slot + 1) & (slots - 1)
+            table[slot] = i + 1
+        if sys.byteorder != 'little':
+            table.byteswap()
+            offsets.byteswap()
+        tmpfile = storefile + ".tmp"
+        with io.open(tmpfile,'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, size, slots))
+            f.write(table.tobytes() if hasattr(table,'tobytes') else table.tostring())
+            f.write(offsets.tobytes() if hasattr(offsets,'tobytes') else offsets.tostring())
+            tmpdata.seek(0)
+            for block in iter(lambda: tmpdata.read(1024*1024), b""):
+                f.write(block)
+        os.rename(tmpfile, storefile)
+    finally:
+        tmpdata.close()
+    return size
+
+
+class RankedStore(object):
+    """Read-only, memory-mapped store of a ranked variant list"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = io.open(filename,'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.size, self.slots = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(filename + " is not a ranked list store (or of an unsupported version)")
+        self.tableoffset = HEADER.size
+        self.offsetsoffset = self.tableoffset + self.slots * SLOT.size
+        self.dataoffset = self.offsetsoffset + (self.size + 1) * SLOT.size
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def record(self, i):
+        """Returns the raw record with the given number: (variant, candidate data), as bytes"""
+        begin = self.dataoffset + SLOT.unpack_from(self.data, self.offsetsoffset + i * SLOT.size)[0]
+        end = self.dataoffset + SLOT.unpack_from(self.data, self.offsetsoffset + (i+1) * SLOT.size)[0]
+        separator = self.data.find(b"\0", begin, end)
+        return self.data[begin:separator], self.data[separator+1:end]
+
+    def find(self, variant):
+        """Returns the record number of a variant (bytes), or None if it is not in the store"""
+        if not self.slots:
+            return None
+        slot = fnv1a(variant) & (self.slots - 1)
+        while True:
+            i = SLOT.unpack_from(self.data, self.tableoffset + slot * SLOT.size)[0]
+            if not i:
+                return None
+            begin = self.dataoffset + SLOT.unpack_from(self.data, self.offsetsoffset + (i-1) * SLOT.size)[0]
+            if self.data[begin:begin+len(variant)+1] == variant + b"\0":
+                return i - 1
+            slot = (slot + 1) & (self.slots - 1)
+
+    @staticmethod
+    def candidates(data):
+        """Parses the candidate data of a record into (candidate, score, distance, candidatefrequency) tuples"""
+        result = []
+        for line in data.split(b"\n"):
+            if line:
+                candidate, _, candidatefrequency, distance, score = line.split(b"\t")
+                result.append( (candidate.decode('utf-8'), tonumber(score.decode('utf-8')), tonumber(distance.decode('utf-8')), tonumber(candidatefrequency.decode('utf-8'))) )
+        return result
+
+    def details(self, variant):
+        """Returns all candidates for a variant, as (candidate, score, distance, candidatefrequency) tuples in ranked order"""
+        i = self.find(variant.encode('utf-8'))
+        if i is None:
+            return []
+        return self.candidates(self.record(i)[1])
+
+    def lookup(self, variant):
+        """Returns the candidates for a variant, as (candidate, score) tuples in ranked order (empty if the variant is unknown)"""
+        return [ (candidate, score) for candidate, score, _, _ in self.details(variant) ]
+
+    def __contains__(self, variant):
+        return self.find(variant.encode('utf-8')) is not None
+
+    def __iter__(self):
+        """Iterates over all variants (sorted), yielding (variant, [(candidate, score)]) tuples"""
+        for i in range(self.size):
+            variant, data = self.record(i)
+            yield variant.decode('utf-8'), [ (candidate, score) for candidate, score, _, _ in self.candidates(data) ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Converts TICCL ranked variant lists into an indexed binary store and queries it", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    buildparser = subparsers.add_parser('build', help="Build a store from a ranked list")
+    buildparser.add_argument('rankedlist', help="Ranked list (*.ranked)")
+    buildparser.add_argument('-o','--output', type=str, help="Output file (defaults to the ranked list with extension .rnk)", action='store')
+    lookupparser = subparsers.add_parser('lookup', help="Look up the candidates of variants")
+    lookupparser.add_argument('store', help="Store file")
+    lookupparser.add_argument('variants', nargs='+', help="Variants to look up")
+    dumpparser = subparsers.add_parser('dump', help="Output the store as a ranked list (variant#candidate#score)")
+    dumpparser.add_argument('store', help="Store file")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        output = args.output if args.output else args.rankedlist + ".rnk"
+        size = build(args.rankedlist, output)
+        print("Stored " + str(size) + " variants in " + output, file=sys.stderr)
+    elif args.command == 'lookup':
+        with RankedStore(args.store) as store:
+            for variant in args.variants:
+                if not isinstance(variant, type("")):
+                    variant = variant.decode('utf-8') #Python 2
+                for candidate, score in store.lookup(variant):
+                    print(variant + "\t" + candidate + "\t" + str(score))
+    elif args.command == 'dump':
+        with RankedStore(args.store) as store:
+            for variant, candidates in store:
+                for candidate, score in candidates:
+                    print(variant + "#" + candidate + "#" + str(score))
+    else:
+        parser.print_help()
+        sys.exit(2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+#Pool of pre-initialised workers for the PICCL webservice (optional, see WORKERPOOL in picclservice.py)
+#
+#Rather than CLAM starting the wrapper script from scratch for every job, CLAM starts a light-weight client (submit)
+#that places the job in a spool directory and waits for it. A fixed number of workers (serve), that have already
+#imported CLAM, queried the tools and loaded the language data in memory, pick up the jobs and run the wrapper in a
+#forked process. The number of workers bounds the number of concurrently running jobs, and workers only pick up a new
+#job if there is at least REQUIREMEMORY free memory, so the host is not oversubscribed when many users submit at once.
+#
+#Jobs are not run in order of submission but according to a weighted fair policy (see priority()), based on a cost
+#estimate from their input (see jobcost.py), and the cores each job may use are capped (PICCL_MAXCPUS, which
+#nextflow.config honours) so concurrent jobs do not all claim every core of the machine.
+#
+#Spool directory layout:
+#   queue/$jobid.json    - submitted jobs, waiting for a worker
+#   running/$jobid.json  - jobs claimed by a worker
+#   pool.json            - settings of the running pool (for status reports)
+#   done/$jobid.json     - exit codes of finished jobs, removed by the client
+#   cancel/$jobid        - cancellation requests (when CLAM aborts a job)
+#   log/$jobid.log       - standard output and error of the job, relayed by the client
+
+#If we run on Python 2.7, behave as much as Python 3 as possible
+from __future__ import print_function, unicode_literals, division, absolute_import
+
+import sys
+import os
+import time
+import json
+import glob
+import signal
+import argparse
+import subprocess
+import runpy
+import uuid
+import math
+
+if __package__:
+    from . import jobcost
+else:
+    import jobcost #run as a script (submit, as the CLAM command), from the webservice directory
+
+POLLINTERVAL = 0.5 #seconds
+
+SPOOLDIRS = ('queue','running','done','cancel','log')
+
+
+def makespool(spooldir):
+    """Creates the spool directory layout if it does not exist yet"""
+    for d in SPOOLDIRS:
+        path = os.path.join(spooldir, d)
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path): #may have been created concurrently
+                    raise
+
+def writejson(filename, data):
+    """Writes a JSON file atomically (readers never see a partial file)"""
+    tmpfile = os.path.join(os.path.dirname(filename), "." + os.path.basename(filename) + ".tmp")
+    with open(tmpfile,'w') as f:
+        json.dump(data, f)
+    os.rename(tmpfile, filename)
+
+def readjson(filename):
+    with open(filename,'r') as f:
+        return json.load(f)
+
+def meminfo():
+    """Returns a dictionary of /proc/meminfo values (in MB), empty if unavailable"""
+    info = {}
+    try:
+        with open('/proc/meminfo','r') as f:
+            for line in f:
+                key, value = line.split(':',1)
+                info[key] = int(value.split()[0]) // 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return info
+
+def availablememory():
+    """Returns the available memory in MB (free memory plus cache, without swap, as CLAM computes it), or None if unknown"""
+    info = meminfo()
+    if 'MemAvailable' in info:
+        return info['MemAvailable']
+    elif 'MemFree' in info:
+        return info['MemFree'] + info.get('Cached',0)
+    return None
+
+
+#======================================= CLIENT ==================================================
+
+def submit(spooldir, command):
+    """Submits a job to the pool and waits for it to finish, relaying its output to stderr. Returns the exit code of the job."""
+    makespool(spooldir)
+    jobid = "%.6f-%s" % (time.time(), uuid.uuid4().hex) #sorts in order of submission
+    job = {
+        'id': jobid,
+        'command': command,
+        'cwd': os.getcwd(),
+        'env': dict(os.environ),
+        'submitted': time.time(),
+        'user': 'anonymous',
+        'cost': 1,
+    }
+    if len(command) >= 4:
+        #the wrapper's arguments: $DATAFILE $STATUSFILE $INPUTDIRECTORY ...
+        job.update(jobcost.estimate(command[3], command[1]))
+
+    def cancel(signum, frame):
+        #CLAM aborts the job by killing us, pass it on to the worker
+        try:
+            os.unlink(os.path.join(spooldir,'queue',jobid + '.json')) #not picked up yet
+        except OSError:
+            open(os.path.join(spooldir,'cancel',jobid),'w').close()
+        sys.exit(1)
+    signal.signal(signal.SIGTERM, cancel)
+    signal.signal(signal.SIGINT, cancel)
+
+    writejson(os.path.join(spooldir,'queue',jobid + '.json'), job)
+
+    logfile = os.path.join(spooldir,'log',jobid + '.log')
+    donefile = os.path.join(spooldir,'done',jobid + '.json')
+    log = None
+    while True:
+        finished = os.path.exists(donefile) #check before reading the log, so no output is missed
+        if log is None and os.path.exists(logfile):
+            log = open(logfile,'rb')
+        if log is not None:
+            relay(log)
+        if finished:
+            break
+        time.sleep(POLLINTERVAL)
+    if log is not None:
+        log.close()
+        os.unlink(logfile)
+    exitcode = readjson(donefile)['exitcode']
+    os.unlink(donefile)
+    return exitcode
+
+def relay(log):
+    """Copies all new output of the job to stderr"""
+    while True:
+        data = log.read(65536)
+        if not data:
+            break
+        if hasattr(sys.stderr, 'buffer'):
+            sys.stderr.buffer.write(data)
+        else:
+            sys.stderr.write(data)
+    sys.stderr.flush()
+
+
+#======================================= WORKERS ==================================================
+
+def warmup(piccldataroot):
+    """Initialisation shared by all workers (which are forked afterwards): everything the wrapper would otherwise do for every job"""
+    #the modules the wrapper imports
+    import clam.common.data #pylint: disable=unused-import
+    import clam.common.status #pylint: disable=unused-import
+    import locale
+    locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+    print("Tesseract: ", file=sys.stderr)
+    subprocess.call("tesseract --version >&2", shell=True)
+    #have nextflow set itself up (downloads, dependency resolution), so the first job does not pay for it
+    print("Nextflow: ", file=sys.stderr)
+    subprocess.call("nextflow -version >&2", shell=True)
+    if piccldataroot:
+        #read the language data once, so it resides in the page cache (shared by all jobs) rather than on disk
+        for pattern in ('*.dict','*.anaidx','*.chars','*.confusion'):
+            for filename in glob.glob(os.path.join(piccldataroot,'data','int','*',pattern)):
+                with open(filename,'rb') as f:
+                    while f.read(1024*1024):
+                        pass
+    os.environ['PICCL_WARMWORKER'] = "1" #tells the wrapper these checks have been done already
+
+def readjobs(spooldir, state):
+    """Returns all jobs in the given state (queue or running), in order of submission"""
+    jobs = []
+    for filename in sorted(os.listdir(os.path.join(spooldir,state))):
+        if not filename.endswith('.json') or filename.startswith('.'):
+            continue
+        try:
+            jobs.append(readjson(os.path.join(spooldir,state,filename)))
+        except (IOError, OSError, ValueError):
+            continue #claimed or cancelled in the meantime, or still being written
+    return jobs
+
+def runningcosts(running):
+    """Returns the total cost of the running jobs per user"""
+    costs = {}
+    for job in running:
+        costs[job.get('user')] = costs.get(job.get('user'),0) + job.get('cost',1)
+    return costs
+
+def priority(job, runningcost, now, policy):
+    """Weighted fair priority of a queued job, lower goes first. Small jobs go ahead of large ones, users with a lot of work
+    running already yield to those without, and jobs gain priority while they wait, so large jobs do not starve"""
+    user = job.get('user')
+    weight = policy.get('weights',{}).get(user,1)
+    return (job.get('cost',1) + runningcost.get(user,0)) / weight - policy.get('aging',0) * (now - job['submitted']) / 60
+
+def schedule(spooldir, policy):
+    """Returns the queued jobs in the order they should be run"""
+    runningcost = runningcosts(readjobs(spooldir,'running'))
+    now = time.time()
+    return sorted(readjobs(spooldir,'queue'), key=lambda job: priority(job, runningcost, now, policy))
+
+def claim(spooldir, policy):
+    """Claims the job that should run next, returns the job or None if the queue is empty"""
+    for job in schedule(spooldir, policy):
+        runningfile = os.path.join(spooldir,'running',job['id'] + '.json')
+        try:
+            os.rename(os.path.join(spooldir,'queue',job['id'] + '.json'), runningfile) #atomic, only one worker wins
+        except OSError:
+            continue
+        return job
+    return None
+
+def jobcpus(job, policy):
+    """Returns the number of cores a job may use: no more than needed for the number of pages, and no more than the cap"""
+    pages = job.get('ocrpages',0) + job.get('textpages',0)
+    return max(1, min(policy['maxcpus'], int(math.ceil(pages)) if pages else policy['maxcpus']))
+
+def execute(spooldir, job):
+    """Runs a job in a forked process, returns its exit code (None if the job was cancelled)"""
+    pid = os.fork()
+    if pid == 0:
+        #child process: set up the environment CLAM would have given the wrapper
+        exitcode = 1
+        try:
+            os.setsid() #own process group, so cancellation also reaches nextflow and the tools
+            os.chdir(job['cwd'])
+            os.environ.clear()
+            os.environ.update(job['env'])
+            os.environ['PICCL_WARMWORKER'] = "1"
+            logfd = os.open(os.path.join(spooldir,'log',job['id'] + '.log'), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.dup2(logfd, 1)
+            os.dup2(logfd, 2)
+            os.close(logfd)
+            command = job['command']
+            if command[0].endswith('.py'):
+                #Python scripts (such as the wrapper) run in this already initialised interpreter
+                sys.argv = list(command)
+                sys.path.insert(0, os.path.dirname(os.path.abspath(command[0])))
+                try:
+                    runpy.run_path(command[0], run_name='__main__')
+                    exitcode = 0
+                except SystemExit as e:
+                    if e.code is None:
+                        exitcode = 0
+                    elif isinstance(e.code, int):
+                        exitcode = e.code
+                    else:
+                        print(e.code, file=sys.stderr)
+                        exitcode = 1
+            else:
+                os.execvp(command[0], command)
+        except Exception as e: #pylint: disable=broad-except
+            print("Worker failed to run job: " + str(e), file=sys.stderr)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exitcode)
+
+    cancelfile = os.path.join(spooldir,'cancel',job['id'])
+    cancelled = False
+    while True:
+        finishedpid, status = os.waitpid(pid, os.WNOHANG)
+        if finishedpid == pid:
+            break
+        if os.path.exists(cancelfile):
+            print("Cancelling job " + job['id'], file=sys.stderr)
+            try:
+                os.killpg(pid, signal.SIGTERM)
+            except OSError:
+                pass
+            os.unlink(cancelfile)
+            cancelled = True
+        time.sleep(POLLINTERVAL)
+    if cancelled:
+        return None
+    if os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+    return 128 + os.WTERMSIG(status)
+
+def worker(spooldir, requirememory, policy):
+    """Main loop of a worker: runs one job at a time"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    while True:
+        if requirememory:
+            memory = availablememory()
+            if memory is not None and memory < requirememory:
+                time.sleep(POLLINTERVAL)
+                continue
+        job = claim(spooldir, policy)
+        if job is None:
+            time.sleep(POLLINTERVAL)
+            continue
+        job['started'] = time.time()
+        job['cpus'] = jobcpus(job, policy)
+        job['env']['PICCL_MAXCPUS'] = str(job['cpus'])
+        writejson(os.path.join(spooldir,'running',job['id'] + '.json'), job)
+        print("Starting job " + job['id'] + " in " + job['cwd'] + " (estimated cost " + str(round(job.get('cost',1),1)) + ", " + str(job['cpus']) + " cores)", file=sys.stderr)
+        exitcode = execute(spooldir, job)
+        if exitcode is None:
+            #nobody is waiting for the result anymore
+            print("Cancelled job " + job['id'], file=sys.stderr)
+            os.unlink(os.path.join(spooldir,'log',job['id'] + '.log'))
+        else:
+            print("Finished job " + job['id'] + " (exit code " + str(exitcode) + ")", file=sys.stderr)
+            writejson(os.path.join(spooldir,'done',job['id'] + '.json'), {'exitcode': exitcode, 'finished': time.time()})
+        os.unlink(os.path.join(spooldir,'running',job['id'] + '.json'))
+
+def cpucount():
+    return os.sysconf('SC_NPROCESSORS_ONLN') if hasattr(os,'sysconf') else 1
+
+def defaultworkers(requirememory):
+    """Derives the number of workers from the total memory and the memory each job requires, bounded by the number of CPUs"""
+    cpus = cpucount()
+    total = meminfo().get('MemTotal')
+    if not requirememory or not total:
+        return cpus
+    return max(1, min(cpus, total // requirememory))
+
+def serve(spooldir, workers, requirememory, piccldataroot, maxcpus=0, aging=0, weights=None):
+    """Starts the pool and keeps it running"""
+    makespool(spooldir)
+    #jobs that were running when a previous pool stopped are started again
+    for filename in glob.glob(os.path.join(spooldir,'running','*.json')):
+        print("Requeueing interrupted job " + os.path.basename(filename), file=sys.stderr)
+        os.rename(filename, os.path.join(spooldir,'queue',os.path.basename(filename)))
+    warmup(piccldataroot)
+    if not workers:
+        workers = defaultworkers(requirememory)
+    policy = {
+        'maxcpus': maxcpus if maxcpus else max(1, cpucount() // workers), #by default, the cores are divided evenly over the workers
+        'aging': aging,
+        'weights': weights if weights else {},
+    }
+    writejson(os.path.join(spooldir,'pool.json'), {'workers': workers, 'cpus': cpucount(), 'maxcpus': policy['maxcpus'], 'requirememory': requirememory, 'started': time.time(), 'pid': os.getpid()})
+    print("Starting " + str(workers) + " workers on " + spooldir + " (at most " + str(policy['maxcpus']) + " cores per job)", file=sys.stderr)
+    pids = set()
+
+    def stop(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while True:
+        while len(pids) < workers:
+            pid = os.fork()
+            if pid == 0:
+                worker(spooldir, requirememory, policy)
+                os._exit(0)
+            pids.add(pid)
+        pid, _ = os.wait() #a worker only ends if something went wrong, replace it
+        if pid in pids:
+            print("Worker " + str(pid) + " died, restarting", file=sys.stderr)
+            pids.discard(pid)
+
+
+#======================================= STATUS ==================================================
+
+def status(spooldir, policy=None, user=None):
+    """Returns the live state of the pool: its settings, the running jobs and the queued jobs in the order they will run.
+    If a user is given, only the jobs of that user are listed (their positions still count the jobs of all users)."""
+    poolfile = os.path.join(spooldir,'pool.json')
+    state = {
+        'pool': readjson(poolfile) if os.path.exists(poolfile) else None,
+        'running': [],
+        'queued': [],
+    }
+    if not os.path.isdir(os.path.join(spooldir,'queue')):
+        return state
+    now = time.time()
+    fields = ('id','user','project','lang','ocrpages','textpages','size','cost')
+    for job in readjobs(spooldir,'running'):
+        if user is not None and job.get('user') != user:
+            continue
+        entry = dict( (key, job.get(key)) for key in fields )
+        entry['cpus'] = job.get('cpus')
+        entry['running'] = round(now - job['started']) if 'started' in job else None
+        state['running'].append(entry)
+    for position, job in enumerate(schedule(spooldir, policy if policy else {})):
+        if user is not None and job.get('user') != user:
+            continue
+        entry = dict( (key, job.get(key)) for key in fields )
+        entry['position'] = position + 1
+        entry['waiting'] = round(now - job['submitted'])
+        state['queued'].append(entry)
+    return state
+
+def printstatus(state):
+    """Prints the state of the pool in a human readable form"""
+    if state['pool']:
+        print("Pool: " + str(state['pool']['workers']) + " workers, at most " + str(state['pool']['maxcpus']) + " cores per job")
+    else:
+        print("Pool: not running")
+    print("Running: " + str(len(state['running'])))
+    for job in state['running']:
+        print("\t".join(( job['id'], str(job['user']), "cost=" + str(round(job['cost'] or 0,1)), "cores=" + str(job['cpus']), "running=" + str(job['running']) + "s")))
+    print("Queued: " + str(len(state['queued'])))
+    for job in state['queued']:
+        print("\t".join(( str(job['position']), job['id'], str(job['user']), "cost=" + str(round(job['cost'] or 0,1)), "waiting=" + str(job['waiting']) + "s")))
+
+
+def loadsettings():
+    """Returns the service configuration. This requires the pool to be run as a module of the picclservice package
+    (python3 -m picclservice.workerpool): run as a script, the directory of this script would shadow the package."""
+    if not __package__:
+        print("ERROR: The service configuration is only available when run as python3 -m picclservice.workerpool", file=sys.stderr)
+        sys.exit(2)
+    from . import picclservice as settings
+    return settings
+
+def main():
+    parser = argparse.ArgumentParser(description="Pool of pre-initialised workers for the PICCL webservice", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers(dest='mode')
+    serveparser = subparsers.add_parser('serve', help="Run the worker pool (settings default to those of the service configuration)")
+    serveparser.add_argument('--spooldir', type=str, help="Spool directory (default: WORKERPOOL)", action='store')
+    serveparser.add_argument('--workers', type=int, help="Number of workers (default: WORKERS, derived from memory if 0)", action='store')
+    submitparser = subparsers.add_parser('submit', help="Submit a job to the pool and wait for it (used as the CLAM command)")
+    submitparser.add_argument('spooldir', help="Spool directory")
+    submitparser.add_argument('command', nargs=argparse.REMAINDER, help="Command to run (the wrapper script and its arguments)")
+    statusparser = subparsers.add_parser('status', help="Show the running and queued jobs")
+    statusparser.add_argument('--spooldir', type=str, help="Spool directory (default: WORKERPOOL)", action='store')
+    statusparser.add_argument('--json', help="Output JSON", action='store_true')
+    statusparser.add_argument('--user', type=str, help="Only list the jobs of this user (all jobs if it is one of the ADMINS of the service configuration)", action='store')
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        settings = loadsettings()
+        spooldir = args.spooldir if args.spooldir else settings.WORKERPOOL
+        if not spooldir:
+            print("ERROR: No spool directory, set WORKERPOOL in the service configuration or pass --spooldir", file=sys.stderr)
+            sys.exit(2)
+        serve(spooldir, args.workers if args.workers is not None else settings.WORKERS, settings.REQUIREMEMORY, settings.PICCLDATAROOT, settings.MAXCPUSPERJOB, settings.SCHEDULERAGING, settings.USERWEIGHTS)
+    elif args.mode == 'submit':
+        command = args.command[1:] if args.command and args.command[0] == '--' else args.command
+        if not command:
+            print("ERROR: No command to submit", file=sys.stderr)
+            sys.exit(2)
+        sys.exit(submit(args.spooldir, command))
+    elif args.mode == 'status':
+        user = args.user
+        if args.spooldir:
+            spooldir, policy = args.spooldir, {}
+        else:
+            settings = loadsettings()
+            spooldir, policy = settings.WORKERPOOL, {'aging': settings.SCHEDULERAGING, 'weights': settings.USERWEIGHTS}
+            if user is not None and settings.ADMINS and user in settings.ADMINS:
+                user = None
+        state = status(spooldir, policy, user)
+        if args.json:
+            print(json.dumps(state, indent=4))
+        else:
+            printstatus(state)
+    else:
+        parser.print_help()
+        sys.exit(2)
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,11 @@ if [ ! -z $LM_PREFIX ]; then
     exit 2
 fi
 export PICCLSERVICEDIR=`python -c 'import picclservice; print(picclservice.__path__[0])'`
+WORKERPOOL=`python -c 'from picclservice import picclservice; print(picclservice.WORKERPOOL or "")'`
+if [ ! -z "$WORKERPOOL" ]; then
+    #start the pool of pre-initialised workers that will run the jobs
+    python3 -m picclservice.workerpool serve >> picclservice.workerpool.log 2>&1 &
+fi
 if [ ! -z $VIRTUAL_ENV ]; then
     uwsgi --plugin python3 --virtualenv $VIRTUAL_ENV --socket 127.0.0.1:8888 --chdir $VIRTUAL_ENV --wsgi-file $PICCLSERVICEDIR/picclservice.wsgi --logto picclservice.uwsgi.log --log-date --log-5xx --master --processes 2 --threads 2 --need-app
 else